@@ -5,56 +5,238 @@ import os
 from utils.io import *
 from utils.risk_calculation import *
 from utils.analysis import *
+from utils.portfolio import Portfolio, rating_codes
+from utils.streaming import run_streaming_analysis
+from utils.incremental import analyze_portfolio_incremental
+from utils.instrumentation import RunReport
+from utils.scenarios import load_scenarios, run_scenarios
+from utils.models import load_models, compare_models
+from utils.service import run_scoring_service, SERVICE_PORT
 
 NUM_YEARS = 10
+SAMPLER_COMPARISON_PROJECTS = 1000
+CACHE_DIR = '.cache'
 
 logging.basicConfig(level=logging.INFO, filename='project.log')
 
-def main(display_output=True, input_file='GHG_Data.xlsx'):
+def main(display_output=True, input_file='GHG_Data.xlsx', engine='vectorized', memory_budget_mb=None, workers=1, seed=None, validate=False, fast_export=False, output_format='xlsx', cache=True,
+         table_file='GHG_Data.xlsx', chunk_size=100000, incremental=False,
+         tolerance=ADAPTIVE_TOLERANCE, sampler='random', sampler_comparison=False,
+         precision='float64', profile=False, scenario_file=None, model_file=None, serve=False, port=SERVICE_PORT, group_top_bottom=0):
     """
     Main function to run the project risk analysis.
 
     Parameters:
     display_output (bool, optional): Whether to display the output in the console. Defaults to True.
     input_file (str, optional): The input file to load the data from. Defaults to 'GHG_Data.xlsx'.
+    engine (str, optional): The simulation engine to use, one of SIMULATION_ENGINES. Defaults to 'vectorized'.
+    memory_budget_mb (float, optional): The memory budget per simulation block in megabytes. Defaults to None.
+    workers (int, optional): The number of simulation worker processes. Defaults to 1.
+    seed (int, optional): The random seed for reproducible simulations. Defaults to None.
+    validate (bool, optional): Whether to only report the largest analytic vs Monte Carlo discrepancy. Defaults to False.
+    fast_export (bool, optional): Whether to export the simulation data with the streaming Excel writer. Defaults to False.
+    output_format (str, optional): The output format, one of OUTPUT_FORMATS. Defaults to 'xlsx'.
+    cache (bool, optional): Whether to reuse the processed input data cached in CACHE_DIR while the input file is unchanged. Defaults to True.
+    table_file (str, optional): The Excel file with the model tables for CSV, TSV and Parquet input files. Defaults to 'GHG_Data.xlsx'.
+    chunk_size (int, optional): The number of projects per chunk for CSV, TSV and Parquet input files. Defaults to 100000.
+    incremental (bool, optional): Whether to only recalculate the projects whose inputs changed since the last incremental run. Defaults to False.
+    tolerance (float, optional): The target standard error of the expected value percentage for the adaptive engine. Defaults to ADAPTIVE_TOLERANCE.
+    sampler (str, optional): The sampler for the vectorized, crn and memoized engines, one of SAMPLERS. Defaults to 'random'.
+    sampler_comparison (bool, optional): Whether to only compare the samplers on a generated portfolio. Defaults to False.
+    precision (str, optional): The precision of the draws for the vectorized and memoized engines, one of SIMULATION_PRECISIONS. Defaults to 'float64'.
+    profile (bool, optional): Whether to save cProfile stats of the scoring, simulation, output table and export stages. Defaults to False.
+    scenario_file (str, optional): A file of stress scenarios (see load_scenarios) to evaluate instead of running the analysis. Defaults to None.
+    model_file (str, optional): A file of candidate model weights (see load_models) to compare instead of running the analysis. Defaults to None.
+    serve (bool, optional): Whether to run a local scoring service with the model tables of the table file instead of running the analysis. Defaults to False.
+    port (int, optional): The port of the scoring service. Defaults to SERVICE_PORT.
+    group_top_bottom (int, optional): The number of top and bottom projects of each country and technology to add to the exports, or 0 for none. Defaults to 0.
 
     Returns:
     None
+
+    Notes:
+    The wall time, CPU time, RSS and result shape of each stage are logged and saved to run_report.json in the output folder.
     """
+    report = RunReport(settings={'input_file': input_file, 'engine': engine, 'memory_budget_mb': memory_budget_mb, 'workers': workers, 'seed': seed,
+                                 'output_format': output_format, 'incremental': incremental, 'sampler': sampler, 'precision': precision},
+                       profile=profile)
     try:
-        risk_bucket_count, risk_factor_count, df_project, df_default_rates, df_recovery_potential, df_model = load_and_process_data(input_file)
+        # Keep the model tables loaded and score project rows sent over HTTP until interrupted, instead of running the analysis
+        if serve:
+            run_scoring_service(table_file, port=port, engine=engine, num_years=NUM_YEARS, memory_budget_mb=memory_budget_mb, seed=seed,
+                                tolerance=tolerance, sampler=sampler, precision=precision)
+            return
 
-        if valid_project_data(df_project, risk_bucket_count, risk_factor_count) and check_df_format(df_default_rates, df_recovery_potential) and valid_model(df_model, risk_bucket_count, risk_factor_count):        
-            # Calculate Risk Bucket Risk Scores and Ratings for each risk bucket 
-            df_project = calculate_risk_bucket_scores(df_project,risk_bucket_count,risk_factor_count) 
-            for i in range(1, risk_bucket_count + 1):
-                df_project[f'risk_bucket_{i}_rating'] = score_to_rating_vectorized(df_project[f'risk_bucket_{i}_score'])
-    
-            # Prepare for the simulation
-            df_project = calculate_yearly_shortfall(df_project, df_default_rates, df_recovery_potential, risk_bucket_count)
-            df_project = calculate_yearly_expected_value(df_project, risk_bucket_count)
-            df_project = calculate_yearly_standard_deviation(df_project,risk_bucket_count)
+        # Compare the error of each sampler on a generated portfolio instead of running the analysis
+        if sampler_comparison:
+            # Imported here, since the script configures logging when it is imported
+            from scripts.generate_project_risk_data import generate_data
+            df_default_rates, df_recovery_potential, _ = load_model_tables(table_file)
+            if not check_df_format(df_default_rates, df_recovery_potential):
+                return
+            portfolio = prepare_portfolio(generate_data(SAMPLER_COMPARISON_PROJECTS, 5, 5), 5, 5, df_default_rates, df_recovery_potential, NUM_YEARS)
+            df_comparison = compare_samplers(portfolio, seed=seed)
+            display_sampler_comparison(df_comparison)
+            logging.info(f"Sampler comparison:\n{df_comparison.to_string(index=False)}")
+            return
+
+        # Stream CSV, TSV and Parquet project data in chunks, with the model tables from the table file
+        if os.path.splitext(input_file)[1].lower() in STREAMING_EXTENSIONS:
+            if validate or scenario_file is not None or model_file is not None or group_top_bottom > 0:
+                print("The --validate, --scenarios, --models and --group-top-bottom options need an Excel input file")
+                return
+            output_folder = create_output_folder()
+            project_output_file = os.path.join(output_folder, 'project_data.parquet') if output_format in ['parquet', 'both'] else None
+            with report.stage('streaming_analysis', profile=True):
+                output_tables = run_streaming_analysis(input_file, table_file, chunk_size, engine, memory_budget_mb, workers, seed, project_output_file, NUM_YEARS,
+                                                       tolerance=tolerance, sampler=sampler, precision=precision)
+            if output_tables is None:
+                print(f"Data not loaded properly from {input_file}")
+                return
+            df_counts, top_projects, bottom_projects, country_table, technology_table, counterparty_table, total_volumes_per_year = output_tables
+
+            # Display and Export Data, the project data is only exported as Parquet
+            if display_output:
+                with report.stage('display'):
+                    display_project_risk_output(df_counts, top_projects, bottom_projects, country_table, technology_table, counterparty_table, total_volumes_per_year)
+            if output_format in ['xlsx', 'both']:
+                with report.stage('export_project_risk_output', profile=True):
+                    export_project_risk_output(output_folder, top_projects, bottom_projects, country_table, technology_table, counterparty_table, df_counts, total_volumes_per_year)
+            if output_format in ['parquet', 'both']:
+                with report.stage('export_parquet_output', profile=True):
+                    export_parquet_output(output_folder, None, top_projects, bottom_projects, country_table, technology_table, counterparty_table, df_counts, total_volumes_per_year)
+            report.save(output_folder)
+            return
+
+        with report.stage('load') as stage:
+            risk_bucket_count, risk_factor_count, df_project, df_default_rates, df_recovery_potential, df_model = load_and_process_data(input_file, cache_dir=CACHE_DIR if cache else None)
+            stage.set_shape(df_project)
+
+        with report.stage('validation'):
+            valid = valid_project_data(df_project, risk_bucket_count, risk_factor_count) and check_df_format(df_default_rates, df_recovery_potential) and valid_model(df_model, risk_bucket_count, risk_factor_count)
+
+        if valid:
+            # Compare the analytic standard deviation with the Monte Carlo simulation instead of running the analysis
+            if validate:
+                portfolio = prepare_portfolio(df_project, risk_bucket_count, risk_factor_count, df_default_rates, df_recovery_potential, NUM_YEARS)
+                df_project = portfolio.to_dataframe()
+                discrepancy = compare_simulation_engines(df_project, risk_bucket_count, seed=seed)
+                absolute_project = df_project['project_id'].iloc[discrepancy['max_absolute_difference_row']]
+                relative_project = df_project['project_id'].iloc[discrepancy['max_relative_difference_row']]
+                message = (f"Largest analytic vs Monte Carlo discrepancy: {discrepancy['max_absolute_difference']:.2f} "
+                           f"(project {absolute_project}, year {discrepancy['max_absolute_difference_year']}), "
+                           f"{discrepancy['max_relative_difference']:.2%} relative "
+                           f"(project {relative_project}, year {discrepancy['max_relative_difference_year']})")
+                print(message)
+                logging.info(message)
+                return
+
+            # Score and rate the projects under every candidate model in one pass instead of running the analysis
+            if model_file is not None:
+                model_names, model_weights = load_models(model_file, risk_bucket_count, risk_factor_count)
+                with report.stage('bucket_scoring', profile=True) as stage:
+                    portfolio = score_portfolio(Portfolio.from_dataframe(df_project, risk_bucket_count, risk_factor_count, NUM_YEARS))
+                    stage.set_shape(portfolio.ratings)
+                with report.stage('model_comparison', profile=True) as stage:
+                    df_comparison, df_ratings = compare_models(portfolio, model_names, model_weights, df_default_rates, df_recovery_potential)
+                    stage.set_shape(df_ratings)
+                if display_output:
+                    with report.stage('display'):
+                        display_model_comparison(df_comparison)
+                output_folder = create_output_folder()
+                with report.stage('export_model_comparison', profile=True):
+                    export_model_comparison(output_folder, df_comparison, df_ratings, output_format)
+                report.save(output_folder)
+                return
+
+            # Score the projects once and evaluate every stress scenario in one batched pass instead of running the analysis
+            if scenario_file is not None:
+                scenarios = load_scenarios(scenario_file, df_default_rates, df_recovery_potential)
+                for name, (df_scenario_default_rates, df_scenario_recovery_potential) in scenarios.items():
+                    if not check_df_format(df_scenario_default_rates, df_scenario_recovery_potential):
+                        print(f"Scenario {name} not loaded properly from {scenario_file}")
+                        return
+                with report.stage('bucket_scoring', profile=True) as stage:
+                    portfolio = score_portfolio(Portfolio.from_dataframe(df_project, risk_bucket_count, risk_factor_count, NUM_YEARS))
+                    stage.set_shape(portfolio.ratings)
+                with report.stage('scenario_analysis', profile=True) as stage:
+                    df_results, df_totals = run_scenarios(portfolio, scenarios)
+                    stage.set_shape(df_results)
+                if display_output:
+                    with report.stage('display'):
+                        display_scenario_totals(df_totals)
+                output_folder = create_output_folder()
+                with report.stage('export_scenario_output', profile=True):
+                    export_scenario_output(output_folder, df_results, df_totals, output_format)
+                report.save(output_folder)
+                return
 
-            # Run the yearly simulations for all projects
-            df_project = run_simulation(df_project, risk_bucket_count)
-            overall_expected_value_percentage = df_project[[f'project_expected_value_percentage_year_{year}' for year in range(1, NUM_YEARS+1)]].mean(axis=1, skipna=True) * 10
-            df_project['overall_project_rating'] = score_to_rating_vectorized(overall_expected_value_percentage)
+            if incremental:
+                # Only recalculate the projects whose inputs changed since the last incremental run
+                state_file = os.path.join(CACHE_DIR, 'incremental', os.path.splitext(os.path.basename(input_file))[0] + '.parquet')
+                with report.stage('incremental_analysis', profile=True) as stage:
+                    df_project, _ = analyze_portfolio_incremental(df_project, risk_bucket_count, risk_factor_count, df_default_rates, df_recovery_potential, state_file,
+                                                                  engine, num_years=NUM_YEARS, memory_budget_mb=memory_budget_mb, workers=workers, seed=seed,
+                                                                  tolerance=tolerance, sampler=sampler, precision=precision)
+                    stage.set_shape(df_project)
+            else:
+                # Calculate Risk Bucket Risk Scores and Ratings for each risk bucket
+                # and run the yearly simulations for all projects
+                with report.stage('bucket_scoring', profile=True) as stage:
+                    portfolio = Portfolio.from_dataframe(df_project, risk_bucket_count, risk_factor_count, NUM_YEARS)
+                    portfolio = score_portfolio(portfolio)
+                    stage.set_shape(portfolio.ratings)
+                with report.stage('shortfall', profile=True) as stage:
+                    portfolio = calculate_portfolio_shortfall(portfolio, df_default_rates, df_recovery_potential)
+                    stage.set_shape(portfolio.shortfall)
+                with report.stage('expected_value', profile=True) as stage:
+                    portfolio = calculate_portfolio_expected_value(portfolio)
+                    stage.set_shape(portfolio.expected_value)
+                with report.stage('standard_deviation', profile=True) as stage:
+                    portfolio = calculate_portfolio_standard_deviation(portfolio)
+                    stage.set_shape(portfolio.standard_deviation)
+                with report.stage('simulation', profile=True) as stage:
+                    portfolio = simulate_portfolio(portfolio, engine=engine, memory_budget_mb=memory_budget_mb, workers=workers, seed=seed, tolerance=tolerance,
+                                                   sampler=sampler, precision=precision)
+                    stage.set_shape(portfolio.project_standard_deviation)
+                with report.stage('rating', profile=True) as stage:
+                    portfolio = rate_portfolio(portfolio)
+                    df_project = portfolio.to_dataframe()
+                    stage.set_shape(df_project)
 
             # Calculate Project Output Tables
-            df_counts = pd.DataFrame(df_project['overall_project_rating'].value_counts()).reset_index()
-            df_counts.columns = ['overall_project_rating', 'counts']
-            top_projects, bottom_projects = calculate_top_bottom_projects(df_project, 10, ['project_id', 'project_name', 'country', 'technology', 'counterparty', 'start_year'])            
-            country_table = create_group_table(df_project, 'country')
-            technology_table = create_group_table(df_project, 'technology')
-            counterparty_table = create_group_table(df_project, 'counterparty')
-            total_volumes_per_year = calculate_total_volumes_by_year(df_project)
+            with report.stage('rollups', profile=True) as stage:
+                df_counts = create_counts_table(count_overall_ratings(rating_codes(df_project['overall_project_rating'])))
+                average_expected_values = calculate_average_expected_value(df_project, NUM_YEARS)
+                top_projects, bottom_projects = calculate_top_bottom_projects(df_project, 10, ['project_id', 'project_name', 'country', 'technology', 'counterparty', 'start_year'],
+                                                                              average_expected_values)
+                group_tables = create_group_tables(df_project, ['country', 'technology', 'counterparty'])
+                country_table, technology_table, counterparty_table = group_tables['country'], group_tables['technology'], group_tables['counterparty']
+                total_volumes_per_year = calculate_total_volumes_by_year(df_project)
+                group_projects = None
+                if group_top_bottom > 0:
+                    group_projects = create_group_top_bottom_tables(df_project, group_top_bottom, ['project_id', 'project_name', 'country', 'technology', 'counterparty', 'start_year'],
+                                                                    average_expected_values)
+                stage.set_shape(df_project)
     
             # Display and Export Data
             if display_output:
-                display_project_risk_output(df_counts, top_projects, bottom_projects, country_table, technology_table, counterparty_table, total_volumes_per_year)
+                with report.stage('display'):
+                    display_project_risk_output(df_counts, top_projects, bottom_projects, country_table, technology_table, counterparty_table, total_volumes_per_year)
             output_folder = create_output_folder()
-            export_project_risk_output(output_folder, top_projects, bottom_projects, country_table, technology_table, counterparty_table, df_counts, total_volumes_per_year)
-            export_ghg_data(output_folder, df_project,df_default_rates,df_recovery_potential,df_model)
+            if output_format in ['xlsx', 'both']:
+                with report.stage('export_project_risk_output', profile=True):
+                    export_project_risk_output(output_folder, top_projects, bottom_projects, country_table, technology_table, counterparty_table, df_counts, total_volumes_per_year,
+                                               group_projects)
+                with report.stage('export_ghg_data', profile=True) as stage:
+                    export_ghg_data(output_folder, df_project,df_default_rates,df_recovery_potential,df_model, fast=fast_export)
+                    stage.set_shape(df_project)
+            if output_format in ['parquet', 'both']:
+                with report.stage('export_parquet_output', profile=True) as stage:
+                    export_parquet_output(output_folder, df_project, top_projects, bottom_projects, country_table, technology_table, counterparty_table, df_counts, total_volumes_per_year,
+                                          group_projects)
+                    stage.set_shape(df_project)
+            report.save(output_folder)
         else:
             print(f"Data not loaded properly from {input_file}")
                 
@@ -75,5 +257,32 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', '--input', type=str, default='GHG_Data.xlsx', help='Input file')
     parser.add_argument('-d', '--display', type=str, choices=['on', 'off'], default='on', help='Display console output')
+    parser.add_argument('-e', '--engine', type=str, choices=SIMULATION_ENGINES, default='vectorized', help='Simulation engine')
+    parser.add_argument('-m', '--memory-budget', type=float, default=None, help='Memory budget per simulation block in MB')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of simulation worker processes')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='Random seed for reproducible simulations')
+    parser.add_argument('--validate', action='store_true', help='Report the largest analytic vs Monte Carlo discrepancy and exit')
+    parser.add_argument('--fast-export', action='store_true', help='Export the simulation data with the streaming Excel writer')
+    parser.add_argument('--output-format', type=str, choices=OUTPUT_FORMATS, default='xlsx', help='Output file format')
+    parser.add_argument('--cache', type=str, choices=['on', 'off'], default='on', help='Cache the processed input data')
+    parser.add_argument('-t', '--tables', type=str, default='GHG_Data.xlsx', help='Excel file with the model tables for CSV, TSV and Parquet input')
+    parser.add_argument('-c', '--chunk-size', type=int, default=100000, help='Number of projects per chunk for CSV, TSV and Parquet input')
+    parser.add_argument('--tolerance', type=float, default=ADAPTIVE_TOLERANCE, help='Target standard error of the expected value percentage for the adaptive engine')
+    parser.add_argument('--sampler', type=str, choices=SAMPLERS, default='random', help='Sampler for the vectorized, crn and memoized engines (antithetic is less accurate than random for the standard deviation)')
+    parser.add_argument('--precision', type=str, choices=SIMULATION_PRECISIONS, default='float64', help='Precision of the vectorized and memoized engine draws')
+    parser.add_argument('--compare-samplers', action='store_true', help='Compare the error of each sampler on a generated portfolio and exit')
+    parser.add_argument('--incremental', action='store_true', help='Only recalculate the projects whose inputs changed since the last incremental run')
+    parser.add_argument('--profile', action='store_true', help='Save cProfile stats of the hot pipeline stages to the output folder')
+    parser.add_argument('--scenarios', type=str, default=None, help='File of stress scenario default rates and recovery potential tables to evaluate')
+    parser.add_argument('--models', type=str, default=None, help='File of candidate model weights to compare on the portfolio')
+    parser.add_argument('--serve', action='store_true', help='Run a local scoring service with the model tables of the --tables file')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='Port of the local scoring service')
+    parser.add_argument('--group-top-bottom', type=int, default=0, help='Add the top and bottom N projects of each country and technology to the exports')
     args = parser.parse_args()
-    main(display_output=args.display == 'on', input_file=args.input)
\ No newline at end of file
+    main(display_output=args.display == 'on', input_file=args.input, engine=args.engine, memory_budget_mb=args.memory_budget,
+         workers=args.workers, seed=args.seed, validate=args.validate, fast_export=args.fast_export,
+         output_format=args.output_format, cache=args.cache == 'on', table_file=args.tables,
+         chunk_size=args.chunk_size, incremental=args.incremental,
+         tolerance=args.tolerance, sampler=args.sampler, sampler_comparison=args.compare_samplers,
+         precision=args.precision, profile=args.profile, scenario_file=args.scenarios, model_file=args.models,
+         serve=args.serve, port=args.port, group_top_bottom=args.group_top_bottom)
\ No newline at end of file
@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+from datetime import datetime
+import pandas as pd
+import numpy as np
+
+# Configure logging before the pipeline modules are imported, so the generator script does not log every stage to the console
+logging.basicConfig(level=logging.WARNING)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from scripts.generate_project_risk_data import generate_data, generate_model, default_rates, recovery_potential
+from utils.io import load_and_process_data, export_project_risk_output, export_ghg_data, export_parquet_output
+from utils.portfolio import Portfolio
+from utils.risk_calculation import (SIMULATION_ENGINES, score_portfolio, calculate_portfolio_shortfall, calculate_portfolio_expected_value,
+                                    calculate_portfolio_standard_deviation, simulate_portfolio, rate_portfolio)
+from utils.analysis import count_overall_ratings, create_counts_table, calculate_average_expected_value, calculate_top_bottom_projects, create_group_tables, calculate_total_volumes_by_year
+
+NUM_YEARS = 10
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+TOP_BOTTOM_COLUMNS = ['project_id', 'project_name', 'country', 'technology', 'counterparty', 'start_year']
+
+def parse_args():
+    """
+    Parse command line arguments.
+
+    Returns:
+        args: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Time every pipeline stage on generated portfolios and write the results to JSON')
+    parser.add_argument('-p', '--projects', type=int, nargs='+', default=[1000, 10000, 100000], help='Portfolio sizes')
+    parser.add_argument('-b', '--buckets', type=int, nargs='+', default=[5, 10], help='Numbers of risk buckets')
+    parser.add_argument('-f', '--factors', type=int, default=5, help='Number of factors per risk bucket')
+    parser.add_argument('-e', '--engine', type=str, choices=SIMULATION_ENGINES, default='vectorized', help='Simulation engine')
+    parser.add_argument('-n', '--samples', type=int, default=1000, help='Number of simulation samples per project year')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Random seed for the portfolios and the simulation')
+    parser.add_argument('-o', '--output', type=str, default=None, help='JSON results file, defaults to benchmarks/results/<commit>_<time>.json')
+    parser.add_argument('--baseline', type=str, default=None, help='JSON results file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2, help='Slowdown against the baseline reported as a regression')
+    parser.add_argument('--no-memory', action='store_true', help='Do not trace the peak memory, which slows down the pure Python stages')
+    return parser.parse_args()
+
+class StageTimer:
+    """
+    Time the pipeline stages of one portfolio and record their peak memory.
+
+    Args:
+        num_projects (int): Number of projects in the portfolio.
+        num_buckets (int): Number of risk buckets.
+        trace_memory (bool): Whether to trace the peak memory of each stage with tracemalloc.
+    """
+    def __init__(self, num_projects, num_buckets, trace_memory=True):
+        self.num_projects = num_projects
+        self.num_buckets = num_buckets
+        self.trace_memory = trace_memory
+        self.results = []
+
+    def run(self, stage, function, *args, **kwargs):
+        """
+        Run a stage, record its wall time and peak memory, and return its result.
+
+        Args:
+            stage (str): Name of the stage.
+            function (callable): Function that runs the stage.
+
+        Returns:
+            The result of the function.
+        """
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+        if self.trace_memory:
+            tracemalloc.stop()
+
+        self.results.append({
+            'projects': self.num_projects,
+            'buckets': self.num_buckets,
+            'stage': stage,
+            'seconds': round(seconds, 6),
+            'peak_memory_mb': round(peak / 1024 ** 2, 3) if peak is not None else None
+        })
+        print(f"{self.num_projects:>8} projects {self.num_buckets:>3} buckets  {stage:<45} {seconds:10.3f} s")
+        return result
+
+def write_input_file(folder, num_projects, num_buckets, num_factors):
+    """
+    Generate a portfolio and write it to an input Excel file in the same format as data/GHG_Data.xlsx.
+
+    Args:
+        folder (str): Folder to write the file to.
+        num_projects (int): Number of projects.
+        num_buckets (int): Number of risk buckets.
+        num_factors (int): Number of factors per risk bucket.
+
+    Returns:
+        str: Path to the input file.
+    """
+    input_file = os.path.join(folder, f'GHG_Data_{num_projects}_{num_buckets}.xlsx')
+    df_default_rates = pd.DataFrame(list(default_rates.values()), index=list(default_rates), columns=range(1, NUM_YEARS + 1))
+    df_recovery_potential = pd.DataFrame(list(recovery_potential.values()), index=list(recovery_potential), columns=range(1, NUM_YEARS + 1))
+
+    with pd.ExcelWriter(input_file) as writer:
+        generate_data(num_projects, num_buckets, num_factors).to_excel(writer, sheet_name='Project Data', index=False)
+        df_default_rates.to_excel(writer, sheet_name='Default Rates')
+        df_recovery_potential.to_excel(writer, sheet_name='Recovery Potential')
+        generate_model(num_buckets, num_factors).to_excel(writer, sheet_name='Model Config', index=False)
+    return input_file
+
+def benchmark_portfolio(folder, num_projects, num_buckets, num_factors, engine, num_samples, seed, trace_memory=True):
+    """
+    Run every pipeline stage on a generated portfolio, in the same order as GHG_Pro.main.
+
+    Args:
+        folder (str): Folder for the input and output files.
+        num_projects (int): Number of projects.
+        num_buckets (int): Number of risk buckets.
+        num_factors (int): Number of factors per risk bucket.
+        engine (str): Simulation engine.
+        num_samples (int): Number of simulation samples per project year.
+        seed (int): Random seed for the simulation.
+        trace_memory (bool): Whether to trace the peak memory of each stage.
+
+    Returns:
+        list: The time and peak memory of each stage.
+    """
+    input_file = write_input_file(folder, num_projects, num_buckets, num_factors)
+    cache_dir = os.path.join(folder, '.cache')
+    timer = StageTimer(num_projects, num_buckets, trace_memory)
+
+    # Load the input file, then once more from the input cache
+    risk_bucket_count, risk_factor_count, df_project, df_default_rates, df_recovery_potential, df_model = timer.run(
+        'load_and_process_data', load_and_process_data, input_file)
+    timer.run('load_and_process_data (cache write)', load_and_process_data, input_file, cache_dir=cache_dir)
+    timer.run('load_and_process_data (cache hit)', load_and_process_data, input_file, cache_dir=cache_dir)
+
+    # Risk calculation stages
+    portfolio = timer.run('Portfolio.from_dataframe', Portfolio.from_dataframe, df_project, risk_bucket_count, risk_factor_count, NUM_YEARS)
+    portfolio = timer.run('score_portfolio', score_portfolio, portfolio)
+    portfolio = timer.run('calculate_portfolio_shortfall', calculate_portfolio_shortfall, portfolio, df_default_rates, df_recovery_potential)
+    portfolio = timer.run('calculate_portfolio_expected_value', calculate_portfolio_expected_value, portfolio)
+    portfolio = timer.run('calculate_portfolio_standard_deviation', calculate_portfolio_standard_deviation, portfolio)
+    portfolio = timer.run(f'simulate_portfolio ({engine})', simulate_portfolio, portfolio, engine, num_samples, seed=seed)
+    portfolio = timer.run('rate_portfolio', rate_portfolio, portfolio)
+    df_project = timer.run('Portfolio.to_dataframe', portfolio.to_dataframe)
+
+    # Analysis tables
+    df_counts = timer.run('rating distribution', lambda: create_counts_table(count_overall_ratings(portfolio.overall_rating)))
+    average_expected_values = timer.run('calculate_average_expected_value', calculate_average_expected_value, df_project, NUM_YEARS)
+    top_projects, bottom_projects = timer.run('calculate_top_bottom_projects', calculate_top_bottom_projects, df_project, 10, TOP_BOTTOM_COLUMNS,
+                                              average_expected_values)
+    group_tables = timer.run('create_group_tables', create_group_tables, df_project, ['country', 'technology', 'counterparty'])
+    total_volumes_per_year = timer.run('calculate_total_volumes_by_year', calculate_total_volumes_by_year, df_project)
+
+    # Exports
+    output_tables = (top_projects, bottom_projects, group_tables['country'], group_tables['technology'], group_tables['counterparty'], df_counts,
+                     total_volumes_per_year)
+    output_folder = os.path.join(folder, f'output_{num_projects}_{num_buckets}')
+    os.makedirs(output_folder)
+    timer.run('export_project_risk_output', export_project_risk_output, output_folder, *output_tables)
+    timer.run('export_ghg_data (fast)', export_ghg_data, output_folder, df_project, df_default_rates, df_recovery_potential, df_model, fast=True)
+    timer.run('export_parquet_output', export_parquet_output, output_folder, df_project, *output_tables)
+
+    return timer.results
+
+def git_commit():
+    """
+    Get the current git commit of the repository.
+
+    Returns:
+        str: The commit hash, or None if it cannot be determined.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_with_baseline(results, baseline_file, threshold):
+    """
+    Compare the stage times with an earlier run and print the stages that got slower by more than the threshold.
+
+    Args:
+        results (list): The results of this run.
+        baseline_file (str): JSON results file of the earlier run.
+        threshold (float): Ratio of the new time to the baseline time above which a stage is reported.
+
+    Returns:
+        list: The regressed stages.
+    """
+    with open(baseline_file) as f:
+        baseline = {(row['projects'], row['buckets'], row['stage']): row['seconds'] for row in json.load(f)['results']}
+
+    regressions = []
+    for row in results:
+        baseline_seconds = baseline.get((row['projects'], row['buckets'], row['stage']))
+        if baseline_seconds and row['seconds'] > threshold * baseline_seconds:
+            regressions.append({**row, 'baseline_seconds': baseline_seconds, 'ratio': round(row['seconds'] / baseline_seconds, 2)})
+
+    for row in regressions:
+        print(f"Regression: {row['stage']} ({row['projects']} projects, {row['buckets']} buckets) "
+              f"took {row['seconds']:.3f} s against {row['baseline_seconds']:.3f} s ({row['ratio']}x)")
+    if not regressions:
+        print(f"No stage is more than {threshold}x slower than {baseline_file}")
+    return regressions
+
+if __name__ == "__main__":
+    args = parse_args()
+    commit = git_commit()
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for num_buckets in args.buckets:
+            for num_projects in args.projects:
+                results += benchmark_portfolio(folder, num_projects, num_buckets, args.factors, args.engine, args.samples, args.seed, not args.no_memory)
+
+    report = {
+        'commit': commit,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {'factors': args.factors, 'engine': args.engine, 'samples': args.samples, 'seed': args.seed, 'trace_memory': not args.no_memory},
+        'results': results
+    }
+
+    output_file = args.output
+    if output_file is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output_file = os.path.join(RESULTS_DIR, f"{(commit or 'unknown')[:10]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output_file}")
+
+    if args.baseline is not None and compare_with_baseline(results, args.baseline, args.threshold):
+        sys.exit(1)
@@ -1,6 +1,7 @@
 from utils.analysis import *
 import unittest
 import pandas as pd
+import numpy as np
 
 class TestCalculateTopBottomProjects(unittest.TestCase):
     def setUp(self):
@@ -40,6 +41,53 @@ class TestCalculateTopBottomProjects(unittest.TestCase):
         with self.assertRaises(KeyError):
             calculate_top_bottom_projects(self.df_project, self.num_projects, ['invalid_column'])
 
+    def test_partial_selection_order(self):
+        df_project = pd.DataFrame({'project_id': range(1, 8), 'project_expected_value_percentage_year_1': [0.5, None, 0.9, 0.1, 0.9, 0.3, 0.7]})
+        top_projects, bottom_projects = calculate_top_bottom_projects(df_project, 3, ['project_id'], df_project['project_expected_value_percentage_year_1'])
+        self.assertEqual(top_projects['project_id'].tolist(), [3, 5, 7])
+        self.assertEqual(bottom_projects['project_id'].tolist(), [4, 6, 1])
+
+    def test_missing_values_last(self):
+        df_project = pd.DataFrame({'project_id': [1, 2, 3], 'project_expected_value_percentage_year_1': [None, 0.2, 0.4]})
+        top_projects, bottom_projects = calculate_top_bottom_projects(df_project, 3, ['project_id'], df_project['project_expected_value_percentage_year_1'])
+        self.assertEqual(top_projects['project_id'].tolist(), [3, 2, 1])
+        self.assertEqual(bottom_projects['project_id'].tolist(), [2, 3, 1])
+
+    def test_precomputed_average_expected_value(self):
+        average_expected_values = calculate_average_expected_value(self.df_project)
+        self.assertEqual(average_expected_values.tolist(), [55, 65, 75, 85, 95])
+        top_projects, _ = calculate_top_bottom_projects(self.df_project, self.num_projects, self.columns, average_expected_values[::-1].set_axis(self.df_project.index))
+        self.assertEqual(top_projects['project_id'].tolist(), [1, 2])
+
+class TestCalculateTopBottomProjectsByGroup(unittest.TestCase):
+    def setUp(self):
+        self.df_project = pd.DataFrame({
+            'project_id': [1, 2, 3, 4, 5],
+            'country': ['USA', 'Canada', 'USA', 'USA', 'Canada'],
+            'project_expected_value_percentage_year_1': [0.5, 0.6, 0.9, 0.1, 0.2]
+        })
+
+    def test_by_group(self):
+        top_projects, bottom_projects = calculate_top_bottom_projects_by_group(self.df_project, 'country', 2, ['project_id'],
+                                                                              self.df_project['project_expected_value_percentage_year_1'])
+        self.assertEqual(list(top_projects.columns), ['country', 'rank', 'project_id', 'average_expected_value'])
+        self.assertEqual(top_projects['country'].tolist(), ['Canada', 'Canada', 'USA', 'USA'])
+        self.assertEqual(top_projects['rank'].tolist(), [1, 2, 1, 2])
+        self.assertEqual(top_projects['project_id'].tolist(), [2, 5, 3, 1])
+        self.assertEqual(bottom_projects['project_id'].tolist(), [5, 2, 4, 1])
+
+    def test_invalid_group_by(self):
+        with self.assertRaises(ValueError):
+            calculate_top_bottom_projects_by_group(self.df_project, 'project_id', 2, ['project_id'])
+
+    def test_create_group_top_bottom_tables(self):
+        self.df_project['technology'] = ['Wind', 'Solar', 'Solar', 'Wind', 'Wind']
+        tables = create_group_top_bottom_tables(self.df_project, 1, ['project_id'], self.df_project['project_expected_value_percentage_year_1'])
+        self.assertEqual(list(tables), ['highest_performing_by_country', 'lowest_performing_by_country',
+                                        'highest_performing_by_technology', 'lowest_performing_by_technology'])
+        self.assertEqual(tables['highest_performing_by_technology']['project_id'].tolist(), [3, 1])
+        self.assertEqual(tables['lowest_performing_by_technology']['project_id'].tolist(), [2, 4])
+
 class TestCreateGroupTable(unittest.TestCase):
     def setUp(self):
         self.df_project = pd.DataFrame({
@@ -84,6 +132,35 @@ class TestCreateGroupTable(unittest.TestCase):
         with self.assertRaises(ValueError):
             create_group_table(self.df_project, 'invalid_group')
 
+class TestCreateGroupTables(unittest.TestCase):
+    def setUp(self):
+        TestCreateGroupTable.setUp(self)
+
+    def test_create_group_tables(self):
+        group_tables = create_group_tables(self.df_project)
+        self.assertEqual(list(group_tables), ['country', 'technology', 'counterparty'])
+        for group_by, group_table in group_tables.items():
+            pd.testing.assert_frame_equal(group_table, create_group_table(self.df_project, group_by))
+
+    def test_cube(self):
+        self.df_project.loc[3, 'technology'] = 'Tech3'
+        group_table = create_group_tables(self.df_project, [('country', 'technology')])[('country', 'technology')]
+        self.assertEqual(list(group_table.columns), ['country', 'technology', 'Total Offered Volume', 'Total Projects', 'High (%)', 'Low (%)'])
+        self.assertEqual(list(zip(group_table['country'], group_table['technology'])), [('Canada', 'Tech2'), ('Canada', 'Tech3'), ('USA', 'Tech1')])
+        self.assertEqual(list(group_table['Total Projects']), [1, 1, 2])
+        self.assertEqual(list(group_table['Total Offered Volume']), [20000, 22000, 40000])
+        self.assertEqual(list(group_table['Low (%)']), [100.0, 100.0, 0.0])
+
+    def test_categorical_ratings(self):
+        self.df_project['overall_project_rating'] = pd.Categorical(['C', 'Investment', 'C', 'C'], categories=['C', 'Speculative', 'Investment'], ordered=True)
+        group_table = create_group_tables(self.df_project, ['country'])['country']
+        self.assertEqual(list(group_table.columns), ['country', 'Total Offered Volume', 'Total Projects', 'C (%)', 'Speculative (%)', 'Investment (%)'])
+        self.assertEqual(list(group_table['C (%)']), [50.0, 100.0])
+
+    def test_invalid_dimension(self):
+        with self.assertRaises(ValueError):
+            create_group_tables(self.df_project, [('country', 'invalid')])
+
 class TestCalculateTotalVolumesByYear(unittest.TestCase):
 
     def test_empty_dataframe(self):
@@ -139,4 +216,86 @@ class TestCalculateTotalVolumesByYear(unittest.TestCase):
         self.assertEqual(result.loc[2, 'Overall Project Delivery'], 60)
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
+    def test_precomputed_year_index(self):
+        df_project = pd.DataFrame({
+            'start_year': [2020, 2022],
+            'contract_duration': [2, 1],
+            'offered_volume_year_1': [100, 120],
+            'project_delivery_volume_year_1': [80, 90],
+            'offered_volume_year_2': [110, None],
+            'project_delivery_volume_year_2': [70, None]
+        })
+        year_index = calendar_year_index(df_project)
+        result = calculate_total_volumes_by_year(df_project, year_index)
+        self.assertEqual(list(result['Year']), [2020, 2021, 2022])
+        self.assertEqual(list(result['Total Offered Volume']), [100, 110, 120])
+
+        # The same index can be reused for other volumes of the same projects
+        df_scenario = df_project.assign(project_delivery_volume_year_1=[40, 45], project_delivery_volume_year_2=[35, None])
+        result = calculate_total_volumes_by_year(df_scenario, year_index)
+        self.assertEqual(list(result['Overall Project Delivery']), [40, 35, 45])
+
+class TestCalendarYearIndex(unittest.TestCase):
+    def test_calendar_year_index(self):
+        df_project = pd.DataFrame({'start_year': [2021, 2020], 'contract_duration': [2, 3]})
+        active, year_offsets, first_year, last_year = calendar_year_index(df_project)
+        self.assertEqual((first_year, last_year), (2020, 2022))
+        self.assertEqual(active.tolist(), [[True, True, False], [True, True, True]])
+        self.assertEqual(year_offsets.tolist(), [1, 2, 0, 1, 2])
+
+    def test_num_years(self):
+        df_project = pd.DataFrame({'start_year': [2020], 'contract_duration': [2]})
+        active, _, _, _ = calendar_year_index(df_project, num_years=10)
+        self.assertEqual(active.shape, (1, 10))
+
+class TestRatingCounts(unittest.TestCase):
+    def test_matches_value_counts(self):
+        ratings = pd.Series(rating_labels(np.array([2, 0, 2, 1, 0, 2], dtype=np.int8)), name='overall_project_rating')
+        expected = ratings.value_counts().reset_index()
+        expected.columns = ['overall_project_rating', 'counts']
+        df_counts = create_counts_table(count_overall_ratings(ratings.cat.codes.to_numpy()))
+        pd.testing.assert_frame_equal(df_counts, expected)
+
+    def test_missing_and_tied_ratings(self):
+        counts = count_overall_ratings(np.array([1, -1, 2], dtype=np.int8))
+        self.assertEqual(counts.tolist(), [0, 1, 1])
+        df_counts = create_counts_table(counts)
+        self.assertEqual(df_counts['overall_project_rating'].tolist(), ['Speculative', 'Investment', 'C'])
+        self.assertEqual(df_counts['counts'].tolist(), [1, 1, 0])
+
+class TestGroupSummaries(unittest.TestCase):
+    def setUp(self):
+        TestCreateGroupTable.setUp(self)
+
+    def test_create_group_table_from_summary(self):
+        summary = summarize_group_ratings(self.df_project, 'country')
+        pd.testing.assert_frame_equal(create_group_table_from_summary(summary, 'country'), create_group_table(self.df_project, 'country'))
+
+    def test_combine_group_summaries(self):
+        summaries = [summarize_group_ratings(self.df_project.iloc[:1], 'technology'), summarize_group_ratings(self.df_project.iloc[1:], 'technology')]
+        pd.testing.assert_frame_equal(create_group_table_from_summary(combine_group_summaries(summaries), 'technology'),
+                                      create_group_table(self.df_project, 'technology'))
+
+    def test_summarize_group_ratings_invalid_group_by(self):
+        with self.assertRaises(ValueError):
+            summarize_group_ratings(self.df_project, 'invalid')
+
+class TestCombineTotalVolumesByYear(unittest.TestCase):
+    def test_combine(self):
+        first = pd.DataFrame({'Year': [2020, 2021], 'Total Offered Volume': [100.0, 110.0], 'Overall Project Delivery': [80.0, 70.0]})
+        second = pd.DataFrame({'Year': [2021, 2022], 'Total Offered Volume': [120.0, 130.0], 'Overall Project Delivery': [90.0, 60.0]})
+        result = combine_total_volumes_by_year([first, second])
+        self.assertEqual(list(result['Year']), [2020, 2021, 2022])
+        self.assertEqual(list(result['Total Offered Volume']), [100, 230, 130])
+        self.assertEqual(list(result['Overall Project Delivery']), [80, 160, 60])
+
+    def test_missing_years_are_zero(self):
+        first = pd.DataFrame({'Year': [2020], 'Total Offered Volume': [100.0], 'Overall Project Delivery': [80.0]})
+        second = pd.DataFrame({'Year': [2023], 'Total Offered Volume': [120.0], 'Overall Project Delivery': [90.0]})
+        result = combine_total_volumes_by_year([first, second])
+        self.assertEqual(list(result['Year']), [2020, 2021, 2022, 2023])
+        self.assertEqual(list(result['Total Offered Volume']), [100, 0, 0, 120])
+
+    def test_empty(self):
+        self.assertTrue(combine_total_volumes_by_year([pd.DataFrame()]).empty)
@@ -0,0 +1,97 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from utils.incremental import *
+from scripts.generate_project_risk_data import generate_data, default_rates, recovery_potential
+
+class TestAnalyzePortfolioIncremental(unittest.TestCase):
+    def setUp(self):
+        self.state_file = os.path.join(tempfile.mkdtemp(), 'incremental', 'GHG_Data.parquet')
+        self.df_project = generate_data(40, 2, 3)
+        self.df_default_rates = pd.DataFrame(list(default_rates.values()), index=list(default_rates), columns=range(1, 11))
+        self.df_recovery_potential = pd.DataFrame(list(recovery_potential.values()), index=list(recovery_potential), columns=range(1, 11))
+
+    def analyze(self, df_project, df_default_rates=None, state_file=None, **kwargs):
+        df_default_rates = self.df_default_rates if df_default_rates is None else df_default_rates
+        kwargs.setdefault('engine', 'analytic')
+        return analyze_portfolio_incremental(df_project, 2, 3, df_default_rates, self.df_recovery_potential, state_file or self.state_file, **kwargs)
+
+    def expected(self, df_project):
+        return analyze_portfolio(df_project, 2, 3, self.df_default_rates, self.df_recovery_potential, engine='analytic').to_dataframe()
+
+    def test_first_run_recalculates_all_projects(self):
+        df_result, num_recalculated = self.analyze(self.df_project)
+        self.assertEqual(num_recalculated, 40)
+        pd.testing.assert_frame_equal(df_result, self.expected(self.df_project))
+        self.assertTrue(os.path.exists(self.state_file))
+
+    def test_only_changed_and_new_projects_are_recalculated(self):
+        self.analyze(self.df_project)
+        df_changed = self.df_project.astype({'risk_bucket_2_factor_1': float})
+        df_changed.loc[3, 'risk_bucket_2_factor_1'] += 0.5
+        df_changed.loc[7, 'offered_volume_year_1'] += 500
+        df_new = generate_data(1, 2, 3)
+        df_new['project_id'] = 1000
+        df_changed = pd.concat([df_changed.iloc[::-1], df_new], ignore_index=True)
+
+        df_result, num_recalculated = self.analyze(df_changed)
+        self.assertEqual(num_recalculated, 3)
+        pd.testing.assert_frame_equal(df_result, self.expected(df_changed))
+
+        _, num_recalculated = self.analyze(df_changed)
+        self.assertEqual(num_recalculated, 0)
+
+    def test_changed_tables_recalculate_all_projects(self):
+        self.analyze(self.df_project)
+        _, num_recalculated = self.analyze(self.df_project, self.df_default_rates * 0.5)
+        self.assertEqual(num_recalculated, 40)
+
+    def test_changed_seed_recalculates_all_projects(self):
+        self.analyze(self.df_project, engine='vectorized', num_samples=200, seed=1)
+        _, num_recalculated = self.analyze(self.df_project, engine='vectorized', num_samples=200, seed=1)
+        self.assertEqual(num_recalculated, 0)
+        _, num_recalculated = self.analyze(self.df_project, engine='vectorized', num_samples=200, seed=99)
+        self.assertEqual(num_recalculated, 40)
+
+    def test_stochastic_results_match_a_full_run(self):
+        for engine in ['loop', 'vectorized', 'adaptive', 'memoized']:
+            with self.subTest(engine=engine):
+                state_file = os.path.join(tempfile.mkdtemp(), 'GHG_Data.parquet')
+                self.analyze(self.df_project, state_file=state_file, engine=engine, num_samples=500, seed=1)
+                df_changed = self.df_project.copy()
+                df_changed.loc[5, 'offered_volume_year_1'] *= 2
+                df_result, num_recalculated = self.analyze(df_changed, state_file=state_file, engine=engine, num_samples=500, seed=1)
+                self.assertEqual(num_recalculated, 1)
+
+                df_full, _ = self.analyze(df_changed, state_file=os.path.join(tempfile.mkdtemp(), 'GHG_Data.parquet'), engine=engine, num_samples=500, seed=1)
+                pd.testing.assert_frame_equal(df_result, df_full)
+
+    def test_invalid_project_data(self):
+        with self.assertRaises(ValueError):
+            self.analyze(self.df_project.iloc[:0])
+        df_duplicated = self.df_project.copy()
+        df_duplicated.loc[1, 'project_id'] = df_duplicated.loc[0, 'project_id']
+        with self.assertRaises(ValueError):
+            self.analyze(df_duplicated)
+
+class TestProjectSeeds(unittest.TestCase):
+    def test_seeds_depend_on_seed_and_fingerprint(self):
+        fingerprints = np.array([1, 2, 1], dtype=np.uint64)
+        seeds = project_seeds(1, fingerprints)
+        self.assertEqual(seeds[0], seeds[2])
+        self.assertNotEqual(seeds[0], seeds[1])
+        self.assertFalse((project_seeds(2, fingerprints) == seeds).any())
+
+class TestProjectFingerprints(unittest.TestCase):
+    def test_fingerprint_changes_with_inputs(self):
+        df_project = generate_data(5, 2, 3)
+        fingerprints = project_fingerprints(df_project, 2, 3)
+        df_project.loc[1, 'risk_bucket_1_weight_2'] += 0.1
+        df_project.loc[2, 'project_name'] = 'Renamed'
+        changed = project_fingerprints(df_project, 2, 3) != fingerprints
+        self.assertEqual(list(changed), [False, True, False, False, False])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import os
+import json
+import tempfile
+import pandas as pd
+import numpy as np
+from utils.instrumentation import *
+
+class TestRunReport(unittest.TestCase):
+    def test_stages_are_recorded_and_saved(self):
+        report = RunReport(settings={'engine': 'analytic'})
+        with report.stage('load') as stage:
+            stage.set_shape(pd.DataFrame({'a': range(5), 'b': range(5)}))
+        with report.stage('display'):
+            pass
+
+        output_folder = tempfile.mkdtemp()
+        with open(report.save(output_folder)) as f:
+            saved = json.load(f)
+        self.assertEqual(saved['settings'], {'engine': 'analytic'})
+        self.assertEqual([record['stage'] for record in saved['stages']], ['load', 'display'])
+        self.assertEqual(saved['stages'][0]['shape'], [5, 2])
+        self.assertIsNone(saved['stages'][1]['shape'])
+        self.assertIn('peak_rss_mb', saved['stages'][0])
+        self.assertIn('process_peak_rss_mb', saved)
+        self.assertGreaterEqual(saved['stages'][0]['wall_seconds'], 0)
+        self.assertFalse(os.path.exists(os.path.join(output_folder, PROFILE_FOLDER)))
+
+    def test_array_shape_and_rss(self):
+        report = RunReport()
+        with report.stage('shortfall') as stage:
+            stage.set_shape(np.zeros((4, 3, 10)))
+        record = report.stages[0]
+        self.assertEqual(record.shape, [4, 3, 10])
+        if os.path.exists('/proc/self/statm'):
+            self.assertGreater(record.rss_start_mb, 0)
+            self.assertGreater(record.rss_end_mb, 0)
+
+    @unittest.skipUnless(reset_peak_rss(), 'The peak RSS can only be reset on Linux')
+    def test_peak_rss_is_measured_per_stage(self):
+        report = RunReport()
+        with report.stage('simulation'):
+            draws = np.ones(10_000_000)
+            del draws
+        with report.stage('display'):
+            pass
+        simulation, display = report.stages
+        # The 80 MB array is freed within the stage, so only the stage peak includes it
+        self.assertGreater(simulation.peak_rss_mb - simulation.rss_end_mb, 60)
+        self.assertGreater(simulation.peak_rss_mb - display.peak_rss_mb, 60)
+        self.assertGreaterEqual(report.to_dict()['process_peak_rss_mb'], simulation.peak_rss_mb)
+
+    def test_only_profiled_stages_are_profiled(self):
+        report = RunReport(profile=True)
+        with report.stage('simulation', profile=True):
+            sum(range(1000))
+        with report.stage('display'):
+            pass
+        self.assertEqual(list(report.profiles), ['simulation'])
+
+        output_folder = tempfile.mkdtemp()
+        report.save(output_folder)
+        self.assertTrue(os.path.exists(os.path.join(output_folder, PROFILE_FOLDER, 'simulation.prof')))
+
+    def test_profile_is_off_by_default(self):
+        report = RunReport()
+        with report.stage('simulation', profile=True):
+            pass
+        self.assertEqual(report.profiles, {})
+
+    def test_failed_stage_is_not_recorded(self):
+        report = RunReport()
+        with self.assertRaises(ValueError):
+            with report.stage('load'):
+                raise ValueError('bad input')
+        self.assertEqual(report.stages, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,11 @@ from unittest.mock import patch
 import pandas as pd
 from utils.io import *
 from io import StringIO
+import tempfile
+import json
+import os
+import hashlib
+from openpyxl import load_workbook
 
 class TestValidProjectData(unittest.TestCase):
     def setUp(self):
@@ -254,7 +259,7 @@ class TestLoadAndProcessData(unittest.TestCase):
         df_model = pd.DataFrame({'model_id': [1], 'model_name': ['Model 1']})
 
         # Mock read_excel function to return mock dataframes
-        mock_read_excel.side_effect = [df_project, df_default_rates, df_recovery_potential, df_model]
+        mock_read_excel.return_value = {'Project Data': df_project, 'Default Rates': df_default_rates, 'Recovery Potential': df_recovery_potential, 'Model Config': df_model}
 
         # Load and process data from mock Excel file
         num_buckets, num_risk_factors, df_project, df_default_rates, df_recovery_potential, df_model = load_and_process_data('mock_file.xlsx')
@@ -266,6 +271,7 @@ class TestLoadAndProcessData(unittest.TestCase):
         self.assertTrue(df_default_rates.equals(pd.DataFrame({1: [0.1, 0.2]}, index=['Investment', 'Speculative'])))
         self.assertTrue(df_recovery_potential.equals(pd.DataFrame({1: [0.1, 0.2]}, index=['Investment', 'Speculative'])))
         self.assertTrue(df_model.equals(pd.DataFrame({'model_id': [1], 'model_name': ['Model 1']})))
+        mock_read_excel.assert_called_once()
 
     @patch('pandas.read_excel')
     def test_load_and_process_data_failure(self, mock_read_excel):
@@ -276,6 +282,60 @@ class TestLoadAndProcessData(unittest.TestCase):
         with self.assertRaises(ValueError):
             load_and_process_data('mock_file.xlsx')
 
+class TestReadProjectRecords(unittest.TestCase):
+    def test_read_project_records(self):
+        df_project = read_project_records([
+            {'project_id': 1, 'screening_date': '2022-01-01', 'risk_bucket_1_factor_1': None, 'offered_volume_year_10': None},
+            {'project_id': 2, 'screening_date': '2022-01-02', 'risk_bucket_1_factor_1': 0.5, 'offered_volume_year_10': None}
+        ])
+        self.assertEqual(list(df_project['risk_bucket_1_factor_1']), [0, 0.5])
+        self.assertEqual(df_project['screening_date'].iloc[1], pd.Timestamp('2022-01-02'))
+        self.assertEqual(df_project['offered_volume_year_10'].dtype, float)
+
+    def test_read_project_records_invalid(self):
+        with self.assertRaises(ValueError):
+            read_project_records([])
+        with self.assertRaises(ValueError):
+            read_project_records([{'project_id': 1}])
+
+class TestInputCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.input_file = os.path.join(tempfile.mkdtemp(), 'GHG_Data.xlsx')
+        with open(self.input_file, 'wb') as f:
+            f.write(b'input data')
+
+        df_project = pd.DataFrame({'project_id': [1, 2], 'screening_date': ['2022-01-01', '2022-01-02'], 'risk_bucket_1_factor_1': [0.1, None]})
+        df_default_rates = pd.DataFrame({'Unnamed: 0': ['Investment', 'Speculative'], 1: [0.1, 0.2], 2: [0.3, 0.4]})
+        df_recovery_potential = pd.DataFrame({'Unnamed: 0': ['Investment', 'Speculative'], 1: [0.5, 0.6], 2: [0.7, 0.8]})
+        df_model = pd.DataFrame({'model_id': [1], 'model_name': ['Model 1']})
+        self.sheets = {'Project Data': df_project, 'Default Rates': df_default_rates, 'Recovery Potential': df_recovery_potential, 'Model Config': df_model}
+
+    def load(self):
+        with patch('pandas.read_excel', return_value={sheet: df.copy() for sheet, df in self.sheets.items()}) as mock_read_excel:
+            result = load_and_process_data(self.input_file, cache_dir=self.cache_dir)
+        return result, mock_read_excel.call_count
+
+    def test_cache_hit(self):
+        first, first_calls = self.load()
+        second, second_calls = self.load()
+        self.assertEqual((first_calls, second_calls), (1, 0))
+        self.assertEqual(first[:2], second[:2])
+        for expected, cached in zip(first[2:], second[2:]):
+            pd.testing.assert_frame_equal(cached, expected)
+        self.assertEqual(list(second[3].columns), [1, 2])
+
+    def test_cache_miss_on_changed_file(self):
+        self.load()
+        with open(self.input_file, 'ab') as f:
+            f.write(b' changed')
+        _, calls = self.load()
+        self.assertEqual(calls, 1)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_file_hash(self):
+        self.assertEqual(file_hash(self.input_file), hashlib.sha256(b'input data').hexdigest())
+
 class TestCreateOutputFolder(unittest.TestCase):
     @patch('os.makedirs')
     def test_create_output_folder_success(self, mock_makedirs):
@@ -377,6 +437,98 @@ class TestExportProjectRiskOutput(unittest.TestCase):
             with self.assertRaises(PermissionError):
                 export_project_risk_output('', top_projects, bottom_projects, country_table, technology_table, counterparty_table, df_counts, total_volumes_per_year)
 
+    def test_export_group_projects(self):
+        table = pd.DataFrame({'A': [1, 2, 3], 'B': [4, 5, 6]})
+        group_projects = {'highest_performing_by_country': pd.DataFrame({'country': ['USA', 'USA'], 'rank': [1, 2], 'project_id': [3, 1]}),
+                          'lowest_performing_by_technology': pd.DataFrame({'technology': ['Wind'], 'rank': [1], 'project_id': [4]})}
+        output_folder = tempfile.mkdtemp()
+        export_project_risk_output(output_folder, table, table, table, table, table, table, table, group_projects)
+
+        wb = load_workbook(os.path.join(output_folder, 'Project_Risk_Summary_Data.xlsx'))
+        self.assertEqual(wb.sheetnames[-2:], ['Highest by Country', 'Lowest by Technology'])
+        ws = wb['Highest by Country']
+        self.assertEqual(ws['A1'].value, 'Highest Performing Projects by Country')
+        self.assertEqual([cell.value for cell in ws[2]], ['country', 'rank', 'project_id'])
+        self.assertEqual([cell.value for cell in ws[4]], ['USA', 2, 1])
+
+class TestExportGhgDataFast(unittest.TestCase):
+    def setUp(self):
+        self.df_project = pd.DataFrame({
+            'project_id': [1, 2, 3],
+            'project_name': ['A', 'B', 'C'],
+            'offered_volume_year_1': [1000.0, None, 3000.0],
+            'overall_project_rating': pd.Categorical(['C', 'Investment', 'C'], categories=['C', 'Speculative', 'Investment'], ordered=True)
+        })
+        rates = [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+        self.df_default_rates = pd.DataFrame(rates, index=['Investment', 'Speculative', 'C'], columns=[1, 2])
+        self.df_recovery_potential = pd.DataFrame(rates, index=['Investment', 'Speculative', 'C'], columns=[1, 2])
+        self.df_model = pd.DataFrame({'Model Name': ['Test'], 'Risk Buckets': [1]})
+
+    def export(self, fast):
+        output_folder = tempfile.mkdtemp()
+        export_ghg_data(output_folder, self.df_project, self.df_default_rates, self.df_recovery_potential, self.df_model, fast=fast)
+        return load_workbook(f"{output_folder}/GHG_Data_Simulation.xlsx")
+
+    def test_same_values_as_default_export(self):
+        default_wb = self.export(fast=False)
+        fast_wb = self.export(fast=True)
+        self.assertEqual(fast_wb.sheetnames, default_wb.sheetnames)
+        for title in default_wb.sheetnames:
+            self.assertEqual(list(fast_wb[title].values), list(default_wb[title].values))
+
+    def test_formatting(self):
+        ws = self.export(fast=True)['Project Data']
+        self.assertTrue(ws['A1'].font.b)
+        self.assertFalse(ws['A2'].font.b)
+        self.assertEqual(ws.column_dimensions['A'].width, 25)
+        self.assertEqual(ws.column_dimensions['B'].width, 35)
+        ranges = [str(cf.sqref) for cf in ws.conditional_formatting]
+        self.assertEqual(ranges, ['A2:D4'])
+
+class TestParquetOutput(unittest.TestCase):
+    def setUp(self):
+        self.output_folder = tempfile.mkdtemp()
+        self.df_project = pd.DataFrame({
+            'project_id': [1, 2],
+            'screening_date': pd.to_datetime(['2024-01-01', '2024-02-01']),
+            'project_expected_value_percentage_year_1': [0.9, None],
+            'overall_project_rating': pd.Categorical(['C', 'Investment'], categories=['C', 'Speculative', 'Investment'], ordered=True)
+        })
+        self.table = pd.DataFrame({'country': ['A', 'B'], 'Total Projects': [1, 1], 'C (%)': [100.0, 0.0]})
+
+    def export(self):
+        export_parquet_output(self.output_folder, self.df_project, self.table, self.table, self.table, self.table, self.table, self.table, self.table)
+
+    def test_round_trip(self):
+        self.export()
+        tables = load_parquet_output(self.output_folder)
+        self.assertEqual(len(tables), 8)
+        pd.testing.assert_frame_equal(tables['project_data'], self.df_project)
+        pd.testing.assert_frame_equal(tables['country_distribution'], self.table)
+
+    def test_round_trip_group_projects(self):
+        export_parquet_output(self.output_folder, self.df_project, self.table, self.table, self.table, self.table, self.table, self.table, self.table,
+                              {'highest_performing_by_country': self.table})
+        tables = load_parquet_output(self.output_folder)
+        self.assertEqual(len(tables), 9)
+        pd.testing.assert_frame_equal(tables['highest_performing_by_country'], self.table)
+
+    def test_manifest(self):
+        self.export()
+        with open(os.path.join(self.output_folder, 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['tables']['project_data'], {'file': 'project_data.parquet', 'rows': 2, 'columns': 4})
+
+    def test_manifest_shape_mismatch(self):
+        self.export()
+        self.df_project.head(1).to_parquet(os.path.join(self.output_folder, 'project_data.parquet'), index=False)
+        with self.assertRaises(ValueError):
+            load_parquet_output(self.output_folder)
+
+    def test_missing_manifest(self):
+        with self.assertRaises(FileNotFoundError):
+            load_parquet_output(self.output_folder)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
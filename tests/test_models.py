@@ -0,0 +1,63 @@
+import unittest
+import os
+import tempfile
+import pandas as pd
+import numpy as np
+from utils.models import *
+from utils.risk_calculation import analyze_portfolio, score_portfolio
+from scripts.generate_project_risk_data import generate_data, default_rates, recovery_potential
+
+class TestCompareModels(unittest.TestCase):
+    def setUp(self):
+        self.df_project = generate_data(40, 3, 2)
+        self.df_default_rates = pd.DataFrame(list(default_rates.values()), index=list(default_rates), columns=range(1, 11))
+        self.df_recovery_potential = pd.DataFrame(list(recovery_potential.values()), index=list(recovery_potential), columns=range(1, 11))
+        self.portfolio = score_portfolio(Portfolio.from_dataframe(self.df_project, 3, 2))
+        self.model_weights = np.stack([self.portfolio.weights[0], np.full((3, 2), 0.5), np.full((3, 2), 0.1)])
+
+    def test_models_match_the_analytic_pipeline(self):
+        df_comparison, df_ratings = compare_models(self.portfolio, ['Same', 'Half', 'Low'], self.model_weights, self.df_default_rates,
+                                                   self.df_recovery_potential)
+        self.assertEqual(df_comparison['model_name'].tolist(), [PROJECT_WEIGHTS_MODEL, 'Same', 'Half', 'Low'])
+        self.assertEqual(df_comparison['Changed Ratings'].tolist()[:2], [0, 0])
+        self.assertTrue((df_comparison[RATING_LABELS].sum(axis=1) == 40).all())
+
+        for name, weights in zip(['Half', 'Low'], self.model_weights[1:]):
+            df_model = self.df_project.copy()
+            for bucket in range(1, 4):
+                for factor in range(1, 3):
+                    df_model[f'risk_bucket_{bucket}_weight_{factor}'] = weights[bucket - 1, factor - 1]
+            df_expected = analyze_portfolio(df_model, 3, 2, self.df_default_rates, self.df_recovery_potential, engine='analytic').to_dataframe()
+            df_model_ratings = df_ratings[df_ratings['model_name'] == name]
+            self.assertEqual(df_model_ratings['overall_project_rating'].tolist(), df_expected['overall_project_rating'].tolist())
+            self.assertEqual(df_model_ratings['risk_bucket_2_rating'].tolist(), df_expected['risk_bucket_2_rating'].tolist())
+            delivery = df_comparison.loc[df_comparison['model_name'] == name, 'Overall Project Delivery'].iloc[0]
+            expected = np.nansum(df_expected[[f'project_delivery_volume_year_{year}' for year in range(1, 11)]].to_numpy())
+            self.assertAlmostEqual(delivery, expected, places=4)
+
+    def test_wrong_model_shape(self):
+        with self.assertRaises(ValueError):
+            compare_models(self.portfolio, ['Small'], np.ones((1, 2, 2)), self.df_default_rates, self.df_recovery_potential)
+
+class TestLoadModels(unittest.TestCase):
+    def test_load_models(self):
+        model_file = os.path.join(tempfile.mkdtemp(), 'models.csv')
+        pd.DataFrame({'model_name': ['A', 'B'], 'risk_bucket_1_weight_1': [0.5, 1.0], 'risk_bucket_1_weight_2': [0.5, np.nan],
+                      'risk_bucket_2_weight_1': [0.2, 0.3], 'risk_bucket_2_weight_2': [0.8, 0.7]}).to_csv(model_file, index=False)
+        model_names, model_weights = load_models(model_file, 2, 2)
+        self.assertEqual(model_names, ['A', 'B'])
+        np.testing.assert_array_equal(model_weights[1], [[1.0, 0.0], [0.3, 0.7]])
+
+        with self.assertRaises(ValueError):
+            load_models(model_file, 2, 3)
+
+    def test_invalid_weights(self):
+        model_file = os.path.join(tempfile.mkdtemp(), 'models.csv')
+        for weights, message in [([0.6, 0.6], 'risk bucket 2 of model B must sum to 1'), ([1.5, -0.5], 'risk bucket 2 of model B must not be negative')]:
+            pd.DataFrame({'model_name': ['A', 'B'], 'risk_bucket_1_weight_1': [0.5, 1.0], 'risk_bucket_1_weight_2': [0.5, 0.0],
+                          'risk_bucket_2_weight_1': [0.2, weights[0]], 'risk_bucket_2_weight_2': [0.8, weights[1]]}).to_csv(model_file, index=False)
+            with self.assertRaisesRegex(ValueError, message):
+                load_models(model_file, 2, 2)
+
+if __name__ == '__main__':
+    unittest.main()
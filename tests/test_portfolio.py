@@ -0,0 +1,68 @@
+import unittest
+from utils.portfolio import *
+import pandas as pd
+import numpy as np
+
+class TestPortfolio(unittest.TestCase):
+    def setUp(self):
+        self.df_project = pd.DataFrame({
+            'project_id': [1, 2],
+            'contract_duration': [3, 2],
+            'offered_volume_year_1': [1000.0, 2000.0],
+            'offered_volume_year_2': [1100.0, 2100.0],
+            'offered_volume_year_3': [1200.0, np.nan],
+            'risk_bucket_1_factor_1': [1, 2],
+            'risk_bucket_1_factor_2': [3, 4],
+            'risk_bucket_1_weight_1': [0.5, 0.5],
+            'risk_bucket_1_weight_2': [0.5, 0.5],
+            'risk_bucket_2_factor_1': [5, 6],
+            'risk_bucket_2_factor_2': [7, 8],
+            'risk_bucket_2_weight_1': [0.25, 0.75],
+            'risk_bucket_2_weight_2': [0.75, 0.25]
+        })
+
+    def test_from_dataframe(self):
+        portfolio = Portfolio.from_dataframe(self.df_project, 2, 2, 3)
+        self.assertEqual(len(portfolio), 2)
+        self.assertEqual(portfolio.factors.shape, (2, 2, 2))
+        self.assertEqual(portfolio.weights.shape, (2, 2, 2))
+        self.assertEqual(portfolio.offered_volume.shape, (2, 3))
+        np.testing.assert_array_equal(portfolio.factors[1, 1], [6, 8])
+        np.testing.assert_array_equal(portfolio.weights[0, 1], [0.25, 0.75])
+        np.testing.assert_array_equal(portfolio.active, [[True, True, True], [True, True, False]])
+        self.assertIsNone(portfolio.scores)
+
+    def test_from_dataframe_missing_columns(self):
+        with self.assertRaises(KeyError):
+            Portfolio.from_dataframe(self.df_project, 3, 2, 3)
+
+    def test_to_dataframe_without_results(self):
+        portfolio = Portfolio.from_dataframe(self.df_project, 2, 2, 3)
+        pd.testing.assert_frame_equal(portfolio.to_dataframe(), self.df_project)
+
+    def test_to_dataframe(self):
+        portfolio = Portfolio.from_dataframe(self.df_project, 2, 2, 3)
+        portfolio.scores = np.array([[2.0, 6.5], [3.0, 6.5]])
+        portfolio.ratings = np.array([[0, 1], [0, 2]], dtype=np.int8)
+        portfolio.shortfall = np.full((2, 2, 3), 0.1)
+        df_project = portfolio.to_dataframe()
+
+        expected_columns = (list(self.df_project.columns) + ['risk_bucket_1_score', 'risk_bucket_2_score', 'risk_bucket_1_rating', 'risk_bucket_2_rating'] +
+                            [f'risk_bucket_{bucket}_shortfall_year_{year}' for bucket in range(1, 3) for year in range(1, 4)])
+        self.assertEqual(list(df_project.columns), expected_columns)
+        self.assertEqual(list(df_project['risk_bucket_2_rating']), ['Speculative', 'Investment'])
+        self.assertTrue(df_project['risk_bucket_2_rating'].cat.ordered)
+
+    def test_rating_labels(self):
+        ratings = rating_labels(np.array([2, 0, 1], dtype=np.int8))
+        self.assertEqual(list(ratings), ['Investment', 'C', 'Speculative'])
+        self.assertEqual(list(ratings.categories), RATING_LABELS)
+
+    def test_rating_codes(self):
+        codes = np.array([2, 0, 1], dtype=np.int8)
+        np.testing.assert_array_equal(rating_codes(pd.Series(rating_labels(codes))), codes)
+        np.testing.assert_array_equal(rating_codes(pd.Series(['Investment', 'C', None])), [2, 0, -1])
+        self.assertEqual(rating_codes(pd.Series(['C'])).dtype, np.int8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 import unittest
 from utils.risk_calculation import *
+from utils.risk_calculation import _float32_standard_deviation
 import pandas as pd
 import numpy as np
+import scipy.stats
 import time
 
 class TestRunSimulation(unittest.TestCase):
@@ -192,6 +194,289 @@ class TestRunSimulation(unittest.TestCase):
         # Check that the simulation completed within a reasonable amount of time
         self.assertLess(end_time - start_time, 5)
 
+class TestRunSimulationVectorized(unittest.TestCase):
+    def setUp(self):
+        TestRunSimulation.setUp(self)
+
+    def test_matches_run_simulation(self):
+        np.random.seed(42)
+        expected = run_simulation(self.df_project.copy(), 5, 1000)
+        np.random.seed(42)
+        result = run_simulation_vectorized(self.df_project.copy(), 5, 1000, block_size=3)
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_years_past_contract_duration_are_nan(self):
+        result = run_simulation_vectorized(self.df_project, 5, 1000)
+        for i in range(6, 11):
+            self.assertTrue(np.isnan(result[f'project_standard_deviation_year_{i}'].values[1]))
+            self.assertTrue(np.isnan(result[f'project_delivery_volume_year_{i}'].values[1]))
+            self.assertTrue(np.isnan(result[f'project_expected_value_percentage_year_{i}'].values[1]))
+
+    def test_run_simulation_vectorized_invalid_input(self):
+        df_project = self.df_project.drop(columns=['risk_bucket_1_expected_value_year_1'])
+        with self.assertRaises(KeyError):
+            run_simulation_vectorized(df_project, 5)
+
+    def test_zero_standard_deviation(self):
+        for bucket in range(1, 6):
+            self.df_project[f'risk_bucket_{bucket}_standard_deviation_year_1'] = 0
+        result = run_simulation_vectorized(self.df_project, 5, 1000)
+        self.assertTrue((result['project_standard_deviation_year_1'] == 0).all())
+        self.assertTrue((result['project_expected_value_percentage_year_1'] == 1).all())
+
+    def test_memory_budget_matches_default_blocks(self):
+        np.random.seed(7)
+        expected = run_simulation_vectorized(self.df_project.copy(), 5, 1000)
+        np.random.seed(7)
+        with self.assertLogs(level='INFO') as logs:
+            result = run_simulation_vectorized(self.df_project.copy(), 5, 1000, memory_budget_mb=0.5)
+        pd.testing.assert_frame_equal(result, expected)
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('peak memory', logs.output[0])
+
+    def test_simulation_block_size(self):
+        self.assertEqual(simulation_block_size(1, 5, 1000), 16)
+        self.assertEqual(simulation_block_size(512, 5), 838)
+
+    def test_simulation_block_size_too_small(self):
+        with self.assertRaises(ValueError):
+            simulation_block_size(0.01, 5)
+
+    def test_simulate_projects_invalid_engine(self):
+        with self.assertRaises(ValueError):
+            simulate_projects(self.df_project, 5, engine='invalid')
+
+    def test_loop_engine_seed_is_reproducible(self):
+        first = simulate_projects(self.df_project.copy(), 5, engine='loop', num_samples=1000, seed=3)
+        second = simulate_projects(self.df_project.copy(), 5, engine='loop', num_samples=1000, seed=3)
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_run_simulation_generator(self):
+        expected = run_simulation(self.df_project.copy(), 5, 1000, rng=np.random.default_rng(5))
+        result = run_simulation(self.df_project.copy(), 5, 1000, rng=np.random.default_rng(5))
+        pd.testing.assert_frame_equal(result, expected)
+
+class TestRunSimulationParallel(unittest.TestCase):
+    def setUp(self):
+        TestRunSimulation.setUp(self)
+        self.df_project = pd.concat([self.df_project] * 5, ignore_index=True)
+
+    def test_same_seed_is_reproducible(self):
+        first = run_simulation_parallel(self.df_project.copy(), 5, 1000, seed=1, shard_size=3)
+        second = run_simulation_parallel(self.df_project.copy(), 5, 1000, seed=1, shard_size=3)
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_results_do_not_depend_on_workers(self):
+        single = run_simulation_parallel(self.df_project.copy(), 5, 1000, workers=1, seed=1, shard_size=3)
+        multiple = run_simulation_parallel(self.df_project.copy(), 5, 1000, workers=2, seed=1, shard_size=3)
+        pd.testing.assert_frame_equal(single, multiple)
+
+    def test_different_seeds_differ(self):
+        first = run_simulation_parallel(self.df_project.copy(), 5, 1000, seed=1)
+        second = run_simulation_parallel(self.df_project.copy(), 5, 1000, seed=2)
+        self.assertFalse(first['project_standard_deviation_year_1'].equals(second['project_standard_deviation_year_1']))
+
+    def test_years_past_contract_duration_are_nan(self):
+        result = run_simulation_parallel(self.df_project, 5, 1000, seed=1, shard_size=3)
+        self.assertTrue(result.loc[1::2, 'project_standard_deviation_year_6'].isna().all())
+        self.assertTrue(result.loc[0::2, 'project_standard_deviation_year_6'].notna().all())
+
+class TestFloat32Simulation(unittest.TestCase):
+    def setUp(self):
+        TestRunSimulation.setUp(self)
+
+    def test_close_to_analytic(self):
+        analytic = run_simulation_analytic(self.df_project.copy(), 5)
+        result = run_simulation_vectorized(self.df_project.copy(), 5, precision='float32')
+        np.testing.assert_allclose(result['project_standard_deviation_year_1'], analytic['project_standard_deviation_year_1'], rtol=0.05)
+        self.assertTrue(np.isnan(result['project_standard_deviation_year_6'].values[1]))
+
+    def test_same_seed_is_reproducible(self):
+        first = run_simulation_parallel(self.df_project.copy(), 5, 1000, seed=1, shard_size=1, precision='float32')
+        second = run_simulation_parallel(self.df_project.copy(), 5, 1000, workers=2, seed=1, shard_size=1, precision='float32')
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_matches_float64_reduction(self):
+        rng = np.random.default_rng(3)
+        standard_deviations = np.array([[10000.0, 20000.0], [5.0, 0.0]])
+        draws = np.empty((2, 5000), dtype=np.float32)
+        totals = np.empty_like(draws)
+        std_dev = _float32_standard_deviation(standard_deviations, np.random.default_rng(3), draws, totals)
+        expected = np.std(sum(rng.standard_normal(size=(2, 5000), dtype=np.float32) * standard_deviations[:, bucket, None].astype(np.float32)
+                              for bucket in range(2)), axis=1)
+        np.testing.assert_allclose(std_dev, expected, rtol=1e-5)
+
+    def test_block_size(self):
+        self.assertEqual(simulation_block_size(1, 5, 1000, precision='float32'), 131)
+
+    def test_reported_peak_memory_includes_buffers(self):
+        with self.assertLogs(level='INFO') as logs:
+            run_simulation_vectorized(self.df_project.copy(), 5, 10000, memory_budget_mb=5, precision='float32')
+        num_cells = min(simulation_block_size(5, 5, 10000, precision='float32'), int(self.df_project['contract_duration'].sum()))
+        buffer_mb = 2 * num_cells * 10000 * np.dtype(np.float32).itemsize / 1024 ** 2
+        peak_mb = float(logs.output[0].split('peak memory ')[1].split(' MB')[0])
+        self.assertGreaterEqual(peak_mb, round(buffer_mb, 1))
+
+    def test_unsupported_options(self):
+        with self.assertRaises(ValueError):
+            simulate_projects(self.df_project, 5, engine='crn', precision='float32')
+        with self.assertRaises(ValueError):
+            simulate_projects(self.df_project, 5, sampler='lhs', precision='float32')
+        with self.assertRaises(ValueError):
+            simulate_projects(self.df_project, 5, precision='float16')
+
+class TestRunSimulationAnalytic(unittest.TestCase):
+    def setUp(self):
+        TestRunSimulation.setUp(self)
+
+    def test_sum_of_bucket_variances(self):
+        result = run_simulation_analytic(self.df_project, 5)
+        self.assertAlmostEqual(result['project_standard_deviation_year_1'].values[0], np.sqrt(5 * 10000 ** 2))
+        self.assertAlmostEqual(result['project_delivery_volume_year_1'].values[0], 1000000 - 2 * np.sqrt(5 * 10000 ** 2))
+        self.assertAlmostEqual(result['project_expected_value_percentage_year_1'].values[0], (1000000 - 2 * np.sqrt(5 * 10000 ** 2)) / 1000000)
+
+    def test_years_past_contract_duration_are_nan(self):
+        result = run_simulation_analytic(self.df_project, 5)
+        for i in range(6, 11):
+            self.assertTrue(np.isnan(result[f'project_standard_deviation_year_{i}'].values[1]))
+            self.assertTrue(np.isnan(result[f'project_delivery_volume_year_{i}'].values[1]))
+
+    def test_close_to_monte_carlo(self):
+        analytic = run_simulation_analytic(self.df_project.copy(), 5)
+        monte_carlo = run_simulation_parallel(self.df_project.copy(), 5, seed=1)
+        np.testing.assert_allclose(monte_carlo['project_standard_deviation_year_1'], analytic['project_standard_deviation_year_1'], rtol=0.05)
+
+    def test_compare_simulation_engines(self):
+        discrepancy = compare_simulation_engines(self.df_project, 5, num_samples=1000, seed=1)
+        self.assertGreater(discrepancy['max_absolute_difference'], 0)
+        self.assertLess(discrepancy['max_relative_difference'], 0.15)
+        self.assertIn(discrepancy['max_relative_difference_year'], range(1, 11))
+        self.assertNotIn('project_standard_deviation_year_1', self.df_project.columns)
+
+class TestRunSimulationAdaptive(unittest.TestCase):
+    def setUp(self):
+        TestRunSimulation.setUp(self)
+
+    def test_low_variance_years_stop_early(self):
+        for bucket in range(1, 6):
+            self.df_project[f'risk_bucket_{bucket}_standard_deviation_year_2'] = 100
+        result = run_simulation_adaptive(self.df_project, 5, 10000, tolerance=0.0001, batch_size=500, seed=1)
+        self.assertEqual(result['project_simulation_samples_year_2'].tolist(), [500, 500])
+        self.assertEqual(result['project_simulation_samples_year_1'].tolist(), [10000, 10000])
+        self.assertEqual(result['project_simulation_samples_year_6'].values[1], 0)
+        self.assertTrue(np.isnan(result['project_standard_deviation_year_6'].values[1]))
+
+    def test_close_to_analytic(self):
+        adaptive = run_simulation_adaptive(self.df_project.copy(), 5, seed=1)
+        analytic = run_simulation_analytic(self.df_project.copy(), 5)
+        np.testing.assert_allclose(adaptive['project_standard_deviation_year_1'], analytic['project_standard_deviation_year_1'], rtol=0.05)
+
+    def test_same_seed_is_reproducible(self):
+        first = simulate_projects(self.df_project.copy(), 5, engine='adaptive', seed=4, tolerance=0.01)
+        second = simulate_projects(self.df_project.copy(), 5, engine='adaptive', seed=4, tolerance=0.01)
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_invalid_tolerance(self):
+        with self.assertRaises(ValueError):
+            run_simulation_adaptive(self.df_project, 5, tolerance=0)
+
+class TestSamplers(unittest.TestCase):
+    def setUp(self):
+        TestRunSimulation.setUp(self)
+        self.rng = np.random.default_rng(1)
+
+    def test_antithetic_pairs(self):
+        draws = standard_normal_draws(self.rng, (3, 2, 9), 'antithetic')
+        self.assertEqual(draws.shape, (3, 2, 9))
+        np.testing.assert_array_equal(draws[:, :, 5:], -draws[:, :, :4])
+
+    def test_lhs_one_sample_per_stratum(self):
+        draws = standard_normal_draws(self.rng, (3, 2, 100), 'lhs')
+        strata = np.floor(scipy.stats.norm.cdf(draws) * 100)
+        np.testing.assert_array_equal(np.sort(strata, axis=2), np.broadcast_to(np.arange(100), (3, 2, 100)))
+
+    def test_sobol_draws(self):
+        draws = standard_normal_draws(self.rng, (3, 5, 1000), 'sobol')
+        self.assertTrue(np.isfinite(draws).all())
+        np.testing.assert_allclose(np.std(draws, axis=2), 1, atol=0.01)
+
+    def test_invalid_sampler(self):
+        with self.assertRaises(ValueError):
+            standard_normal_draws(self.rng, (1, 1, 10), 'unknown')
+        with self.assertRaises(ValueError):
+            simulate_projects(self.df_project, 5, engine='vectorized', sampler='unknown')
+
+    def test_sampler_not_supported_by_engine(self):
+        with self.assertRaises(ValueError):
+            simulate_projects(self.df_project, 5, engine='loop', sampler='sobol')
+
+    def test_samplers_close_to_analytic(self):
+        analytic = run_simulation_analytic(self.df_project.copy(), 5)['project_standard_deviation_year_1']
+        for sampler in SAMPLERS:
+            result = simulate_projects(self.df_project.copy(), 5, num_samples=2000, seed=1, sampler=sampler)
+            np.testing.assert_allclose(result['project_standard_deviation_year_1'], analytic, rtol=0.1)
+        result = simulate_projects(self.df_project.copy(), 5, engine='crn', num_samples=2000, seed=1, sampler='lhs')
+        np.testing.assert_allclose(result['project_standard_deviation_year_1'], analytic, rtol=0.1)
+
+class TestRunSimulationCommon(unittest.TestCase):
+    def setUp(self):
+        TestRunSimulation.setUp(self)
+
+    def test_matches_summed_base_draws(self):
+        result = run_simulation_common(self.df_project.copy(), 5, 1000, seed=1)
+        base = common_random_numbers(5, 1000, seed=1)
+        standard_deviations = np.array([self.df_project[f'risk_bucket_{bucket}_standard_deviation_year_1'].values[0] for bucket in range(1, 6)])
+        expected = np.std(np.sum(standard_deviations[:, None] * base, axis=0))
+        self.assertAlmostEqual(result['project_standard_deviation_year_1'].values[0], expected, places=6)
+        self.assertTrue(np.isnan(result['project_standard_deviation_year_6'].values[1]))
+
+    def test_scenarios_share_random_numbers(self):
+        baseline = run_simulation_common(self.df_project.copy(), 5, 1000, seed=1)
+        df_scenario = self.df_project.copy()
+        for bucket in range(1, 6):
+            df_scenario[f'risk_bucket_{bucket}_standard_deviation_year_1'] *= 1.1
+        scenario = run_simulation_common(df_scenario, 5, 1000, seed=1)
+        np.testing.assert_allclose(scenario['project_standard_deviation_year_1'], 1.1 * baseline['project_standard_deviation_year_1'])
+        pd.testing.assert_series_equal(scenario['project_standard_deviation_year_2'], baseline['project_standard_deviation_year_2'])
+
+    def test_close_to_analytic(self):
+        common = simulate_projects(self.df_project.copy(), 5, engine='crn', seed=2)
+        analytic = run_simulation_analytic(self.df_project.copy(), 5)
+        np.testing.assert_allclose(common['project_standard_deviation_year_1'], analytic['project_standard_deviation_year_1'], rtol=0.05)
+
+class TestRunSimulationMemoized(unittest.TestCase):
+    def setUp(self):
+        TestPortfolioStages.setUp(self)
+        # Project 4 has the same ratings as project 1 and twice its offered volumes
+        project = self.df_project.iloc[[0]].assign(project_id=4)
+        project[['offered_volume_year_1', 'offered_volume_year_2', 'offered_volume_year_3']] *= 2
+        self.df_project = pd.concat([self.df_project, project], ignore_index=True)
+        self.portfolio = prepare_portfolio(self.df_project, 2, 1, self.df_default_rates, self.df_recovery_potential, 3)
+
+    def test_same_ratings_scale_with_offered_volume(self):
+        std_dev = simulate_portfolio(self.portfolio, 'memoized', 2000, seed=1).project_standard_deviation
+        np.testing.assert_allclose(std_dev[3], 2 * std_dev[0])
+        self.assertTrue(np.isnan(std_dev[1, 2]))
+
+    def test_close_to_analytic(self):
+        memoized = simulate_projects(self.portfolio.to_dataframe(), 2, engine='memoized', num_years=3, seed=2)
+        analytic = run_simulation_analytic(self.portfolio.to_dataframe(), 2, 3)
+        for year in range(1, 4):
+            np.testing.assert_allclose(memoized[f'project_standard_deviation_year_{year}'], analytic[f'project_standard_deviation_year_{year}'], rtol=0.05)
+
+    def test_cache_is_reused(self):
+        cache = {}
+        with self.assertLogs(level='INFO') as logs:
+            first = run_simulation_memoized(self.portfolio.to_dataframe(), 2, 1000, 3, seed=1, cache=cache)
+        # Projects 1 and 4 share their 3 cases, projects 2 and 3 add 2 and 1
+        self.assertEqual(len(cache), 6)
+        self.assertIn(((RATING_LABELS.index('C'), RATING_LABELS.index('Investment')), 1), cache)
+        self.assertIn('6 of 6 distinct (rating, year) cases simulated, cache hit rate 0.0%', logs.output[-1])
+        with self.assertLogs(level='INFO') as logs:
+            second = run_simulation_memoized(self.portfolio.to_dataframe(), 2, 1000, 3, seed=2, cache=cache)
+        pd.testing.assert_frame_equal(first, second)
+        self.assertIn('0 of 6 distinct (rating, year) cases simulated, cache hit rate 100.0%', logs.output[-1])
+
 class TestCalculateRiskBucketScores(unittest.TestCase):
     def setUp(self):
         self.df_project = pd.DataFrame({
@@ -239,6 +524,22 @@ class TestScoreToRatingVectorized(unittest.TestCase):
         ratings = score_to_rating_vectorized(scores)
         self.assertEqual(len(ratings), 0)
 
+class TestScoreToRatingCodes(unittest.TestCase):
+    def test_matches_score_to_rating_vectorized(self):
+        scores = np.array([0, 3.5, 3.6, 7.5, 7.6, 10])
+        codes = score_to_rating_codes(scores)
+        self.assertEqual(codes.dtype, np.int8)
+        self.assertEqual([RATING_LABELS[code] for code in codes], score_to_rating_vectorized(pd.Series(scores)).tolist())
+
+    def test_invalid_scores(self):
+        with self.assertRaises(ValueError):
+            score_to_rating_codes(np.array([-1, 11]))
+        with self.assertRaises(ValueError):
+            score_to_rating_codes(np.array([np.nan]))
+
+    def test_skip_validation(self):
+        np.testing.assert_array_equal(score_to_rating_codes(np.array([[2.0, 9.0]]), validate=False), [[0, 2]])
+
 class TestCalculateYearlyShortfall(unittest.TestCase):
     def setUp(self):
         self.df_project = pd.DataFrame({
@@ -265,6 +566,24 @@ class TestCalculateYearlyShortfall(unittest.TestCase):
         with self.assertRaises(KeyError):
             calculate_yearly_shortfall(self.df_project, self.df_default_rates, self.df_recovery_potential, self.risk_bucket_count, self.num_years)
 
+    def test_calculate_yearly_shortfall_values(self):
+        self.df_default_rates.loc['Speculative'] = np.arange(1, 11) * 10.0
+        self.df_recovery_potential.loc['Speculative'] = 0.5
+        result = calculate_yearly_shortfall(self.df_project, self.df_default_rates, self.df_recovery_potential, self.risk_bucket_count, self.num_years)
+        self.assertAlmostEqual(result.loc[0, 'risk_bucket_1_shortfall_year_5'], 0.05 * 0.9 / 100)
+        self.assertAlmostEqual(result.loc[0, 'risk_bucket_2_shortfall_year_3'], 30 * 0.5 / 100)
+        self.assertTrue(np.isnan(result.loc[0, 'risk_bucket_2_shortfall_year_6']))
+        self.assertAlmostEqual(result.loc[1, 'risk_bucket_1_shortfall_year_10'], 0.5)
+        self.assertTrue(np.isnan(result.loc[2, 'risk_bucket_1_shortfall_year_8']))
+
+    def test_calculate_shortfall_table(self):
+        self.df_default_rates.loc['Speculative', 1] = 300
+        table = calculate_shortfall_table(self.df_default_rates, self.df_recovery_potential)
+        self.assertEqual(table.shape, (2, 10))
+        self.assertEqual(list(table.index), ['Investment', 'Speculative'])
+        self.assertAlmostEqual(table.loc['Investment', 1], 0.05 * 0.9 / 100)
+        self.assertEqual(table.loc['Speculative', 1], 1)
+
 class TestCalculateYearlyExpectedValue(unittest.TestCase):
     def setUp(self):
         self.df_project = pd.DataFrame({
@@ -326,5 +645,84 @@ class TestCalculateYearlyStandardDeviation(unittest.TestCase):
         with self.assertRaises(TypeError):
             calculate_yearly_standard_deviation(df_project, num_risk_buckets=1, num_years=1)
 
+class TestPortfolioStages(unittest.TestCase):
+    def setUp(self):
+        self.df_project = pd.DataFrame({
+            'project_id': [1, 2, 3],
+            'contract_duration': [3, 2, 1],
+            'offered_volume_year_1': [1000.0, 2000.0, 3000.0],
+            'offered_volume_year_2': [1100.0, 2100.0, np.nan],
+            'offered_volume_year_3': [1200.0, np.nan, np.nan],
+            'risk_bucket_1_factor_1': [1, 5, 9],
+            'risk_bucket_1_weight_1': [1.0, 1.0, 1.0],
+            'risk_bucket_2_factor_1': [8, 4, 12],
+            'risk_bucket_2_weight_1': [1.0, 1.0, 1.0]
+        })
+        self.df_default_rates = pd.DataFrame(index=['Investment', 'Speculative', 'C'], columns=range(1, 4), data=[[1.0, 2.0, 3.0], [10.0, 20.0, 30.0], [40.0, 50.0, 60.0]])
+        self.df_recovery_potential = pd.DataFrame(index=['Investment', 'Speculative', 'C'], columns=range(1, 4), data=0.5)
+
+    def run_portfolio(self, engine='analytic'):
+        portfolio = Portfolio.from_dataframe(self.df_project, 2, 1, 3)
+        portfolio = score_portfolio(portfolio)
+        portfolio = calculate_portfolio_shortfall(portfolio, self.df_default_rates, self.df_recovery_potential)
+        portfolio = calculate_portfolio_expected_value(portfolio)
+        portfolio = calculate_portfolio_standard_deviation(portfolio)
+        return simulate_portfolio(portfolio, engine=engine)
+
+    def test_score_portfolio(self):
+        portfolio = score_portfolio(Portfolio.from_dataframe(self.df_project, 2, 1, 3))
+        np.testing.assert_array_equal(portfolio.scores, [[1, 8], [5, 4], [9, 10]])
+        np.testing.assert_array_equal(portfolio.ratings, [[0, 2], [1, 1], [2, 2]])
+        self.assertEqual(portfolio.ratings.dtype, np.int8)
+
+    def test_matches_dataframe_stages(self):
+        df_project = calculate_risk_bucket_scores(self.df_project.copy(), 2, 1)
+        for i in range(1, 3):
+            df_project[f'risk_bucket_{i}_rating'] = score_to_rating_vectorized(df_project[f'risk_bucket_{i}_score'])
+        df_project = calculate_yearly_shortfall(df_project, self.df_default_rates, self.df_recovery_potential, 2, 3)
+        df_project = calculate_yearly_expected_value(df_project, 2, 3)
+        df_project = calculate_yearly_standard_deviation(df_project, 2, 3)
+        df_project = run_simulation_analytic(df_project, 2, 3)
+
+        pd.testing.assert_frame_equal(self.run_portfolio().to_dataframe(), df_project)
+
+    def test_shortfall_outside_contract_duration(self):
+        portfolio = self.run_portfolio()
+        self.assertTrue(np.isnan(portfolio.shortfall[1, :, 2]).all())
+        self.assertTrue(np.isnan(portfolio.project_delivery_volume[2, 1:]).all())
+        self.assertAlmostEqual(portfolio.shortfall[0, 0, 2], 0.6 * 0.5)
+
+    def test_rate_portfolio(self):
+        portfolio = rate_portfolio(self.run_portfolio())
+        average = np.nanmean(portfolio.project_expected_value_percentage, axis=1) * 10
+        np.testing.assert_array_equal(portfolio.overall_rating, np.digitize(average, [3.5, 7.5], right=True))
+
+    def test_simulate_portfolio_invalid_engine(self):
+        with self.assertRaises(ValueError):
+            self.run_portfolio(engine='unknown')
+
+    def test_compare_samplers(self):
+        portfolio = prepare_portfolio(self.df_project, 2, 1, self.df_default_rates, self.df_recovery_potential, 3)
+        df_comparison = compare_samplers(portfolio, [64, 1024], ['random', 'sobol'], seed=1)
+        self.assertEqual(df_comparison[['sampler', 'samples']].values.tolist(), [['random', 64], ['sobol', 64], ['random', 1024], ['sobol', 1024]])
+        errors = df_comparison.set_index(['sampler', 'samples'])['rms_relative_error']
+        self.assertLess(errors['sobol', 1024], errors['random', 1024])
+
+    def test_score_models(self):
+        portfolio = score_portfolio(Portfolio.from_dataframe(self.df_project, 2, 1, 3))
+        model_weights = np.stack([portfolio.weights[0], np.full((2, 1), 0.5)])
+        scores, ratings = score_models(portfolio.factors, model_weights)
+        self.assertEqual(scores.shape, (2, 3, 2))
+        np.testing.assert_array_equal(scores[0], portfolio.scores)
+        np.testing.assert_array_equal(ratings[0], portfolio.ratings)
+        np.testing.assert_array_equal(scores[1], [[0.5, 4.0], [2.5, 2.0], [4.5, 6.0]])
+        self.assertEqual(ratings.dtype, np.int8)
+
+    def test_adaptive_simulation_samples(self):
+        df_project = self.run_portfolio(engine='adaptive').to_dataframe()
+        self.assertEqual(df_project['project_simulation_samples_year_3'].tolist()[1:], [0, 0])
+        self.assertTrue((df_project['project_simulation_samples_year_1'] > 0).all())
+        self.assertNotIn('project_simulation_samples_year_1', self.run_portfolio().to_dataframe().columns)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import os
+import tempfile
+import pandas as pd
+import numpy as np
+from utils.scenarios import *
+from utils.risk_calculation import analyze_portfolio, score_portfolio
+from scripts.generate_project_risk_data import generate_data, default_rates, recovery_potential
+
+class TestRunScenarios(unittest.TestCase):
+    def setUp(self):
+        self.df_project = generate_data(30, 3, 2)
+        self.df_default_rates = pd.DataFrame(list(default_rates.values()), index=list(default_rates), columns=range(1, 11))
+        self.df_recovery_potential = pd.DataFrame(list(recovery_potential.values()), index=list(recovery_potential), columns=range(1, 11))
+        self.scenarios = {
+            'Base': (self.df_default_rates, self.df_recovery_potential),
+            'Stress': (self.df_default_rates * 1.5, self.df_recovery_potential * 0.8)
+        }
+        self.portfolio = score_portfolio(Portfolio.from_dataframe(self.df_project, 3, 2))
+
+    def test_matches_analytic_engine(self):
+        df_results, df_totals = run_scenarios(self.portfolio, self.scenarios)
+        for name, (df_default_rates, df_recovery_potential) in self.scenarios.items():
+            df_expected = analyze_portfolio(self.df_project, 3, 2, df_default_rates, df_recovery_potential, engine='analytic').to_dataframe()
+            df_scenario = df_results[df_results['scenario'] == name]
+            active = df_expected['contract_duration'].to_numpy()[:, None] >= np.arange(1, 11)
+            for column in ['project_standard_deviation', 'project_delivery_volume', 'project_expected_value_percentage']:
+                expected = df_expected[[f'{column}_year_{year}' for year in range(1, 11)]].to_numpy()[active]
+                np.testing.assert_allclose(df_scenario[column].to_numpy(), expected)
+
+            totals = df_totals[df_totals['Scenario'] == name].drop(columns='Scenario').reset_index(drop=True)
+            pd.testing.assert_frame_equal(totals, calculate_total_volumes_by_year(df_expected))
+
+    def test_result_layout(self):
+        df_results, _ = run_scenarios(self.portfolio, self.scenarios)
+        num_project_years = int(self.df_project['contract_duration'].sum())
+        self.assertEqual(len(df_results), 2 * num_project_years)
+        self.assertEqual(list(df_results['scenario'].cat.categories), ['Base', 'Stress'])
+        self.assertEqual(df_results['year'].iloc[0], 1)
+        self.assertTrue((df_results['project_delivery_volume'].iloc[num_project_years:].sum() <
+                         df_results['project_delivery_volume'].iloc[:num_project_years].sum()))
+
+class TestLoadScenarios(unittest.TestCase):
+    def setUp(self):
+        self.df_default_rates = pd.DataFrame(list(default_rates.values()), index=list(default_rates), columns=range(1, 11))
+        self.df_recovery_potential = pd.DataFrame(list(recovery_potential.values()), index=list(recovery_potential), columns=range(1, 11))
+        self.scenario_file = os.path.join(tempfile.mkdtemp(), 'scenarios.csv')
+
+    def write(self, rows):
+        pd.DataFrame(rows).to_csv(self.scenario_file, index=False)
+
+    def test_missing_tables_use_the_base_tables(self):
+        shocked = self.df_default_rates * 2
+        self.write([{'scenario': 'Double', 'table': 'Default Rates', 'rating': rating, **{str(year): shocked.loc[rating, year] for year in range(1, 11)}}
+                    for rating in ['C', 'Investment', 'Speculative']])
+        scenarios = load_scenarios(self.scenario_file, self.df_default_rates, self.df_recovery_potential)
+        self.assertEqual(list(scenarios), ['Double'])
+        df_default_rates, df_recovery_potential = scenarios['Double']
+        pd.testing.assert_frame_equal(df_default_rates, shocked, check_dtype=False)
+        self.assertIs(df_recovery_potential, self.df_recovery_potential)
+
+    def test_unknown_table(self):
+        self.write([{'scenario': 'Bad', 'table': 'Loss Given Default', 'rating': 'C', '1': 0.5}])
+        with self.assertRaises(ValueError):
+            load_scenarios(self.scenario_file, self.df_default_rates, self.df_recovery_potential)
+
+if __name__ == '__main__':
+    unittest.main()
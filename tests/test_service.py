@@ -0,0 +1,93 @@
+import unittest
+import os
+import json
+import tempfile
+import threading
+import urllib.request
+import urllib.error
+import numpy as np
+import pandas as pd
+from utils.service import *
+from utils.risk_calculation import analyze_portfolio
+from scripts.generate_project_risk_data import generate_data, generate_model, default_rates, recovery_potential
+
+class TestScoringService(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.table_file = os.path.join(self.folder, 'GHG_Data.xlsx')
+        self.df_default_rates = pd.DataFrame(list(default_rates.values()), index=list(default_rates), columns=range(1, 11))
+        self.df_recovery_potential = pd.DataFrame(list(recovery_potential.values()), index=list(recovery_potential), columns=range(1, 11))
+        with pd.ExcelWriter(self.table_file) as writer:
+            self.df_default_rates.to_excel(writer, sheet_name='Default Rates')
+            self.df_recovery_potential.to_excel(writer, sheet_name='Recovery Potential')
+            generate_model(2, 3).to_excel(writer, sheet_name='Model Config', index=False)
+
+        self.df_project = generate_data(12, 2, 3)
+        self.records = json.loads(self.df_project.to_json(orient='records', date_format='iso'))
+        self.service = ScoringService(self.table_file, engine='analytic', batch_window_ms=50)
+        self.server = create_server(self.service, port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://{self.server.server_address[0]}:{self.server.server_address[1]}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+
+    def post(self, body):
+        request = urllib.request.Request(f'{self.url}/score', data=json.dumps(body).encode('utf-8'), headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def get(self, path):
+        with urllib.request.urlopen(f'{self.url}{path}') as response:
+            return json.loads(response.read())
+
+    def test_score_matches_analyze_portfolio(self):
+        status, body = self.post({'projects': self.records})
+        self.assertEqual(status, 200)
+        df_results = pd.DataFrame(body['projects'])
+        df_expected = analyze_portfolio(self.df_project, 2, 3, self.df_default_rates, self.df_recovery_potential, engine='analytic').to_dataframe()
+        self.assertEqual(list(df_results['project_id']), list(df_expected['project_id']))
+        self.assertEqual(list(df_results['overall_project_rating']), list(df_expected['overall_project_rating']))
+        self.assertEqual(list(df_results['risk_bucket_2_rating']), list(df_expected['risk_bucket_2_rating']))
+        columns = [f'project_delivery_volume_year_{year}' for year in range(1, 11)]
+        np.testing.assert_allclose(df_results[columns].to_numpy(dtype=float), df_expected[columns].to_numpy(dtype=float))
+
+    def test_concurrent_requests_are_batched(self):
+        results = [None] * 4
+        def score(index):
+            results[index] = self.post({'projects': self.records[3 * index:3 * index + 3]})
+        threads = [threading.Thread(target=score, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([status for status, _ in results], [200] * 4)
+        self.assertEqual([project['project_id'] for _, body in results for project in body['projects']], list(self.df_project['project_id']))
+        metrics = self.get('/metrics')
+        self.assertEqual(metrics['requests'], 4)
+        self.assertEqual(metrics['projects'], 12)
+        self.assertLess(metrics['batches'], 4)
+
+    def test_invalid_requests(self):
+        status, body = self.post({'projects': [dict(self.records[0], contract_duration=-1)]})
+        self.assertEqual(status, 400)
+        self.assertIn('Error', body['error'])
+        self.assertEqual(self.post({'rows': self.records})[0], 400)
+        self.assertEqual(self.post({'projects': []})[0], 400)
+        self.assertEqual(self.get('/metrics')['rejected_requests'], 1)
+
+    def test_health(self):
+        health = self.get('/health')
+        self.assertEqual(health['status'], 'ok')
+        self.assertEqual(health['engine'], 'analytic')
+        with self.assertRaises(urllib.error.HTTPError):
+            self.get('/unknown')
+
+if __name__ == '__main__':
+    unittest.main()
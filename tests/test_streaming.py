@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import patch
+from io import StringIO
+import os
+import tempfile
+import pandas as pd
+from utils.streaming import *
+from utils.io import load_and_process_data
+from utils.analysis import create_group_table, calculate_total_volumes_by_year
+from scripts.generate_project_risk_data import generate_data, generate_model, default_rates, recovery_potential
+
+class TestRunStreamingAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.table_file = os.path.join(self.folder, 'GHG_Data.xlsx')
+        self.df_project = generate_data(60, 2, 3)
+
+        with pd.ExcelWriter(self.table_file) as writer:
+            self.df_project.to_excel(writer, sheet_name='Project Data', index=False)
+            pd.DataFrame(list(default_rates.values()), index=list(default_rates), columns=range(1, 11)).to_excel(writer, sheet_name='Default Rates')
+            pd.DataFrame(list(recovery_potential.values()), index=list(recovery_potential), columns=range(1, 11)).to_excel(writer, sheet_name='Recovery Potential')
+            generate_model(2, 3).to_excel(writer, sheet_name='Model Config', index=False)
+
+    def expected_tables(self):
+        num_buckets, num_factors, df_project, df_default_rates, df_recovery_potential, _ = load_and_process_data(self.table_file)
+        df_project = analyze_portfolio(df_project, num_buckets, num_factors, df_default_rates, df_recovery_potential, engine='analytic').to_dataframe()
+        return df_project
+
+    def test_matches_in_memory_analysis(self):
+        project_file = os.path.join(self.folder, 'projects.csv')
+        self.df_project.to_csv(project_file, index=False)
+        df_counts, top_projects, bottom_projects, country_table, technology_table, counterparty_table, total_volumes_per_year = run_streaming_analysis(
+            project_file, self.table_file, chunk_size=7, engine='analytic')
+
+        df_project = self.expected_tables()
+        self.assertEqual(df_counts['counts'].sum(), 60)
+        self.assertEqual(dict(zip(df_counts['overall_project_rating'], df_counts['counts'])), df_project['overall_project_rating'].value_counts().to_dict())
+        pd.testing.assert_frame_equal(country_table, create_group_table(df_project, 'country'))
+        pd.testing.assert_frame_equal(counterparty_table, create_group_table(df_project, 'counterparty'))
+        pd.testing.assert_frame_equal(total_volumes_per_year, calculate_total_volumes_by_year(df_project))
+        expected_average = df_project[[f'project_expected_value_percentage_year_{i}' for i in range(1, 11)]].mean(axis=1)
+        self.assertEqual(list(top_projects['average_expected_value']), sorted(expected_average, reverse=True)[:10])
+        self.assertEqual(list(bottom_projects['average_expected_value']), sorted(expected_average)[:10])
+
+    def test_parquet_input_and_output(self):
+        project_file = os.path.join(self.folder, 'projects.parquet')
+        project_output_file = os.path.join(self.folder, 'project_data.parquet')
+        self.df_project.to_parquet(project_file, index=False)
+        run_streaming_analysis(project_file, self.table_file, chunk_size=25, engine='analytic', project_output_file=project_output_file)
+
+        pd.testing.assert_frame_equal(pd.read_parquet(project_output_file), self.expected_tables(), check_dtype=False)
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_invalid_chunk(self, mock_stdout):
+        project_file = os.path.join(self.folder, 'projects.csv')
+        self.df_project.loc[45, 'contract_duration'] = 11
+        self.df_project.to_csv(project_file, index=False)
+        self.assertIsNone(run_streaming_analysis(project_file, self.table_file, chunk_size=20, engine='analytic'))
+        self.assertIn('chunk 3', mock_stdout.getvalue())
+
+    def test_unsupported_file(self):
+        with self.assertRaises(ValueError):
+            run_streaming_analysis(self.table_file, self.table_file)
+
+if __name__ == '__main__':
+    unittest.main()
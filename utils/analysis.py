@@ -1,13 +1,37 @@
 import pandas as pd
+import numpy as np
 
-def calculate_top_bottom_projects(df_project: pd.DataFrame, num_projects: int, columns: list) -> tuple[pd.DataFrame, pd.DataFrame]:
+from utils.portfolio import RATING_LABELS, rating_labels
+
+GROUP_DIMENSIONS = ['country', 'technology', 'counterparty']
+GROUP_RANKING_DIMENSIONS = ['country', 'technology']
+
+def calculate_average_expected_value(df_project: pd.DataFrame, num_years: int = 10) -> pd.Series:
+    """
+    Calculate the average expected value percentage of each project over the years within its contract duration.
+
+    Parameters:
+    df_project (pd.DataFrame): The DataFrame containing the project expected value percentages.
+    num_years (int, optional): The number of years. Defaults to 10.
+
+    Returns:
+    pd.Series: The average expected value of each project.
+    """
+    expected_value_columns = [f'project_expected_value_percentage_year_{i}' for i in range(1, num_years + 1)]
+    return df_project[expected_value_columns].mean(axis=1, skipna=True)
+
+def calculate_top_bottom_projects(df_project: pd.DataFrame, num_projects: int, columns: list, average_expected_values: pd.Series = None) -> tuple[pd.DataFrame, pd.DataFrame]:
     """
     Calculate the top and bottom projects based on their average expected value.
 
+    Only the selected projects are sorted: they are picked with np.argpartition, which takes linear time in the number
+    of projects. Projects with the same average expected value are ranked in their order in df_project.
+
     Parameters:
     df_project (pd.DataFrame): The DataFrame containing the project data.
     num_projects (int): The number of top and bottom projects to return.
     columns (list): A list of columns to include in the top and bottom projects DataFrames.
+    average_expected_values (pd.Series, optional): The calculate_average_expected_value of the projects, calculated if not given.
 
     Returns:
     top_projects (pd.DataFrame): The top projects based on their average expected value.
@@ -17,18 +41,132 @@ def calculate_top_bottom_projects(df_project: pd.DataFrame, num_projects: int, c
     if num_projects <= 0:
         raise ValueError('num_projects must be greater than 0')
     
-    expected_value_columns = [f'project_expected_value_percentage_year_{i}' for i in range(1, 11)]
-    average_expected_values = df_project[expected_value_columns].mean(axis=1, skipna=True)
+    if average_expected_values is None:
+        average_expected_values = calculate_average_expected_value(df_project)
 
     top_bottom_projects = df_project[columns].assign(average_expected_value=average_expected_values)
-    top_projects = top_bottom_projects.sort_values(by='average_expected_value', ascending=False).head(num_projects).reset_index(drop=True)
-    top_projects.insert(0, 'rank', range(1, num_projects + 1))
+    values = top_bottom_projects['average_expected_value'].to_numpy(dtype=float)
+
+    top_projects = top_bottom_projects.iloc[_select_ranked(values, num_projects, descending=True)].reset_index(drop=True)
+    top_projects.insert(0, 'rank', range(1, len(top_projects) + 1))
 
-    bottom_projects = top_bottom_projects.sort_values(by='average_expected_value', ascending=True).head(num_projects).reset_index(drop=True)
-    bottom_projects.insert(0, 'rank', range(1, num_projects + 1))
+    bottom_projects = top_bottom_projects.iloc[_select_ranked(values, num_projects, descending=False)].reset_index(drop=True)
+    bottom_projects.insert(0, 'rank', range(1, len(bottom_projects) + 1))
 
     return top_projects, bottom_projects
 
+def calculate_top_bottom_projects_by_group(df_project: pd.DataFrame, group_by: str, num_projects: int, columns: list,
+                                           average_expected_values: pd.Series = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Calculate the top and bottom projects of each group based on their average expected value.
+
+    Parameters:
+    df_project (pd.DataFrame): The DataFrame containing the project data.
+    group_by (str): The column to group by. Must be one of GROUP_DIMENSIONS.
+    num_projects (int): The number of top and bottom projects to return for each group.
+    columns (list): A list of columns to include in the top and bottom projects DataFrames.
+    average_expected_values (pd.Series, optional): The calculate_average_expected_value of the projects, calculated if not given.
+
+    Returns:
+    top_projects (pd.DataFrame): The top projects of each group, with the group and the rank within the group first.
+    bottom_projects (pd.DataFrame): The bottom projects of each group, with the group and the rank within the group first.
+    """
+    if num_projects <= 0:
+        raise ValueError('num_projects must be greater than 0')
+    if group_by not in GROUP_DIMENSIONS:
+        raise ValueError(f"group_by must be one of the following: {', '.join(GROUP_DIMENSIONS)}")
+
+    if average_expected_values is None:
+        average_expected_values = calculate_average_expected_value(df_project)
+
+    top_bottom_projects = df_project[[column for column in columns if column != group_by]].assign(average_expected_value=average_expected_values)
+    top_bottom_projects.insert(0, group_by, df_project[group_by])
+    values = top_bottom_projects['average_expected_value'].to_numpy(dtype=float)
+
+    # Group the projects once, and select the top and bottom projects from the same group positions
+    group_positions = list(df_project.groupby(group_by, sort=True).indices.values())
+
+    ranked_projects = []
+    for descending in [True, False]:
+        group_projects = []
+        for positions in group_positions:
+            selected = positions[_select_ranked(values[positions], num_projects, descending)]
+            group_projects.append(top_bottom_projects.iloc[selected].assign(rank=range(1, len(selected) + 1)))
+        projects = pd.concat(group_projects, ignore_index=True) if group_projects else top_bottom_projects.head(0).assign(rank=[])
+        ranked_projects.append(projects[[group_by, 'rank'] + [column for column in projects.columns if column not in [group_by, 'rank']]])
+
+    return ranked_projects[0], ranked_projects[1]
+
+def create_group_top_bottom_tables(df_project: pd.DataFrame, num_projects: int, columns: list, average_expected_values: pd.Series = None,
+                                   dimensions: list = None) -> dict:
+    """
+    Calculate the top and bottom projects of each group for the report, see calculate_top_bottom_projects_by_group.
+
+    Parameters:
+    df_project (pd.DataFrame): The DataFrame containing the project data.
+    num_projects (int): The number of top and bottom projects to return for each group.
+    columns (list): A list of columns to include in the top and bottom projects DataFrames.
+    average_expected_values (pd.Series, optional): The calculate_average_expected_value of the projects, calculated if not given.
+    dimensions (list, optional): The columns to group by, each one of GROUP_DIMENSIONS. Defaults to GROUP_RANKING_DIMENSIONS.
+
+    Returns:
+    dict: The 'highest_performing_by_<dimension>' and 'lowest_performing_by_<dimension>' tables of each dimension.
+    """
+    if average_expected_values is None:
+        average_expected_values = calculate_average_expected_value(df_project)
+
+    tables = {}
+    for dimension in GROUP_RANKING_DIMENSIONS if dimensions is None else dimensions:
+        top_projects, bottom_projects = calculate_top_bottom_projects_by_group(df_project, dimension, num_projects, columns, average_expected_values)
+        tables[f'highest_performing_by_{dimension}'] = top_projects
+        tables[f'lowest_performing_by_{dimension}'] = bottom_projects
+    return tables
+
+def _select_ranked(values: np.ndarray, num_projects: int, descending: bool) -> np.ndarray:
+    """
+    Return the positions of the num_projects largest (or smallest) values in rank order, with NaN values last.
+    """
+    # Replace NaN with infinity so that it is never picked before a value, and negate the values to pick the largest
+    keys = np.where(np.isnan(values), np.inf, -values if descending else values)
+    if num_projects < len(keys):
+        selected = np.sort(np.argpartition(keys, num_projects - 1)[:num_projects])
+    else:
+        selected = np.arange(len(keys))
+
+    # Sort only the selected projects, keeping projects with the same value in their original order
+    return selected[np.argsort(keys[selected], kind='stable')]
+
+def count_overall_ratings(rating_codes: np.ndarray) -> np.ndarray:
+    """
+    Count the projects with each overall project rating from the integer rating codes.
+
+    The counts of several chunks of projects can be added up, and the rating counts table built with create_counts_table.
+
+    Parameters:
+    rating_codes (np.ndarray): The overall project ratings as int8 codes into RATING_LABELS, as in Portfolio.overall_rating.
+                               Negative codes, for projects without a rating, are not counted.
+
+    Returns:
+    np.ndarray: The number of projects with each rating, in the order of RATING_LABELS.
+    """
+    rating_codes = np.asarray(rating_codes)
+    return np.bincount(rating_codes[rating_codes >= 0], minlength=len(RATING_LABELS))
+
+def create_counts_table(rating_counts: np.ndarray) -> pd.DataFrame:
+    """
+    Creates the table of the number of projects with each overall project rating, from the most to the fewest projects.
+
+    Parameters:
+    rating_counts (np.ndarray): The number of projects with each rating, in the order of RATING_LABELS, as from count_overall_ratings.
+
+    Returns:
+    pandas DataFrame: A DataFrame with the 'overall_project_rating' labels and the 'counts', in the same order as value_counts.
+    """
+    # Attach the labels only to the sorted counts, ratings with the same count stay in the order of RATING_LABELS
+    rating_counts = np.asarray(rating_counts)
+    order = np.argsort(-rating_counts, kind='stable')
+    return pd.DataFrame({'overall_project_rating': rating_labels(order), 'counts': rating_counts[order]})
+
 def create_group_table(df_project: pd.DataFrame, group_by: str) -> pd.DataFrame:
     """
     Creates a table showing the total offered volume, total projects, and percentage of each rating for each group.
@@ -40,33 +178,157 @@ def create_group_table(df_project: pd.DataFrame, group_by: str) -> pd.DataFrame:
     Returns:
     pandas DataFrame: A DataFrame containing the total offered volume, total projects, and percentage of each rating for each group.
     """
+    return create_group_tables(df_project, [group_by])[group_by]
+
+def create_group_tables(df_project: pd.DataFrame, dimensions: list = None) -> dict:
+    """
+    Creates the group tables of several dimensions in one pass over the project data.
+
+    The total offered volume of each project is calculated once and each group column is encoded as integer codes once.
+    Every group table is then a count of the codes, so adding a dimension does not add another scan of the projects.
+    A dimension can also be a tuple of group columns, such as ('country', 'technology'), for a table of every observed
+    combination of the groups.
+
+    Parameters:
+    df_project (pandas DataFrame): A DataFrame containing the project data, with the same columns as for create_group_table.
+    dimensions (list, optional): The group columns or tuples of group columns. Each must be in GROUP_DIMENSIONS. Defaults to GROUP_DIMENSIONS.
+
+    Returns:
+    dict: The group table of each dimension, with the same format as create_group_table, by dimension.
+    """
+    if dimensions is None:
+        dimensions = GROUP_DIMENSIONS
+
+    # Check for valid groups
+    for dimension in dimensions:
+        for group_by in _dimension_columns(dimension):
+            if group_by not in GROUP_DIMENSIONS:
+                raise ValueError(f"group_by must be one of the following: {', '.join(GROUP_DIMENSIONS)}")
+
+    # Calculate the total offered volume for each project, and encode the ratings and groups, only once
+    total_offered_volume = df_project[[f'offered_volume_year_{i}' for i in range(1, 11)]].sum(axis=1).to_numpy()
+    ratings = df_project['overall_project_rating']
+    if isinstance(ratings.dtype, pd.CategoricalDtype):
+        rating_codes, rating_labels = ratings.cat.codes.to_numpy(), ratings.cat.categories
+    else:
+        rating_codes, rating_labels = pd.factorize(ratings, sort=True)
+    group_codes = {group_by: pd.factorize(df_project[group_by], sort=True)
+                   for dimension in dimensions for group_by in _dimension_columns(dimension)}
+
+    group_tables = {}
+    for dimension in dimensions:
+        group_columns = _dimension_columns(dimension)
+
+        # Combine the codes of the group columns into a single code, leaving out projects with a missing group
+        codes = np.zeros(len(df_project), dtype=np.int64)
+        grouped = np.ones(len(df_project), dtype=bool)
+        for group_by in group_columns:
+            column_codes, groups = group_codes[group_by]
+            codes = codes * len(groups) + column_codes
+            grouped &= column_codes >= 0
+        observed_codes, group_index = np.unique(codes[grouped], return_inverse=True)
+        num_groups = len(observed_codes)
+
+        # Count the projects of each group and rating, projects without a rating only count towards the volume
+        group_ratings = rating_codes[grouped]
+        rated = group_ratings >= 0
+        rating_counts = np.bincount(group_index[rated] * len(rating_labels) + group_ratings[rated],
+                                    minlength=num_groups * len(rating_labels)).reshape(num_groups, len(rating_labels))
+
+        # Decode the combined codes back into the group values
+        group_values = {}
+        for group_by in reversed(group_columns):
+            groups = group_codes[group_by][1]
+            group_values[group_by] = np.asarray(groups)[observed_codes % len(groups)]
+            observed_codes = observed_codes // len(groups)
+        group_values = {group_by: group_values[group_by] for group_by in group_columns}
+
+        group_table = pd.DataFrame({
+            **group_values,
+            'Total Offered Volume': np.bincount(group_index, weights=total_offered_volume[grouped], minlength=num_groups).astype(total_offered_volume.dtype),
+            'Total Projects': rating_counts.sum(axis=1)
+        })
+        group_rating_counts = pd.DataFrame(rating_counts, columns=pd.Index(rating_labels, name='overall_project_rating'))
+        for position, group_by in enumerate(group_columns):
+            group_rating_counts.insert(position, group_by, group_values[group_by])
+
+        group_tables[dimension] = _format_group_table(group_table, group_rating_counts, dimension)
+
+    return group_tables
+
+def _dimension_columns(dimension) -> list:
+    """
+    Return the group columns of a dimension, which is a group column or a tuple of group columns.
+    """
+    return [dimension] if isinstance(dimension, str) else list(dimension)
+
+def summarize_group_ratings(df_project: pd.DataFrame, group_by: str) -> pd.DataFrame:
+    """
+    Summarize the total offered volume and number of projects for each group and overall project rating.
+
+    The summaries of several chunks of projects can be combined with combine_group_summaries, and the group table built
+    with create_group_table_from_summary, without keeping the projects themselves.
+
+    Parameters:
+    df_project (pandas DataFrame): A DataFrame containing the project data, with the same columns as for create_group_table.
+    group_by (str): The column to group by. Must be either 'country', 'technology', or 'counterparty'.
+
+    Returns:
+    pandas DataFrame: A DataFrame indexed by group and overall project rating, with 'total_offered_volume' and 'counts' columns.
+    """
     # Check for valid groups
-    valid_groups = ['country', 'technology', 'counterparty']
-    if group_by not in valid_groups:
-        raise ValueError(f"group_by must be one of the following: {', '.join(valid_groups)}")
+    if group_by not in GROUP_DIMENSIONS:
+        raise ValueError(f"group_by must be one of the following: {', '.join(GROUP_DIMENSIONS)}")
 
-    # Calculate the total offered volume for each project
     total_offered_volume = df_project[[f'offered_volume_year_{i}' for i in range(1, 11)]].sum(axis=1)
+    return df_project.assign(total_offered_volume=total_offered_volume).groupby([group_by, 'overall_project_rating'], observed=False).agg(
+        total_offered_volume=('total_offered_volume', 'sum'),
+        counts=('total_offered_volume', 'size')
+    )
 
-    # Create the group table with total offered volume and total projects
-    group_table = df_project.assign(total_offered_volume=total_offered_volume).groupby(group_by).agg({
-        'total_offered_volume': 'sum',
-        'overall_project_rating': 'count'
+def combine_group_summaries(summaries: list) -> pd.DataFrame:
+    """
+    Combine group summaries from summarize_group_ratings, adding up the volumes and counts of the same group and rating.
+
+    Parameters:
+    summaries (list): A list of group summaries of the same group column.
+
+    Returns:
+    pandas DataFrame: The combined group summary.
+    """
+    return pd.concat(summaries).groupby(level=[0, 1], observed=False).sum()
+
+def create_group_table_from_summary(summary: pd.DataFrame, group_by: str) -> pd.DataFrame:
+    """
+    Creates the group table of create_group_table from a group summary.
+
+    Parameters:
+    summary (pandas DataFrame): A group summary from summarize_group_ratings or combine_group_summaries.
+    group_by (str): The column the summary is grouped by.
+
+    Returns:
+    pandas DataFrame: A DataFrame containing the total offered volume, total projects, and percentage of each rating for each group.
+    """
+    summary = summary.reset_index()
+    group_table = summary.groupby(group_by).agg(**{
+        'Total Offered Volume': ('total_offered_volume', 'sum'),
+        'Total Projects': ('counts', 'sum')
     }).reset_index()
-    group_table = group_table.rename(columns={
-        'total_offered_volume': 'Total Offered Volume',
-        'overall_project_rating': 'Total Projects'
-    })
+    group_rating_counts = summary.pivot(index=group_by, columns='overall_project_rating', values='counts').reset_index()
 
-    # Create the group rating counts table
-    group_rating_counts = df_project.groupby([group_by, 'overall_project_rating'], observed=False).size().reset_index(name='counts')
-    group_rating_counts = group_rating_counts.pivot(index=group_by, columns='overall_project_rating', values='counts').reset_index()
+    return _format_group_table(group_table, group_rating_counts, group_by)
+
+def _format_group_table(group_table: pd.DataFrame, group_rating_counts: pd.DataFrame, group_by) -> pd.DataFrame:
+    """
+    Merge the group totals with the group rating counts and convert the counts into percentages of the total projects.
+    """
+    group_columns = _dimension_columns(group_by)
 
     # Merge the two tables
-    group_table = pd.merge(group_table, group_rating_counts, on=group_by).fillna(0)
+    group_table = pd.merge(group_table, group_rating_counts, on=group_columns).fillna(0)
 
     # Format the tables
-    rating_columns = [col for col in group_table.columns if col not in ['Total Offered Volume', 'Total Projects', group_by]]
+    rating_columns = [col for col in group_table.columns if col not in ['Total Offered Volume', 'Total Projects'] + group_columns]
     for col in rating_columns:
         # Calculate the percentage of each rating
         group_table[col] = round((group_table[col] / group_table['Total Projects']) * 100, 2)
@@ -76,12 +338,43 @@ def create_group_table(df_project: pd.DataFrame, group_by: str) -> pd.DataFrame:
 
     return group_table
 
-def calculate_total_volumes_by_year(df_project: pd.DataFrame) -> pd.DataFrame:
+def calendar_year_index(df_project: pd.DataFrame, num_years: int = None) -> tuple[np.ndarray, np.ndarray, int, int]:
+    """
+    Map every project year within the contract duration to its calendar year.
+
+    The index only depends on the start years and contract durations, so it can be calculated once and reused by
+    calculate_total_volumes_by_year for several sets of volumes of the same projects, for example one per scenario.
+
+    Parameters:
+    df_project (pandas DataFrame): A DataFrame containing the 'start_year' and 'contract_duration' of each project.
+    num_years (int, optional): The number of project years. Defaults to the longest contract duration.
+
+    Returns:
+    active (np.ndarray): True for the project years within the contract duration, shape (projects, years).
+    year_offsets (np.ndarray): The calendar year of each active project year, as an offset from first_year, in project order.
+    first_year (int): The first calendar year.
+    last_year (int): The last calendar year.
+    """
+    start_years = df_project['start_year'].to_numpy()
+    contract_durations = df_project['contract_duration'].to_numpy()
+    if num_years is None:
+        num_years = int(contract_durations.max())
+
+    first_year = int(start_years.min())
+    last_year = int((start_years + contract_durations - 1).max())
+
+    active = np.arange(num_years) < contract_durations[:, None]
+    year_offsets = (start_years[:, None] - first_year + np.arange(num_years))[active]
+
+    return active, year_offsets, first_year, last_year
+
+def calculate_total_volumes_by_year(df_project: pd.DataFrame, year_index: tuple = None) -> pd.DataFrame:
     """
     Calculate the total offered volume and overall project delivery for each calendar year.
 
     Parameters:
     df_project (pandas DataFrame): A DataFrame containing the project data.
+    year_index (tuple, optional): The calendar_year_index of the projects. Calculated from df_project if not given.
 
     Returns:
     pandas DataFrame: A DataFrame with the total offered volume and overall project delivery for each calendar year.
@@ -91,21 +384,60 @@ def calculate_total_volumes_by_year(df_project: pd.DataFrame) -> pd.DataFrame:
     if df_project.empty:
         return pd.DataFrame(columns=['Year', 'Total Offered Volume', 'Overall Project Delivery'])
 
-    # Calculate the end year for each project
-    end_years = df_project['start_year'] + df_project['contract_duration'] - 1
-    
-    # Initialize a DataFrame to store the total volumes by year
-    total_volumes_by_year = pd.DataFrame(index=range(df_project['start_year'].min(), end_years.max() + 1), columns=['Total Offered Volume', 'Overall Project Delivery'])
-    total_volumes_by_year[['Total Offered Volume', 'Overall Project Delivery']] = 0.0
+    if year_index is None:
+        year_index = calendar_year_index(df_project)
+    active, year_offsets, first_year, last_year = year_index
+    num_years = active.shape[1]
+    num_calendar_years = last_year - first_year + 1
+
+    # Add the volumes of every active project year to its calendar year, in project order
+    total_volumes_by_year = pd.DataFrame({'Year': np.arange(first_year, last_year + 1)})
+    for column, name in [('Total Offered Volume', 'offered_volume'), ('Overall Project Delivery', 'project_delivery_volume')]:
+        volumes = df_project[[f'{name}_year_{i}' for i in range(1, num_years + 1)]].to_numpy(dtype=float)
+        total_volumes_by_year[column] = np.bincount(year_offsets, weights=volumes[active], minlength=num_calendar_years)
 
-    # Iterate over each project and calculate the total volumes by year
-    for _, row in df_project.iterrows():
-        for i in range(row['contract_duration']):
-            year = row['start_year'] + i
-            total_volumes_by_year.loc[year, 'Total Offered Volume'] += row[f'offered_volume_year_{i+1}']
-            total_volumes_by_year.loc[year, 'Overall Project Delivery'] += row[f'project_delivery_volume_year_{i+1}']
+    return total_volumes_by_year
+
+def combine_total_volumes_by_year(tables: list) -> pd.DataFrame:
+    """
+    Combine tables from calculate_total_volumes_by_year, adding up the volumes of the same calendar year.
 
-    # Reset the index and rename the columns
-    total_volumes_by_year = total_volumes_by_year.reset_index().rename(columns={'index': 'Year'})
+    Parameters:
+    tables (list): A list of DataFrames from calculate_total_volumes_by_year.
+
+    Returns:
+    pandas DataFrame: A DataFrame with the total offered volume and overall project delivery for each calendar year.
+    """
+    tables = [table for table in tables if not table.empty]
+    if not tables:
+        return pd.DataFrame(columns=['Year', 'Total Offered Volume', 'Overall Project Delivery'])
+
+    total_volumes_by_year = pd.concat(tables).groupby('Year')[['Total Offered Volume', 'Overall Project Delivery']].sum()
+
+    # Keep every year between the first and last year, as calculate_total_volumes_by_year does
+    years = pd.RangeIndex(total_volumes_by_year.index.min(), total_volumes_by_year.index.max() + 1, name='Year')
+    return total_volumes_by_year.reindex(years, fill_value=0.0).reset_index()
+
+def calculate_top_bottom_candidates(df_project: pd.DataFrame, num_projects: int, columns: list) -> pd.DataFrame:
+    """
+    Select the projects that can be among the top or bottom projects of calculate_top_bottom_projects.
+
+    Running calculate_top_bottom_projects on the combined candidates of several chunks of projects gives the top and bottom
+    projects of all the chunks.
+
+    Parameters:
+    df_project (pd.DataFrame): The DataFrame containing the project data.
+    num_projects (int): The number of top and bottom projects.
+    columns (list): A list of columns to keep for the top and bottom projects DataFrames.
+
+    Returns:
+    pd.DataFrame: The top and bottom projects, with the columns and the yearly expected value percentages.
+    """
+    if num_projects <= 0:
+        raise ValueError('num_projects must be greater than 0')
+
+    expected_value_columns = [f'project_expected_value_percentage_year_{i}' for i in range(1, 11)]
+    values = calculate_average_expected_value(df_project).to_numpy(dtype=float)
 
-    return total_volumes_by_year
\ No newline at end of file
+    candidates = np.union1d(_select_ranked(values, num_projects, descending=True), _select_ranked(values, num_projects, descending=False))
+    return df_project[columns + expected_value_columns].iloc[candidates].reset_index(drop=True)
\ No newline at end of file
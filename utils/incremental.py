@@ -0,0 +1,212 @@
+import os
+import json
+import hashlib
+import logging
+from dataclasses import replace
+import pandas as pd
+import numpy as np
+
+from utils.portfolio import Portfolio
+from utils.risk_calculation import analyze_portfolio, prepare_portfolio, simulate_portfolio, rate_portfolio, ADAPTIVE_TOLERANCE
+
+# The engines whose results with a seed depend on the position of a project among the simulated projects
+POSITIONAL_ENGINES = ['loop', 'vectorized', 'adaptive', 'memoized']
+# The Portfolio arrays with one row per project which are needed for the simulation
+PROJECT_ARRAYS = ['active', 'offered_volume', 'factors', 'weights', 'scores', 'ratings', 'shortfall', 'expected_value', 'standard_deviation']
+
+def project_fingerprints(df_project: pd.DataFrame, num_buckets: int, num_factors: int, num_years: int = 10) -> np.ndarray:
+    """
+    Calculate a fingerprint of the inputs of each project: the contract duration, offered volumes, risk factors and weights.
+
+    Parameters:
+    df_project (pd.DataFrame): The project data.
+    num_buckets (int): The number of risk buckets.
+    num_factors (int): The number of risk factors in each risk bucket.
+    num_years (int, optional): The number of years. Defaults to 10.
+
+    Returns:
+    np.ndarray: A uint64 fingerprint for each project, which changes when any of its inputs change.
+    """
+    columns = ['contract_duration'] + [f'offered_volume_year_{year}' for year in range(1, num_years + 1)]
+    for bucket in range(1, num_buckets + 1):
+        for factor in range(1, num_factors + 1):
+            columns += [f'risk_bucket_{bucket}_factor_{factor}', f'risk_bucket_{bucket}_weight_{factor}']
+    # Hash the values as floats, so that an integer column which becomes a float column does not change every fingerprint
+    return pd.util.hash_pandas_object(df_project[columns].astype(float), index=False).to_numpy()
+
+def table_fingerprint(df_default_rates: pd.DataFrame, df_recovery_potential: pd.DataFrame, num_buckets: int, num_factors: int,
+                      engine: str, num_samples: int = 10000, tolerance: float = ADAPTIVE_TOLERANCE,
+                      sampler: str = 'random', precision: str = 'float64', seed: int = None) -> str:
+    """
+    Calculate a fingerprint of the inputs shared by all projects: the default rates and recovery potential tables, the
+    model dimensions and the simulation settings.
+
+    Parameters:
+    df_default_rates (pd.DataFrame): The DataFrame containing the default rates.
+    df_recovery_potential (pd.DataFrame): The DataFrame containing the recovery potentials.
+    num_buckets (int): The number of risk buckets.
+    num_factors (int): The number of risk factors in each risk bucket.
+    engine (str): The simulation engine.
+    num_samples (int, optional): The number of random samples. Defaults to 10000.
+    tolerance (float, optional): The tolerance of the adaptive engine. Defaults to ADAPTIVE_TOLERANCE.
+    sampler (str, optional): The sampler of the vectorized and crn engines. Defaults to 'random'.
+    precision (str, optional): The precision of the vectorized engine. Defaults to 'float64'.
+    seed (int, optional): The random seed. Defaults to None.
+
+    Returns:
+    str: The hexadecimal fingerprint.
+    """
+    sha256 = hashlib.sha256(f'{num_buckets}|{num_factors}|{engine}|{num_samples}|{tolerance}|{sampler}|{precision}|{seed}'.encode())
+    for df in [df_default_rates, df_recovery_potential]:
+        sha256.update(pd.util.hash_pandas_object(df.reset_index(), index=False).to_numpy().tobytes())
+        sha256.update(str(list(df.index) + list(df.columns)).encode())
+    return sha256.hexdigest()
+
+def project_seeds(seed: int, fingerprints: np.ndarray) -> np.ndarray:
+    """
+    Derive the random seed of each project from the run seed and the project fingerprint.
+
+    Parameters:
+    seed (int): The random seed of the run.
+    fingerprints (np.ndarray): The project_fingerprints.
+
+    Returns:
+    np.ndarray: A uint64 seed for each project, which only depends on the run seed and the inputs of the project.
+    """
+    return np.array([np.random.SeedSequence([seed, int(fingerprint)]).generate_state(1, np.uint64)[0] for fingerprint in fingerprints], dtype=np.uint64)
+
+def analyze_portfolio_incremental(df_project: pd.DataFrame, num_buckets: int, num_factors: int, df_default_rates: pd.DataFrame,
+                                  df_recovery_potential: pd.DataFrame, state_file: str, engine: str = 'vectorized', num_samples: int = 10000,
+                                  num_years: int = 10, memory_budget_mb: float = None, workers: int = 1, seed: int = None,
+                                  tolerance: float = ADAPTIVE_TOLERANCE, sampler: str = 'random',
+                                  precision: str = 'float64') -> tuple[pd.DataFrame, int]:
+    """
+    Run the pipeline stages only for the projects whose inputs changed since the last run, and reuse the saved results of the others.
+
+    The results of every project are saved to state_file (Parquet, with a '.json' file next to it for the table fingerprint)
+    together with the project fingerprints. A project is recalculated if it is new, if its fingerprint changed, or if the
+    table fingerprint changed, in which case all projects are recalculated.
+
+    With a seed and the loop, vectorized, adaptive or memoized engine, each recalculated project is simulated on its own
+    with a seed derived from the run seed and its fingerprint (see project_seeds), so that its results do not depend on
+    which other projects changed. These results differ from those of analyze_portfolio with the same seed, which
+    simulates all projects from one random stream, and the projects are simulated without worker processes.
+
+    Parameters:
+    df_project (pd.DataFrame): The project data, with unique project IDs.
+    num_buckets (int): The number of risk buckets.
+    num_factors (int): The number of risk factors in each risk bucket.
+    df_default_rates (DataFrame): The DataFrame containing the default rates.
+    df_recovery_potential (DataFrame): The DataFrame containing the recovery potentials.
+    state_file (str): The Parquet file with the results of the last run.
+    engine (str, optional): The simulation engine, one of SIMULATION_ENGINES. Defaults to 'vectorized'.
+    num_samples (int, optional): The number of random samples to generate. Defaults to 10000.
+    num_years (int, optional): The number of years. Defaults to 10.
+    memory_budget_mb (float, optional): The memory budget per block of samples for the vectorized engine. Defaults to None.
+    workers (int, optional): The number of worker processes for the vectorized engine. Defaults to 1.
+    seed (int, optional): The random seed for the loop, vectorized, crn, adaptive and memoized engines. Defaults to None.
+    tolerance (float, optional): The target standard error of the expected value percentage for the adaptive engine. Defaults to ADAPTIVE_TOLERANCE.
+    sampler (str, optional): The sampler for the vectorized, crn and memoized engines, one of SAMPLERS. Defaults to 'random'.
+    precision (str, optional): The precision of the draws for the vectorized and memoized engines, one of SIMULATION_PRECISIONS. Defaults to 'float64'.
+
+    Returns:
+    df_project (pd.DataFrame): The project data with the result columns of all projects, as from Portfolio.to_dataframe.
+    num_recalculated (int): The number of projects that were recalculated.
+
+    Raises:
+    ValueError: If the project data is empty or the project IDs are not unique.
+    """
+    if df_project.empty:
+        raise ValueError("The project data has no projects")
+    if df_project['project_id'].duplicated().any():
+        duplicates = df_project.loc[df_project['project_id'].duplicated(), 'project_id'].unique()
+        raise ValueError(f"The project IDs must be unique for an incremental run, duplicated: {list(duplicates)}")
+
+    fingerprints = project_fingerprints(df_project, num_buckets, num_factors, num_years)
+    tables = table_fingerprint(df_default_rates, df_recovery_potential, num_buckets, num_factors, engine, num_samples, tolerance, sampler, precision, seed)
+
+    # Reuse the results of the projects with the same ID and fingerprint as in the last run
+    df_previous = load_incremental_state(state_file, tables)
+    if df_previous is not None:
+        previous_fingerprints = pd.Series(df_previous['fingerprint'].to_numpy(), index=df_previous['project_id'])
+        reuse = previous_fingerprints.reindex(df_project['project_id']).to_numpy() == fingerprints
+    else:
+        reuse = np.zeros(len(df_project), dtype=bool)
+
+    results = []
+    if (~reuse).any() and (seed is None or engine not in POSITIONAL_ENGINES):
+        df_changed = analyze_portfolio(df_project[~reuse], num_buckets, num_factors, df_default_rates, df_recovery_potential, engine, num_samples,
+                                       num_years, memory_budget_mb, workers, seed, tolerance, sampler,
+                                       precision).to_dataframe()
+        results.append(df_changed.drop(columns=df_project.columns))
+    elif (~reuse).any():
+        # Simulate each changed project with its own seed, so that its results only depend on its own inputs
+        portfolio = prepare_portfolio(df_project[~reuse], num_buckets, num_factors, df_default_rates, df_recovery_potential, num_years)
+        portfolio = _simulate_each_project(portfolio, project_seeds(seed, fingerprints[~reuse]), engine, num_samples, memory_budget_mb,
+                                           tolerance, sampler, precision)
+        results.append(rate_portfolio(portfolio).to_dataframe().drop(columns=df_project.columns))
+    if reuse.any():
+        df_reused = df_previous.set_index('project_id').loc[df_project.loc[reuse, 'project_id']].drop(columns='fingerprint')
+        results.append(df_reused.set_axis(df_project.index[reuse]))
+
+    # Put the results back in the order of the projects
+    df_results = pd.concat(results).reindex(df_project.index) if len(results) > 1 else results[0]
+    df_project = pd.concat([df_project, df_results], axis=1)
+
+    save_incremental_state(state_file, tables, df_project['project_id'], fingerprints, df_results)
+    num_recalculated = int((~reuse).sum())
+    logging.info(f"Incremental run: {num_recalculated} of {len(df_project)} projects recalculated")
+
+    return df_project, num_recalculated
+
+def _simulate_each_project(portfolio: Portfolio, seeds: np.ndarray, engine: str, num_samples: int, memory_budget_mb: float,
+                           tolerance: float, sampler: str, precision: str) -> Portfolio:
+    """
+    Simulate every project of a portfolio on its own with its seed, and fill in the simulation results of the portfolio.
+    """
+    simulated = [simulate_portfolio(replace(portfolio, projects=portfolio.projects.iloc[[position]],
+                                            **{name: getattr(portfolio, name)[[position]] for name in PROJECT_ARRAYS}),
+                                    engine, num_samples, memory_budget_mb, 1, int(seed), tolerance, sampler, precision)
+                 for position, seed in enumerate(seeds)]
+    for name in ['project_standard_deviation', 'project_delivery_volume', 'project_expected_value_percentage', 'simulation_samples']:
+        if getattr(simulated[0], name) is not None:
+            setattr(portfolio, name, np.concatenate([getattr(project, name) for project in simulated]))
+    return portfolio
+
+def load_incremental_state(state_file: str, tables: str) -> pd.DataFrame:
+    """
+    Load the results saved by the last incremental run.
+
+    Parameters:
+    state_file (str): The Parquet file with the results of the last run.
+    tables (str): The table_fingerprint of the current run.
+
+    Returns:
+    pd.DataFrame: The project IDs, fingerprints and results of the last run, or None if there is no state or the table fingerprint changed.
+    """
+    metadata_file = os.path.splitext(state_file)[0] + '.json'
+    if not (os.path.exists(state_file) and os.path.exists(metadata_file)):
+        return None
+    with open(metadata_file) as f:
+        if json.load(f).get('tables') != tables:
+            logging.info("Incremental run: the default rates, recovery potential or simulation settings changed")
+            return None
+    return pd.read_parquet(state_file)
+
+def save_incremental_state(state_file: str, tables: str, project_ids: pd.Series, fingerprints: np.ndarray, df_results: pd.DataFrame) -> None:
+    """
+    Save the results of an incremental run for the next run.
+
+    Parameters:
+    state_file (str): The Parquet file to save the results to.
+    tables (str): The table_fingerprint of the run.
+    project_ids (pd.Series): The project IDs.
+    fingerprints (np.ndarray): The project_fingerprints.
+    df_results (pd.DataFrame): The result columns of each project, in the same order as the project IDs.
+    """
+    os.makedirs(os.path.dirname(state_file) or '.', exist_ok=True)
+    df_state = pd.concat([pd.DataFrame({'project_id': project_ids.to_numpy(), 'fingerprint': fingerprints}),
+                          df_results.reset_index(drop=True)], axis=1)
+    df_state.to_parquet(state_file, index=False)
+    with open(os.path.splitext(state_file)[0] + '.json', 'w') as f:
+        json.dump({'tables': tables}, f)
@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import logging
+import cProfile
+import pstats
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+import pandas as pd
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # The resource module is not available on Windows, the peak RSS is then not recorded
+    resource = None
+
+RUN_REPORT_FILE = 'run_report.json'
+PROFILE_FOLDER = 'profiles'
+
+@dataclass
+class StageRecord:
+    """
+    The measurements of one pipeline stage.
+
+    Attributes:
+    stage (str): The name of the stage.
+    wall_seconds (float): The elapsed wall time.
+    cpu_seconds (float): The CPU time of the process, including the time of finished worker processes.
+    rss_start_mb (float): The resident set size of the process at the start of the stage, or None if it is not available.
+    rss_end_mb (float): The resident set size of the process at the end of the stage, or None if it is not available.
+    peak_rss_mb (float): The peak resident set size of the process during the stage, or None if it is not available.
+    shape (list): The shape of the stage result, or None if it was not recorded.
+    """
+    stage: str
+    wall_seconds: float = None
+    cpu_seconds: float = None
+    rss_start_mb: float = None
+    rss_end_mb: float = None
+    peak_rss_mb: float = None
+    shape: list = None
+
+    def set_shape(self, data) -> None:
+        """
+        Record the shape of a stage result.
+
+        Parameters:
+        data (pd.DataFrame or np.ndarray): The stage result, for example the (rows, columns) of a DataFrame, or the
+                                           (projects, buckets, years) Portfolio array filled in by the stage.
+        """
+        if isinstance(data, (pd.DataFrame, np.ndarray)):
+            self.shape = list(data.shape)
+
+@dataclass
+class RunReport:
+    """
+    Per-stage timing and memory measurements of a pipeline run.
+
+    Each stage is measured with the stage context manager, logged when it finishes, and written to
+    RUN_REPORT_FILE in the output folder by save. With profile set, the stages marked as profiled also
+    run under cProfile and their stats are saved to the PROFILE_FOLDER of the output folder.
+
+    The peak RSS of a stage is measured by resetting the peak RSS of the process when the stage starts
+    (see reset_peak_rss), which also resets ru_maxrss, so the report keeps track of the peak RSS of the
+    whole run itself. Stages must not be nested.
+
+    Attributes:
+    settings (dict): The run settings to include in the report.
+    profile (bool): Whether to profile the stages marked as profiled.
+    stages (list): The StageRecord of each finished stage.
+    profiles (dict): The pstats.Stats of each profiled stage.
+    """
+    settings: dict = field(default_factory=dict)
+    profile: bool = False
+    stages: list = field(default_factory=list)
+    profiles: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.created = datetime.now()
+        self._start = time.perf_counter()
+        self._process_peak_rss_mb = process_peak_rss_mb()
+
+    @contextmanager
+    def stage(self, name: str, profile: bool = False):
+        """
+        Measure the wall time, CPU time and RSS of a pipeline stage.
+
+        Parameters:
+        name (str): The name of the stage.
+        profile (bool, optional): Whether to run the stage under cProfile if the report profiles. Defaults to False.
+
+        Yields:
+        StageRecord: The record of the stage, whose set_shape records the size of the stage result.
+
+        Notes:
+        A stage that raises is not recorded. The memory of worker processes is not included in the RSS.
+        """
+        # Keep the peak of the run so far before resetting the peak for the stage
+        self._process_peak_rss_mb = _max_mb(self._process_peak_rss_mb, process_peak_rss_mb())
+        peak_reset = reset_peak_rss()
+        record = StageRecord(name, rss_start_mb=current_rss_mb())
+        profiler = cProfile.Profile() if profile and self.profile else None
+        wall_start, cpu_start = time.perf_counter(), _cpu_seconds()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        record.wall_seconds = time.perf_counter() - wall_start
+        record.cpu_seconds = _cpu_seconds() - cpu_start
+        record.rss_end_mb = current_rss_mb()
+        record.peak_rss_mb = peak_rss_mb() if peak_reset else None
+        self._process_peak_rss_mb = _max_mb(self._process_peak_rss_mb, record.peak_rss_mb)
+        self.stages.append(record)
+        if profiler is not None:
+            self.profiles[name] = pstats.Stats(profiler)
+
+        shape = f", shape {' x '.join(map(str, record.shape))}" if record.shape is not None else ""
+        rss = f", RSS {record.rss_start_mb:.1f} to {record.rss_end_mb:.1f} MB" if record.rss_end_mb is not None else ""
+        peak = f", peak RSS {record.peak_rss_mb:.1f} MB" if record.peak_rss_mb is not None else ""
+        logging.info(f"Stage {name}: {record.wall_seconds:.3f} s wall, {record.cpu_seconds:.3f} s CPU{rss}{peak}{shape}")
+
+    def to_dict(self) -> dict:
+        """
+        Convert the report to a JSON serializable dict.
+
+        Returns:
+        dict: The creation time, total wall time, peak RSS of the run, settings and stage records.
+        """
+        return {
+            'created': self.created.isoformat(timespec='seconds'),
+            'total_wall_seconds': time.perf_counter() - self._start,
+            'process_peak_rss_mb': _max_mb(self._process_peak_rss_mb, process_peak_rss_mb()),
+            'settings': self.settings,
+            'stages': [asdict(record) for record in self.stages]
+        }
+
+    def save(self, output_folder: str) -> str:
+        """
+        Save the report, and the profiles of the profiled stages, to the output folder.
+
+        Parameters:
+        output_folder (str): The output folder of the run.
+
+        Returns:
+        str: The path of the report file.
+        """
+        report_file = os.path.join(output_folder, RUN_REPORT_FILE)
+        with open(report_file, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+        if self.profiles:
+            profile_folder = os.path.join(output_folder, PROFILE_FOLDER)
+            os.makedirs(profile_folder, exist_ok=True)
+            for name, stats in self.profiles.items():
+                stats.dump_stats(os.path.join(profile_folder, f'{name}.prof'))
+        logging.info(f"Run report saved to {report_file}")
+        return report_file
+
+def current_rss_mb() -> float:
+    """
+    Get the current resident set size of the process from /proc/self/statm.
+
+    Returns:
+    float: The RSS in megabytes, or None if /proc/self/statm is not available, as on Windows and macOS.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the peak resident set size of the process to its current RSS, by writing 5 to /proc/self/clear_refs.
+
+    Returns:
+    bool: Whether the peak was reset, False if /proc/self/clear_refs is not available, as on Windows and macOS.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+def peak_rss_mb() -> float:
+    """
+    Get the peak resident set size of the process since it started or since the last reset_peak_rss, from VmHWM in /proc/self/status.
+
+    Returns:
+    float: The peak RSS in megabytes, or None if /proc/self/status is not available, as on Windows and macOS.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    # The peak is given in kB
+                    return int(line.split()[1]) / 1024
+    except (OSError, IndexError, ValueError):
+        return None
+    return None
+
+def process_peak_rss_mb() -> float:
+    """
+    Get the peak resident set size of the process since it started or since the last reset_peak_rss.
+
+    Returns:
+    float: The peak RSS in megabytes, or None if the resource module is not available.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+def _max_mb(*values: float) -> float:
+    """
+    Return the largest of the memory measurements that are available, or None if none is.
+    """
+    return max((value for value in values if value is not None), default=None)
+
+def _cpu_seconds() -> float:
+    """
+    Get the CPU time of the process and its finished child processes, such as the simulation workers.
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
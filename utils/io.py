@@ -1,19 +1,36 @@
 import sys
 import os
+import json
+import hashlib
+import logging
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import datetime
 from openpyxl import Workbook
 from openpyxl.utils.dataframe import dataframe_to_rows
 from openpyxl.styles import Font, Border, Side, PatternFill
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.utils import get_column_letter
 from tabulate import tabulate
 
-def load_and_process_data(input_file: str = 'GHG_Data.xlsx') -> tuple[int, int, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+OUTPUT_FORMATS = ['xlsx', 'parquet', 'both']
+PARQUET_MANIFEST = 'manifest.json'
+INPUT_SHEETS = ['Project Data', 'Default Rates', 'Recovery Potential', 'Model Config']
+INPUT_CACHE_FILES = ['project_data.parquet', 'default_rates.parquet', 'recovery_potential.parquet', 'model_config.parquet']
+STREAMING_EXTENSIONS = ['.csv', '.tsv', '.parquet']
+TABLE_EXTENSIONS = ['.xlsx', '.xls', '.csv', '.tsv', '.parquet']
+
+def load_and_process_data(input_file: str = 'GHG_Data.xlsx', cache_dir: str = None) -> tuple[int, int, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
     Load and process data from Excel file.
 
     Parameters:
     input_file (str): The path to the input Excel file. Default is 'GHG_Data.xlsx'.
+    cache_dir (str, optional): The folder of the input cache. If given, the processed DataFrames are cached as Parquet files
+                               keyed by the content hash of the input file, and reused while the file is unchanged. Default is None.
 
     Returns:
     num_buckets (int): The number of risk buckets.
@@ -26,34 +43,231 @@ def load_and_process_data(input_file: str = 'GHG_Data.xlsx') -> tuple[int, int,
     Notes:
     This function assumes that the input Excel file contains four sheets named 'Project Data', 'Default Rates', 'Recovery Potential', and 'Model Config'.
     """
-    # Load Data
-    df_project = pd.read_excel(input_file, sheet_name='Project Data')  
-    df_default_rates = pd.read_excel(input_file, sheet_name='Default Rates')
-    df_recovery_potential = pd.read_excel(input_file, sheet_name='Recovery Potential')
-    df_model = pd.read_excel(input_file, sheet_name='Model Config')
+    cache_folder = None
+    if cache_dir is not None:
+        cache_folder = os.path.join(cache_dir, file_hash(input_file))
+        if all(os.path.exists(os.path.join(cache_folder, file)) for file in INPUT_CACHE_FILES):
+            logging.info(f"Loading {input_file} from the input cache {cache_folder}")
+            df_project, df_default_rates, df_recovery_potential, df_model = load_input_cache(cache_folder)
+            return count_buckets_and_factors(df_project) + (df_project, df_default_rates, df_recovery_potential, df_model)
+
+    # Load Data, parsing the workbook only once for all four sheets
+    sheets = pd.read_excel(input_file, sheet_name=INPUT_SHEETS)
+    df_project, df_default_rates, df_recovery_potential, df_model = (sheets[sheet] for sheet in INPUT_SHEETS)
+
+    df_default_rates = _process_rate_table(df_default_rates)
+    df_recovery_potential = _process_rate_table(df_recovery_potential)
+    df_project = _process_project_data(df_project)
+
+    if cache_folder is not None:
+        save_input_cache(cache_folder, df_project, df_default_rates, df_recovery_potential, df_model)
+
+    return count_buckets_and_factors(df_project) + (df_project, df_default_rates, df_recovery_potential, df_model)
+
+def load_model_tables(table_file: str = 'GHG_Data.xlsx') -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Load the default rates, recovery potential and model configuration from an Excel file, without the project data.
+
+    Parameters:
+    table_file (str): The path to the Excel file. Default is 'GHG_Data.xlsx'.
+
+    Returns:
+    df_default_rates (pd.DataFrame): A DataFrame containing default rates data.
+    df_recovery_potential (pd.DataFrame): A DataFrame containing recovery potential data.
+    df_model (pd.DataFrame): A DataFrame containing model configuration data.
+
+    Notes:
+    This function assumes that the Excel file contains sheets named 'Default Rates', 'Recovery Potential', and 'Model Config'.
+    """
+    sheets = pd.read_excel(table_file, sheet_name=INPUT_SHEETS[1:])
+    return _process_rate_table(sheets['Default Rates']), _process_rate_table(sheets['Recovery Potential']), sheets['Model Config']
+
+def read_project_chunks(project_file: str, chunk_size: int = 100000):
+    """
+    Read project data from a CSV, TSV or Parquet file in chunks of at most chunk_size projects.
+
+    Only one chunk is held in memory at a time. Each chunk is processed in the same way as the 'Project Data' sheet in
+    load_and_process_data.
+
+    Parameters:
+    project_file (str): The path to the project data file, with one of the STREAMING_EXTENSIONS.
+    chunk_size (int, optional): The maximum number of projects in each chunk. Defaults to 100000.
+
+    Returns:
+    Iterator[pd.DataFrame]: The chunks of project data.
+
+    Raises:
+    ValueError: If the file extension is not supported or chunk_size is not positive.
+    """
+    if chunk_size <= 0:
+        raise ValueError('chunk_size must be greater than 0')
+
+    extension = os.path.splitext(project_file)[1].lower()
+    if extension in ['.csv', '.tsv']:
+        chunks = pd.read_csv(project_file, sep='\t' if extension == '.tsv' else ',', chunksize=chunk_size)
+    elif extension == '.parquet':
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(project_file).iter_batches(batch_size=chunk_size))
+    else:
+        raise ValueError(f"Unsupported project data file {project_file}, the extension must be one of: {', '.join(STREAMING_EXTENSIONS)}")
+
+    return (_process_project_data(chunk) for chunk in chunks)
+
+def read_table(file_path: str) -> pd.DataFrame:
+    """
+    Read a table from an Excel (first worksheet), CSV, TSV or Parquet file.
+
+    Parameters:
+    file_path (str): The path to the file, with one of the TABLE_EXTENSIONS.
 
+    Returns:
+    pd.DataFrame: The table.
+
+    Raises:
+    ValueError: If the file extension is not supported.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in ['.xlsx', '.xls']:
+        return pd.read_excel(file_path)
+    if extension in ['.csv', '.tsv']:
+        return pd.read_csv(file_path, sep='\t' if extension == '.tsv' else ',')
+    if extension == '.parquet':
+        return pd.read_parquet(file_path)
+    raise ValueError(f"Unsupported file {file_path}, the extension must be one of: {', '.join(TABLE_EXTENSIONS)}")
+
+def _process_rate_table(df_rates: pd.DataFrame) -> pd.DataFrame:
+    """
+    Index a default rates or recovery potential table by rating, with the years as int columns.
+    """
     # Set index for default rates and recovery potential dataframes
-    df_default_rates = df_default_rates.set_index('Unnamed: 0')
-    df_recovery_potential = df_recovery_potential.set_index('Unnamed: 0')
+    df_rates = df_rates.set_index('Unnamed: 0')
 
     # Convert Data Types
-    df_default_rates.columns = df_default_rates.columns.astype(int)
-    df_recovery_potential.columns = df_recovery_potential.columns.astype(int)
+    df_rates.columns = df_rates.columns.astype(int)
+    return df_rates
 
+def _process_project_data(df_project: pd.DataFrame) -> pd.DataFrame:
+    """
+    Fill the missing risk bucket factors and weights with 0 and convert the screening dates to datetime.
+    """
     # Replace NaN with 0 in risk bucket factors and weights columns
     risk_columns = [col for col in df_project.columns if 'risk_bucket' in col]
     df_project[risk_columns] = df_project[risk_columns].fillna(0)
 
     # Convert 'Screening Date' to datetime
     df_project['screening_date'] = pd.to_datetime(df_project['screening_date'])
+    return df_project
+
+def read_project_records(records: list) -> pd.DataFrame:
+    """
+    Read project data from a list of records, such as the rows of a JSON request, with the columns of the 'Project Data' sheet.
+
+    The records are processed in the same way as the 'Project Data' sheet in load_and_process_data.
+
+    Parameters:
+    records (list): The projects, as dicts of column name and value.
 
+    Returns:
+    pd.DataFrame: The project data.
+
+    Raises:
+    ValueError: If there are no records or the 'screening_date' column is missing.
+    """
+    df_project = pd.DataFrame.from_records(records)
+    if df_project.empty:
+        raise ValueError('No projects found in the records')
+    if 'screening_date' not in df_project.columns:
+        raise ValueError("The records are missing the 'screening_date' column")
+
+    # Columns without any values are read as float, as read_excel and read_csv do
+    empty_columns = df_project.columns[df_project.isna().all()]
+    df_project[empty_columns] = df_project[empty_columns].astype(float)
+    return _process_project_data(df_project)
+
+def count_buckets_and_factors(df_project: pd.DataFrame) -> tuple[int, int]:
+    """
+    Count the risk buckets and the risk factors per bucket from the project data columns.
+
+    Parameters:
+    df_project (pd.DataFrame): A DataFrame containing project data with 'risk_bucket_X_factor_Y' columns.
+
+    Returns:
+    num_buckets (int): The number of risk buckets.
+    num_risk_factors (int): The number of risk factors.
+    """
     # Calculate the number of risk buckets
     num_buckets = max(int(col.split('_')[2]) for col in df_project.columns if 'risk_bucket' in col)
 
     # Calculate the number of risk factors
     num_risk_factors = len([col for col in df_project.columns if 'factor' in col and f"risk_bucket_1_factor" in col])
 
-    return num_buckets, num_risk_factors, df_project, df_default_rates, df_recovery_potential, df_model
+    return num_buckets, num_risk_factors
+
+def file_hash(file_path: str) -> str:
+    """
+    Calculate the SHA-256 hash of a file's contents.
+
+    Parameters:
+    file_path (str): The path to the file.
+
+    Returns:
+    str: The hexadecimal hash.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def save_input_cache(cache_folder: str, df_project: pd.DataFrame, df_default_rates: pd.DataFrame, df_recovery_potential: pd.DataFrame,
+                     df_model: pd.DataFrame) -> None:
+    """
+    Save the processed input DataFrames as Parquet files in the cache folder.
+
+    Parameters:
+    cache_folder (str): The cache folder for the input file.
+    df_project (pd.DataFrame): A DataFrame containing project data.
+    df_default_rates (pd.DataFrame): A DataFrame containing default rates data.
+    df_recovery_potential (pd.DataFrame): A DataFrame containing recovery potential data.
+    df_model (pd.DataFrame): A DataFrame containing model configuration data.
+
+    Notes:
+    Caching is best effort: if the DataFrames cannot be written, a warning is logged and the partial cache is removed.
+    """
+    os.makedirs(cache_folder, exist_ok=True)
+    try:
+        df_project.to_parquet(os.path.join(cache_folder, 'project_data.parquet'), index=False)
+        # Parquet column names must be strings, the year columns are converted back to int by load_input_cache
+        for df, file in [(df_default_rates, 'default_rates.parquet'), (df_recovery_potential, 'recovery_potential.parquet')]:
+            df.rename(columns=str).to_parquet(os.path.join(cache_folder, file))
+        df_model.to_parquet(os.path.join(cache_folder, 'model_config.parquet'), index=False)
+    except Exception as e:
+        logging.warning(f"Could not write the input cache {cache_folder}: {str(e)}")
+        for file in INPUT_CACHE_FILES:
+            if os.path.exists(os.path.join(cache_folder, file)):
+                os.remove(os.path.join(cache_folder, file))
+
+def load_input_cache(cache_folder: str) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Load the processed input DataFrames saved by save_input_cache.
+
+    Parameters:
+    cache_folder (str): The cache folder for the input file.
+
+    Returns:
+    df_project (pd.DataFrame): A DataFrame containing project data.
+    df_default_rates (pd.DataFrame): A DataFrame containing default rates data.
+    df_recovery_potential (pd.DataFrame): A DataFrame containing recovery potential data.
+    df_model (pd.DataFrame): A DataFrame containing model configuration data.
+    """
+    df_project = pd.read_parquet(os.path.join(cache_folder, 'project_data.parquet'))
+    df_default_rates = pd.read_parquet(os.path.join(cache_folder, 'default_rates.parquet'))
+    df_recovery_potential = pd.read_parquet(os.path.join(cache_folder, 'recovery_potential.parquet'))
+    df_model = pd.read_parquet(os.path.join(cache_folder, 'model_config.parquet'))
+
+    df_default_rates.columns = df_default_rates.columns.astype(int)
+    df_recovery_potential.columns = df_recovery_potential.columns.astype(int)
+
+    return df_project, df_default_rates, df_recovery_potential, df_model
 
 def create_output_folder() -> str:
     """
@@ -76,7 +290,7 @@ def create_output_folder() -> str:
     return folder_name
 
 def export_ghg_data(output_folder: str, df_project: 'pd.DataFrame', df_default_rates: 'pd.DataFrame', 
-                    df_recovery_potential: 'pd.DataFrame', df_model: 'pd.DataFrame') -> None:
+                    df_recovery_potential: 'pd.DataFrame', df_model: 'pd.DataFrame', fast: bool = False) -> None:
     """
     Export GHG data to an Excel file.
 
@@ -86,11 +300,16 @@ def export_ghg_data(output_folder: str, df_project: 'pd.DataFrame', df_default_r
     df_default_rates (pd.DataFrame): A DataFrame containing default rates data.
     df_recovery_potential (pd.DataFrame): A DataFrame containing recovery potential data.
     df_model (pd.DataFrame): A DataFrame containing model configuration data.
+    fast (bool, optional): Whether to use the streaming writer of export_ghg_data_fast. Defaults to False.
 
     Notes:
     This function exports the input DataFrames to four separate worksheets in the 'GHG_Data.xlsx' file.
     The 'Default Rates' and 'Recovery Potential' worksheets include "Investment", "Speculative", and "C" next to the values.
     """
+    if fast:
+        export_ghg_data_fast(output_folder, df_project, df_default_rates, df_recovery_potential, df_model)
+        return
+
     wb = Workbook()
     ws = wb.active
     ws.title = 'Project Data'
@@ -165,10 +384,64 @@ def export_ghg_data(output_folder: str, df_project: 'pd.DataFrame', df_default_r
 
     wb.save(f"{output_folder}/GHG_Data_Simulation.xlsx")
 
+def export_ghg_data_fast(output_folder: str, df_project: 'pd.DataFrame', df_default_rates: 'pd.DataFrame', 
+                         df_recovery_potential: 'pd.DataFrame', df_model: 'pd.DataFrame') -> None:
+    """
+    Export GHG data to an Excel file with a streaming writer.
+
+    The worksheets, columns and cell values are the same as export_ghg_data, so reports bound to the file keep working.
+    Instead of styling every cell, the rows are streamed through a write-only workbook, the header font is set on
+    the header cells only and the grey banding of the even rows is a single conditional format per worksheet.
+
+    Parameters:
+    output_folder (str): The folder to save the Excel file in.
+    df_project (pd.DataFrame): A DataFrame containing project data.
+    df_default_rates (pd.DataFrame): A DataFrame containing default rates data.
+    df_recovery_potential (pd.DataFrame): A DataFrame containing recovery potential data.
+    df_model (pd.DataFrame): A DataFrame containing model configuration data.
+    """
+    wb = Workbook(write_only=True)
+
+    _write_sheet_fast(wb, 'Project Data', list(df_project.columns), df_project.itertuples(index=False, name=None), len(df_project), 25, {'B': 35})
+
+    for title, df_rates in [('Default Rates', df_default_rates), ('Recovery Potential', df_recovery_potential)]:
+        rows = [[rating] + list(df_rates.loc[rating]) for rating in ['Investment', 'Speculative', 'C']]
+        _write_sheet_fast(wb, title, [""] + list(df_rates.columns), rows, len(rows), 15)
+
+    _write_sheet_fast(wb, 'Model Config', list(df_model.columns), df_model.itertuples(index=False, name=None), len(df_model), 25)
+
+    wb.save(f"{output_folder}/GHG_Data_Simulation.xlsx")
+
+def _write_sheet_fast(wb: Workbook, title: str, header: list, rows, num_rows: int, width: float, widths: dict = None) -> None:
+    """
+    Stream a header and rows into a new write-only worksheet with column widths, a bold header and banded rows.
+    """
+    ws = wb.create_sheet(title)
+
+    # Column widths and conditional formats must be set before the rows are written
+    last_column = get_column_letter(max(len(header), 1))
+    for column in range(1, len(header) + 1):
+        ws.column_dimensions[get_column_letter(column)].width = width
+    for column, column_width in (widths or {}).items():
+        ws.column_dimensions[column].width = column_width
+    if num_rows > 0:
+        ws.conditional_formatting.add(f'A2:{last_column}{num_rows + 1}',
+                                      FormulaRule(formula=['MOD(ROW(),2)=0'], fill=PatternFill(bgColor='C5C5C5', fill_type='solid')))
+
+    header_cells = []
+    for value in header:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = Font(bold=True, underline='single')
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    for row in rows:
+        ws.append(row)
+
 def export_project_risk_output(output_folder: str, top_projects: 'pd.DataFrame', bottom_projects: 'pd.DataFrame', 
                                country_table: 'pd.DataFrame', technology_table: 'pd.DataFrame', 
                                counterparty_table: 'pd.DataFrame', df_counts: 'pd.DataFrame', 
-                               total_volumes_per_year: 'pd.DataFrame') -> None:
+                               total_volumes_per_year: 'pd.DataFrame', group_projects: dict = None) -> None:
     """
     Exports project risk output to an Excel file.
 
@@ -181,12 +454,14 @@ def export_project_risk_output(output_folder: str, top_projects: 'pd.DataFrame',
     counterparty_table (pd.DataFrame): Counterparty table.
     df_counts (pd.DataFrame): Project rating distribution counts.
     total_volumes_per_year (pd.DataFrame): Total volumes per year data.
+    group_projects (dict, optional): The top and bottom projects of each group, from create_group_top_bottom_tables. Defaults to None.
 
     Returns:
     None
 
     Notes:
     This function creates an Excel file named 'project_risk_output.xlsx' and writes the input DataFrames to separate worksheets in the file. The worksheets are ordered as follows: Project Rating Distribution, Highest Performing Projects, Lowest Performing Projects, Annual Project Volumes, Overall Project Rating Distribution by Country, Overall Project Rating Distribution by Technology, Overall Project Rating Distribution by Counterparty.
+    With group_projects, a worksheet such as 'Highest by Country' is added after these for each table.
     """
     
     wb = Workbook()
@@ -216,6 +491,17 @@ def export_project_risk_output(output_folder: str, top_projects: 'pd.DataFrame',
     ws_counterparty_table['A1'] = "Overall Project Rating Distribution by Counterparty"
     ws_counterparty_table['A1'].font = Font(bold=True, size=16)
 
+    # Add a worksheet for the top and bottom projects of each group, such as 'highest_performing_by_country'
+    ws_group_tables = []
+    for name, group_table in (group_projects or {}).items():
+        ranking, dimension = name.split('_performing_by_')
+        ws_group_table = wb.create_sheet(f"{ranking.title()} by {dimension.title()}")
+        ws_group_tables.append(ws_group_table)
+        ws_group_table['A1'] = f"{ranking.title()} Performing Projects by {dimension.title()}"
+        ws_group_table['A1'].font = Font(bold=True, size=16)
+        for row in dataframe_to_rows(group_table, index=False, header=True):
+            ws_group_table.append(row)
+
     for row in dataframe_to_rows(df_counts, index=False, header=True):
         ws_df_counts.append(row)
     for row in dataframe_to_rows(top_projects, index=False, header=True):
@@ -246,7 +532,7 @@ def export_project_risk_output(output_folder: str, top_projects: 'pd.DataFrame',
         if row != [''] * len(row):
             ws_counterparty_table.append(row)
 
-    for ws in [ws_top_projects, ws_bottom_projects, ws_country_table, ws_technology_table, ws_counterparty_table, ws_df_counts, ws_total_volumes_per_year]:
+    for ws in wb.worksheets:
         for col in ws.columns:
             ws.column_dimensions[col[0].column_letter].width = 20
     ws_top_projects.column_dimensions['C'].width = 35
@@ -255,25 +541,169 @@ def export_project_risk_output(output_folder: str, top_projects: 'pd.DataFrame',
     ws_bottom_projects.column_dimensions['H'].width = 26
     ws_total_volumes_per_year.column_dimensions['C'].width = 25
     ws_df_counts.column_dimensions['A'].width = 26
+    for ws_group_table in ws_group_tables:
+        ws_group_table.column_dimensions['D'].width = 35
+        ws_group_table.column_dimensions['H'].width = 26
 
     thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    for ws in [ws_top_projects, ws_bottom_projects, ws_country_table, ws_technology_table, ws_counterparty_table, ws_df_counts, ws_total_volumes_per_year]:
+    for ws in wb.worksheets:
         for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
             for cell in row:
                 cell.border = thin_border
 
-    for ws in [ws_top_projects, ws_bottom_projects, ws_country_table, ws_technology_table, ws_counterparty_table, ws_df_counts, ws_total_volumes_per_year]:
+    for ws in wb.worksheets:
         for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
             for cell in row:
                 if cell.row % 2 == 0:
                     cell.fill = PatternFill(start_color='C5C5C5', fill_type='solid')
 
-    for ws in [ws_top_projects, ws_bottom_projects, ws_country_table, ws_technology_table, ws_counterparty_table, ws_df_counts, ws_total_volumes_per_year]:
+    for ws in wb.worksheets:
         for cell in ws["2:2"]:
             cell.font = Font(bold=True, underline='single')
 
     wb.save(f"{output_folder}/Project_Risk_Summary_Data.xlsx")
 
+def export_parquet_output(output_folder: str, df_project: pd.DataFrame, top_projects: pd.DataFrame, bottom_projects: pd.DataFrame,
+                          country_table: pd.DataFrame, technology_table: pd.DataFrame, counterparty_table: pd.DataFrame,
+                          df_counts: pd.DataFrame, total_volumes_per_year: pd.DataFrame, group_projects: dict = None) -> None:
+    """
+    Exports the simulated project data and the project risk output tables as Parquet files.
+
+    Parameters:
+    output_folder (str): The folder to save the Parquet files in.
+    df_project (pd.DataFrame): The simulated project data.
+    top_projects (pd.DataFrame): Top performing projects.
+    bottom_projects (pd.DataFrame): Bottom performing projects.
+    country_table (pd.DataFrame): Country table.
+    technology_table (pd.DataFrame): Technology table.
+    counterparty_table (pd.DataFrame): Counterparty table.
+    df_counts (pd.DataFrame): Project rating distribution counts.
+    total_volumes_per_year (pd.DataFrame): Total volumes per year data.
+    group_projects (dict, optional): The top and bottom projects of each group, from create_group_top_bottom_tables. Defaults to None.
+
+    Returns:
+    None
+
+    Notes:
+    Each DataFrame is written to its own '<name>.parquet' file, and a 'manifest.json' file lists the name, file, number of rows and
+    columns of each table so that load_parquet_output can reload the output folder. If df_project is None, the project data must
+    already have been written to 'project_data.parquet' in the output folder, for example with append_parquet_chunk.
+    """
+    tables = {
+        'project_data': df_project,
+        'rating_distribution': df_counts,
+        'highest_performing': top_projects,
+        'lowest_performing': bottom_projects,
+        'annual_volumes': total_volumes_per_year,
+        'country_distribution': country_table,
+        'technology_distribution': technology_table,
+        'counterparty_distribution': counterparty_table
+    }
+    tables.update(group_projects or {})
+
+    manifest = {'created': datetime.datetime.now().isoformat(timespec='seconds'), 'tables': {}}
+    for name, df in tables.items():
+        if df is not None:
+            df.to_parquet(os.path.join(output_folder, f'{name}.parquet'), index=False)
+        metadata = pq.read_metadata(os.path.join(output_folder, f'{name}.parquet'))
+        manifest['tables'][name] = {'file': f'{name}.parquet', 'rows': metadata.num_rows, 'columns': metadata.num_columns}
+
+    with open(os.path.join(output_folder, PARQUET_MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+def export_scenario_output(output_folder: str, df_results: pd.DataFrame, df_totals: pd.DataFrame, output_format: str = 'xlsx') -> None:
+    """
+    Exports the results of a scenario analysis.
+
+    Parameters:
+    output_folder (str): The folder to save the files in.
+    df_results (pd.DataFrame): The scenario x project x year results from run_scenarios.
+    df_totals (pd.DataFrame): The total volumes by scenario and year from run_scenarios.
+    output_format (str, optional): The output format of the totals, one of OUTPUT_FORMATS. Defaults to 'xlsx'.
+
+    Returns:
+    None
+
+    Notes:
+    The results are always written to 'scenario_results.parquet', since they can have more rows than an Excel worksheet.
+    The totals are written to the 'Scenario Totals' worksheet of 'Scenario_Totals.xlsx' and/or to 'scenario_totals.parquet'.
+    """
+    df_results.to_parquet(os.path.join(output_folder, 'scenario_results.parquet'), index=False)
+    if output_format in ['xlsx', 'both']:
+        df_totals.to_excel(os.path.join(output_folder, 'Scenario_Totals.xlsx'), sheet_name='Scenario Totals', index=False)
+    if output_format in ['parquet', 'both']:
+        df_totals.to_parquet(os.path.join(output_folder, 'scenario_totals.parquet'), index=False)
+
+def export_model_comparison(output_folder: str, df_comparison: pd.DataFrame, df_ratings: pd.DataFrame, output_format: str = 'xlsx') -> None:
+    """
+    Exports the results of a model comparison.
+
+    Parameters:
+    output_folder (str): The folder to save the files in.
+    df_comparison (pd.DataFrame): The comparison of the models from compare_models.
+    df_ratings (pd.DataFrame): The ratings of every model and project from compare_models.
+    output_format (str, optional): The output format of the comparison, one of OUTPUT_FORMATS. Defaults to 'xlsx'.
+
+    Returns:
+    None
+
+    Notes:
+    The ratings are always written to 'model_ratings.parquet', since they can have more rows than an Excel worksheet.
+    The comparison is written to the 'Model Comparison' worksheet of 'Model_Comparison.xlsx' and/or to 'model_comparison.parquet'.
+    """
+    df_ratings.to_parquet(os.path.join(output_folder, 'model_ratings.parquet'), index=False)
+    if output_format in ['xlsx', 'both']:
+        df_comparison.to_excel(os.path.join(output_folder, 'Model_Comparison.xlsx'), sheet_name='Model Comparison', index=False)
+    if output_format in ['parquet', 'both']:
+        df_comparison.to_parquet(os.path.join(output_folder, 'model_comparison.parquet'), index=False)
+
+def append_parquet_chunk(writer: pq.ParquetWriter, file_path: str, df: pd.DataFrame) -> pq.ParquetWriter:
+    """
+    Append a chunk of rows to a Parquet file.
+
+    Parameters:
+    writer (pq.ParquetWriter): The writer returned for the previous chunk, or None for the first chunk.
+    file_path (str): The path to the Parquet file.
+    df (pd.DataFrame): The chunk of rows, with the same columns as the first chunk.
+
+    Returns:
+    pq.ParquetWriter: The writer to pass with the next chunk. It must be closed after the last chunk.
+    """
+    if writer is None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        writer = pq.ParquetWriter(file_path, table.schema)
+    else:
+        # Use the schema of the first chunk, so that columns that are all missing in a chunk keep their type
+        table = pa.Table.from_pandas(df, schema=writer.schema, preserve_index=False)
+    writer.write_table(table)
+    return writer
+
+def load_parquet_output(output_folder: str) -> dict[str, pd.DataFrame]:
+    """
+    Load the Parquet output written by export_parquet_output.
+
+    Parameters:
+    output_folder (str): The output folder containing the 'manifest.json' file.
+
+    Returns:
+    dict[str, pd.DataFrame]: The tables listed in the manifest, by name.
+
+    Raises:
+    FileNotFoundError: If the manifest or one of the Parquet files does not exist.
+    ValueError: If a table does not have the number of rows and columns listed in the manifest.
+    """
+    with open(os.path.join(output_folder, PARQUET_MANIFEST)) as f:
+        manifest = json.load(f)
+
+    tables = {}
+    for name, entry in manifest['tables'].items():
+        df = pd.read_parquet(os.path.join(output_folder, entry['file']))
+        if df.shape != (entry['rows'], entry['columns']):
+            raise ValueError(f"Table {name} has shape {df.shape}, expected ({entry['rows']}, {entry['columns']}) from the manifest")
+        tables[name] = df
+
+    return tables
+
 def valid_project_data(df: pd.DataFrame, num_buckets: int, num_factors: int) -> bool:
     """
     Validates the data in the project DataFrame.
@@ -379,6 +809,41 @@ def display_project_risk_output(df_counts: pd.DataFrame, top_projects: pd.DataFr
     print("Annual Project Volumes")
     print(tabulate(total_volumes_per_year, headers='keys', tablefmt=TABLE_FORMAT, showindex=False))
 
+def display_sampler_comparison(df_comparison: pd.DataFrame) -> None:
+    """
+    Prints the sampler comparison from compare_samplers in a tabular format.
+
+    Parameters:
+    df_comparison (pd.DataFrame): Sampler comparison dataframe.
+    """
+    print()
+    print("Simulation Sampler Error against the Analytic Standard Deviation")
+    print(tabulate(df_comparison, headers='keys', tablefmt='fancy_grid', showindex=False, floatfmt='.4f'))
+
+def display_scenario_totals(df_totals: pd.DataFrame) -> None:
+    """
+    Prints the total volumes of each scenario over all years in a tabular format.
+
+    Parameters:
+    df_totals (pd.DataFrame): The total volumes by scenario and year from run_scenarios.
+    """
+    summary = df_totals.groupby('Scenario', sort=False)[['Total Offered Volume', 'Overall Project Delivery']].sum().reset_index()
+    summary['Delivery Percentage'] = summary['Overall Project Delivery'] / summary['Total Offered Volume']
+    print()
+    print("Scenario Total Volumes")
+    print(tabulate(summary, headers='keys', tablefmt='fancy_grid', showindex=False, floatfmt=',.2f'))
+
+def display_model_comparison(df_comparison: pd.DataFrame) -> None:
+    """
+    Prints the model comparison from compare_models in a tabular format.
+
+    Parameters:
+    df_comparison (pd.DataFrame): Model comparison dataframe.
+    """
+    print()
+    print("Model Comparison")
+    print(tabulate(df_comparison, headers='keys', tablefmt='fancy_grid', showindex=False, floatfmt=',.2f'))
+
 def check_df_format(df_default_rates: pd.DataFrame, df_recovery_potential: pd.DataFrame) -> bool:
     """
     Checks if two dataframes are formatted correctly.
@@ -0,0 +1,113 @@
+import logging
+import pandas as pd
+import numpy as np
+
+from utils.io import read_table
+from utils.portfolio import Portfolio, RATING_LABELS, rating_labels
+from utils.risk_calculation import (calculate_shortfall_table, score_models, rating_counts, analytic_delivery, overall_rating_codes)
+
+PROJECT_WEIGHTS_MODEL = 'Project Weights'
+
+def load_models(model_file: str, num_buckets: int, num_factors: int) -> tuple[list, np.ndarray]:
+    """
+    Load the risk bucket weights of several candidate models.
+
+    The model file (Excel, CSV, TSV or Parquet) has one row per model, with a 'model_name' column and the
+    'risk_bucket_X_weight_Y' columns of the 'Project Data' sheet. As for the project weights, the weights of each
+    risk bucket must be non-negative and sum to 1.
+
+    Parameters:
+    model_file (str): The path to the model file.
+    num_buckets (int): The number of risk buckets.
+    num_factors (int): The number of risk factors in each risk bucket.
+
+    Returns:
+    model_names (list): The name of each model, in the order of the file.
+    model_weights (np.ndarray): The risk bucket weights of each model, shape (models, buckets, factors).
+
+    Raises:
+    ValueError: If the file extension is not supported, a column is missing, a model name is repeated, or the weights
+                of a risk bucket are negative or do not sum to 1.
+    """
+    df_models = read_table(model_file)
+    columns = [f'risk_bucket_{bucket}_weight_{factor}' for bucket in range(1, num_buckets + 1) for factor in range(1, num_factors + 1)]
+    missing = [column for column in ['model_name'] + columns if column not in df_models.columns]
+    if missing:
+        raise ValueError(f"The model file is missing the columns: {', '.join(missing)}")
+    if df_models['model_name'].duplicated().any():
+        raise ValueError("The model names in the model file must be unique")
+
+    # Missing weights are treated as 0, as for the project data
+    model_weights = df_models[columns].fillna(0).to_numpy(dtype=float).reshape(len(df_models), num_buckets, num_factors)
+    model_names = df_models['model_name'].astype(str).tolist()
+
+    # The same tolerance as valid_project_data, which rounds the sums of the project weights to 6 decimals
+    negative = (model_weights < 0).any(axis=2)
+    wrong_sum = ~np.isclose(model_weights.sum(axis=2), 1, rtol=0, atol=5e-7)
+    for model, bucket in zip(*np.nonzero(negative | wrong_sum)):
+        problem = 'must not be negative' if negative[model, bucket] else 'must sum to 1'
+        raise ValueError(f"The weights of risk bucket {bucket + 1} of model {model_names[model]} {problem}")
+
+    return model_names, model_weights
+
+def compare_models(portfolio: Portfolio, model_names: list, model_weights: np.ndarray, df_default_rates: pd.DataFrame,
+                   df_recovery_potential: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Score and rate one portfolio under several candidate models in one pass, and compare them with the project weights.
+
+    The risk bucket scores and ratings of every model are calculated at once by score_models, and the overall project
+    ratings from the analytic delivery volumes of analytic_delivery. The project weights of the portfolio are compared
+    as the first model, PROJECT_WEIGHTS_MODEL.
+
+    Parameters:
+    portfolio (Portfolio): The portfolio with the risk bucket factors, weights and ratings, as from score_portfolio.
+    model_names (list): The name of each model.
+    model_weights (np.ndarray): The risk bucket weights of each model, shape (models, buckets, factors).
+    df_default_rates (pd.DataFrame): The DataFrame containing the default rates.
+    df_recovery_potential (pd.DataFrame): The DataFrame containing the recovery potentials.
+
+    Returns:
+    df_comparison (pd.DataFrame): One row per model with the 'model_name', the number of projects with each overall rating,
+                                  the 'Total Offered Volume', 'Overall Project Delivery' and 'Delivery Percentage' over
+                                  all years, and 'Changed Ratings', the number of projects whose overall rating differs
+                                  from the project weights.
+    df_ratings (pd.DataFrame): The 'model_name', 'project_id', risk bucket ratings and 'overall_project_rating' of every
+                               model and project.
+
+    Raises:
+    ValueError: If the model weights do not have the buckets and factors of the portfolio.
+    """
+    if model_weights.shape[1:] != (portfolio.num_buckets, portfolio.num_factors):
+        raise ValueError(f"The model weights must have {portfolio.num_buckets} risk buckets and {portfolio.num_factors} risk factors")
+
+    names = [PROJECT_WEIGHTS_MODEL] + list(model_names)
+    _, model_ratings = score_models(portfolio.factors, model_weights)
+    ratings = np.concatenate([portfolio.ratings[None], model_ratings])
+
+    shortfall_table = calculate_shortfall_table(df_default_rates, df_recovery_potential, portfolio.num_years).loc[RATING_LABELS].to_numpy()
+    _, delivery_volume, expected_value_percentage = analytic_delivery(rating_counts(ratings), shortfall_table, portfolio.offered_volume,
+                                                                      portfolio.active)
+    overall_ratings = overall_rating_codes(expected_value_percentage)
+
+    total_offered_volume = np.sum(np.where(portfolio.active, portfolio.offered_volume, 0))
+    total_delivery = np.nansum(delivery_volume, axis=(1, 2))
+    df_comparison = pd.DataFrame({'model_name': names})
+    for code, label in enumerate(RATING_LABELS):
+        df_comparison[label] = np.sum(overall_ratings == code, axis=1)
+    df_comparison['Total Offered Volume'] = total_offered_volume
+    df_comparison['Overall Project Delivery'] = total_delivery
+    df_comparison['Delivery Percentage'] = total_delivery / total_offered_volume if total_offered_volume else np.nan
+    df_comparison['Changed Ratings'] = np.sum(overall_ratings != overall_ratings[0], axis=1)
+
+    # Convert the codes to labels only for the exported ratings
+    num_models, num_projects = overall_ratings.shape
+    df_ratings = pd.DataFrame({
+        'model_name': pd.Categorical(np.repeat(names, num_projects), categories=names),
+        'project_id': np.tile(portfolio.projects['project_id'].to_numpy(), num_models)
+    })
+    for bucket in range(1, portfolio.num_buckets + 1):
+        df_ratings[f'risk_bucket_{bucket}_rating'] = rating_labels(ratings[:, :, bucket - 1].ravel())
+    df_ratings['overall_project_rating'] = rating_labels(overall_ratings.ravel())
+
+    logging.info(f"Model comparison: {len(model_names)} models for {num_projects} projects")
+    return df_comparison, df_ratings
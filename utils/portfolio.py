@@ -0,0 +1,150 @@
+from dataclasses import dataclass
+import pandas as pd
+import numpy as np
+
+RATING_LABELS = ['C', 'Speculative', 'Investment']
+
+@dataclass
+class Portfolio:
+    """
+    Dense array representation of the project portfolio.
+
+    The pipeline stages in utils/risk_calculation.py fill in the result arrays of a Portfolio instead of adding
+    hundreds of wide 'risk_bucket_X_..._year_Y' columns to the project DataFrame. The wide DataFrame is only
+    materialized by to_dataframe when it is needed for the output tables and exports.
+
+    Attributes:
+    projects (pd.DataFrame): The project data as loaded, one row per project.
+    num_buckets (int): The number of risk buckets.
+    num_factors (int): The number of risk factors in each risk bucket.
+    num_years (int): The number of years.
+    active (np.ndarray): True for the years within the contract duration, shape (projects, years).
+    offered_volume (np.ndarray): The offered volumes, shape (projects, years).
+    factors (np.ndarray): The risk bucket factors, shape (projects, buckets, factors).
+    weights (np.ndarray): The risk bucket weights, shape (projects, buckets, factors).
+    scores (np.ndarray): The risk bucket scores, shape (projects, buckets).
+    ratings (np.ndarray): The risk bucket ratings as int8 codes into RATING_LABELS, shape (projects, buckets).
+    shortfall (np.ndarray): The risk bucket shortfalls, shape (projects, buckets, years).
+    expected_value (np.ndarray): The risk bucket expected values, shape (projects, buckets, years).
+    standard_deviation (np.ndarray): The risk bucket standard deviations, shape (projects, buckets, years).
+    project_standard_deviation (np.ndarray): The project standard deviations, shape (projects, years).
+    project_delivery_volume (np.ndarray): The project delivery volumes, shape (projects, years).
+    project_expected_value_percentage (np.ndarray): The project expected value percentages, shape (projects, years).
+    simulation_samples (np.ndarray): The number of samples used for each project year by the adaptive engine, shape (projects, years).
+    overall_rating (np.ndarray): The overall project ratings as int8 codes into RATING_LABELS, shape (projects,).
+    """
+    projects: pd.DataFrame
+    num_buckets: int
+    num_factors: int
+    num_years: int
+    active: np.ndarray
+    offered_volume: np.ndarray
+    factors: np.ndarray
+    weights: np.ndarray
+    scores: np.ndarray = None
+    ratings: np.ndarray = None
+    shortfall: np.ndarray = None
+    expected_value: np.ndarray = None
+    standard_deviation: np.ndarray = None
+    project_standard_deviation: np.ndarray = None
+    project_delivery_volume: np.ndarray = None
+    project_expected_value_percentage: np.ndarray = None
+    simulation_samples: np.ndarray = None
+    overall_rating: np.ndarray = None
+
+    @classmethod
+    def from_dataframe(cls, df_project: pd.DataFrame, num_buckets: int, num_factors: int, num_years: int = 10) -> 'Portfolio':
+        """
+        Create a Portfolio from the project DataFrame.
+
+        Parameters:
+        df_project (pd.DataFrame): The project data with 'offered_volume_year_Y', 'risk_bucket_X_factor_Z' and 'risk_bucket_X_weight_Z' columns.
+        num_buckets (int): The number of risk buckets.
+        num_factors (int): The number of risk factors in each risk bucket.
+        num_years (int, optional): The number of years. Defaults to 10.
+
+        Returns:
+        Portfolio: The portfolio with the input arrays filled in.
+        """
+        factor_columns = [f'risk_bucket_{bucket}_factor_{factor}' for bucket in range(1, num_buckets + 1) for factor in range(1, num_factors + 1)]
+        weight_columns = [f'risk_bucket_{bucket}_weight_{factor}' for bucket in range(1, num_buckets + 1) for factor in range(1, num_factors + 1)]
+        offered_volume_columns = [f'offered_volume_year_{year}' for year in range(1, num_years + 1)]
+
+        return cls(
+            projects=df_project,
+            num_buckets=num_buckets,
+            num_factors=num_factors,
+            num_years=num_years,
+            active=np.arange(1, num_years + 1) <= df_project['contract_duration'].to_numpy(dtype=float)[:, None],
+            offered_volume=df_project[offered_volume_columns].to_numpy(dtype=float),
+            factors=df_project[factor_columns].to_numpy(dtype=float).reshape(len(df_project), num_buckets, num_factors),
+            weights=df_project[weight_columns].to_numpy(dtype=float).reshape(len(df_project), num_buckets, num_factors)
+        )
+
+    def __len__(self) -> int:
+        return len(self.projects)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Materialize the portfolio as a wide project DataFrame.
+
+        The result arrays that have been calculated are added as columns in the same order and with the same names as
+        the DataFrame pipeline, in a single concatenation.
+
+        Returns:
+        pd.DataFrame: The project data with the calculated columns.
+        """
+        buckets = range(1, self.num_buckets + 1)
+        years = range(1, self.num_years + 1)
+        columns = {}
+
+        if self.scores is not None:
+            for bucket in buckets:
+                columns[f'risk_bucket_{bucket}_score'] = self.scores[:, bucket-1]
+        if self.ratings is not None:
+            for bucket in buckets:
+                columns[f'risk_bucket_{bucket}_rating'] = rating_labels(self.ratings[:, bucket-1])
+        for name, values in [('shortfall', self.shortfall), ('expected_value', self.expected_value), ('standard_deviation', self.standard_deviation)]:
+            if values is not None:
+                for bucket in buckets:
+                    for year in years:
+                        columns[f'risk_bucket_{bucket}_{name}_year_{year}'] = values[:, bucket-1, year-1]
+        if self.project_standard_deviation is not None:
+            for year in years:
+                columns[f'project_standard_deviation_year_{year}'] = self.project_standard_deviation[:, year-1]
+                columns[f'project_delivery_volume_year_{year}'] = self.project_delivery_volume[:, year-1]
+                columns[f'project_expected_value_percentage_year_{year}'] = self.project_expected_value_percentage[:, year-1]
+        if self.simulation_samples is not None:
+            for year in years:
+                columns[f'project_simulation_samples_year_{year}'] = self.simulation_samples[:, year-1]
+        if self.overall_rating is not None:
+            columns['overall_project_rating'] = rating_labels(self.overall_rating)
+
+        return pd.concat([self.projects, pd.DataFrame(columns, index=self.projects.index)], axis=1)
+
+def rating_labels(codes: np.ndarray) -> pd.Categorical:
+    """
+    Convert int8 rating codes into an ordered Categorical of RATING_LABELS.
+
+    Parameters:
+    codes (np.ndarray): The rating codes.
+
+    Returns:
+    pd.Categorical: The rating labels.
+    """
+    return pd.Categorical.from_codes(codes, categories=RATING_LABELS, ordered=True)
+
+def rating_codes(labels: pd.Series) -> np.ndarray:
+    """
+    Convert rating labels into int8 rating codes into RATING_LABELS, the inverse of rating_labels.
+
+    Parameters:
+    labels (pd.Series): The rating labels, as strings or as a Categorical.
+
+    Returns:
+    np.ndarray: The rating codes, with -1 for missing or unknown labels.
+    """
+    # The Categorical columns of Portfolio.to_dataframe already hold the codes, so they are not encoded again
+    if isinstance(labels.dtype, pd.CategoricalDtype) and list(labels.cat.categories) == RATING_LABELS:
+        return labels.cat.codes.to_numpy(dtype=np.int8)
+    return pd.Categorical(labels, categories=RATING_LABELS).codes.astype(np.int8)
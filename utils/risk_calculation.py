@@ -1,7 +1,23 @@
+import logging
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import time
 import pandas as pd
 import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc
+from utils.portfolio import Portfolio, RATING_LABELS, rating_codes
 
-def run_simulation(df_project: pd.DataFrame, num_buckets: int, num_samples: int = 10000, num_years: int = 10) -> pd.DataFrame:
+SIMULATION_ENGINES = ['loop', 'vectorized', 'analytic', 'crn', 'adaptive', 'memoized']
+ADAPTIVE_TOLERANCE = 0.002
+ADAPTIVE_BATCH_SIZE = 1000
+SAMPLERS = ['random', 'antithetic', 'lhs', 'sobol']
+SAMPLER_ENGINES = ['vectorized', 'crn', 'memoized']
+SAMPLER_COMPARISON_SAMPLES = [250, 1000, 4000]
+SIMULATION_PRECISIONS = ['float64', 'float32']
+
+def run_simulation(df_project: pd.DataFrame, num_buckets: int, num_samples: int = 10000, num_years: int = 10,
+                   rng: np.random.Generator = None) -> pd.DataFrame:
     """
     Run a simulation to calculate the projected delivery volume and its standard deviation.
 
@@ -10,11 +26,14 @@ def run_simulation(df_project: pd.DataFrame, num_buckets: int, num_samples: int
     num_buckets (int): The number of risk buckets.
     num_samples (int): The number of random samples to generate. Default is 10000.
     num_years (int): The number of years for which the simulation is run. Default is 10.
+    rng (numpy.random.Generator, optional): The random number generator. Defaults to None, which uses the global RNG.
 
     Returns:
     df_project (pandas.DataFrame): The input DataFrame with additional columns: 'project_standard_deviation_year_i' for i in range(1,num_years+1).
     """
 
+    random = np.random if rng is None else rng
+
     # Initialize the results arrays to NaN
     std_dev = np.full((len(df_project), num_years), np.nan)
     overall_project_delivery = np.full((len(df_project), num_years), np.nan)
@@ -31,7 +50,7 @@ def run_simulation(df_project: pd.DataFrame, num_buckets: int, num_samples: int
             for bucket in range(1, num_buckets + 1):
                 exp_val = row[f'risk_bucket_{bucket}_expected_value_year_{year+1}']
                 std = row[f'risk_bucket_{bucket}_standard_deviation_year_{year+1}']
-                samples.append(np.random.normal(loc=exp_val, scale=std, size=num_samples))
+                samples.append(random.normal(loc=exp_val, scale=std, size=num_samples))
 
             # Calculate the projected delivery volume for each set of input samples
             projected_delivery_volume_samples = np.sum(samples, axis=0)
@@ -49,6 +68,754 @@ def run_simulation(df_project: pd.DataFrame, num_buckets: int, num_samples: int
 
     return df_project
 
+def run_simulation_vectorized(df_project: pd.DataFrame, num_buckets: int, num_samples: int = 10000, num_years: int = 10, block_size: int = 64,
+                              memory_budget_mb: float = None, sampler: str = 'random', precision: str = 'float64') -> pd.DataFrame:
+    """
+    Run the delivery volume simulation for all projects using batched random draws.
+
+    This is a drop-in replacement for run_simulation. The active project years (years within the contract duration) are
+    simulated in blocks of block_size with one batched draw from the global RNG per block, instead of one call per project, year
+    and risk bucket. Samples are drawn in the same order as run_simulation, so both engines give identical results for
+    the same random state.
+
+    When memory_budget_mb is given, the block size is derived from the budget instead, each block is reduced to its
+    per-year statistics before the next one is drawn, and the peak memory of every block is written to the log.
+
+    With precision 'float32', the draws of each risk bucket are generated as float32 into a preallocated buffer and
+    added in place to the summed delivery volume samples, so a block needs two float32 arrays of samples instead of
+    num_buckets + 3 float64 arrays. The results are statistically equivalent, but not identical to the float64 draws.
+
+    Parameters:
+    df_project (pandas.DataFrame): A DataFrame containing the expected values and standard deviations for each risk bucket.
+    num_buckets (int): The number of risk buckets.
+    num_samples (int): The number of random samples to generate. Default is 10000.
+    num_years (int): The number of years for which the simulation is run. Default is 10.
+    block_size (int): The number of project years simulated per batch. Default is 64.
+    memory_budget_mb (float, optional): The memory budget for one block of samples in megabytes. Defaults to None.
+    sampler (str, optional): The sampler for the standard normal draws, one of SAMPLERS. Defaults to 'random'.
+    precision (str, optional): The precision of the draws, one of SIMULATION_PRECISIONS. Defaults to 'float64'.
+
+    Returns:
+    df_project (pandas.DataFrame): The input DataFrame with the same additional columns as run_simulation.
+
+    Raises:
+    ValueError: If the memory budget is too small to hold the samples for a single project year, or the sampler or precision is not supported.
+    """
+    expected_values = _stack_bucket_year_columns(df_project, 'expected_value', num_buckets, num_years)
+    standard_deviations = _stack_bucket_year_columns(df_project, 'standard_deviation', num_buckets, num_years)
+    active = _active_years(df_project['contract_duration'], num_years)
+
+    _check_simulation_options('vectorized', sampler, precision)
+    std_dev = _simulate_vectorized(expected_values, standard_deviations, active, num_samples, block_size, memory_budget_mb, sampler, precision)
+
+    return _add_simulation_results(df_project, std_dev, active, num_years)
+
+def run_simulation_parallel(df_project: pd.DataFrame, num_buckets: int, num_samples: int = 10000, num_years: int = 10, workers: int = 1,
+                            seed: int = None, shard_size: int = 256, memory_budget_mb: float = None, sampler: str = 'random',
+                            precision: str = 'float64') -> pd.DataFrame:
+    """
+    Run the vectorized delivery volume simulation on several processes with reproducible random streams.
+
+    The projects are split into shards of shard_size rows. Each shard gets its own numpy.random.Generator, spawned from
+    a single SeedSequence, and the shards are simulated in a ProcessPoolExecutor. Because the shards and their random
+    streams do not depend on the number of workers, the results are bit-identical for a given seed however many
+    workers are used.
+
+    Parameters:
+    df_project (pandas.DataFrame): A DataFrame containing the expected values and standard deviations for each risk bucket.
+    num_buckets (int): The number of risk buckets.
+    num_samples (int): The number of random samples to generate. Default is 10000.
+    num_years (int): The number of years for which the simulation is run. Default is 10.
+    workers (int): The number of worker processes. Default is 1, which runs the shards in the current process.
+    seed (int, optional): The seed for the SeedSequence. Defaults to None, which draws fresh entropy.
+    shard_size (int): The number of projects per shard. Default is 256.
+    memory_budget_mb (float, optional): The memory budget per block of samples in each worker. Defaults to None.
+    sampler (str, optional): The sampler for the standard normal draws, one of SAMPLERS. Defaults to 'random'.
+    precision (str, optional): The precision of the draws, one of SIMULATION_PRECISIONS (see run_simulation_vectorized). Defaults to 'float64'.
+
+    Returns:
+    df_project (pandas.DataFrame): The input DataFrame with the same additional columns as run_simulation.
+    """
+    expected_values = _stack_bucket_year_columns(df_project, 'expected_value', num_buckets, num_years)
+    standard_deviations = _stack_bucket_year_columns(df_project, 'standard_deviation', num_buckets, num_years)
+    active = _active_years(df_project['contract_duration'], num_years)
+
+    _check_simulation_options('vectorized', sampler, precision)
+    std_dev = _simulate_parallel(expected_values, standard_deviations, active, num_samples, workers, seed, shard_size, memory_budget_mb, sampler, precision)
+
+    return _add_simulation_results(df_project, std_dev, active, num_years)
+
+def run_simulation_analytic(df_project: pd.DataFrame, num_buckets: int, num_years: int = 10) -> pd.DataFrame:
+    """
+    Calculate the project standard deviation in closed form instead of by simulation.
+
+    The risk bucket draws are independent normals, so the standard deviation of their sum is the square root of the sum
+    of the risk bucket variances. This gives the value that the Monte Carlo simulation converges to, without sampling noise.
+
+    Parameters:
+    df_project (pandas.DataFrame): A DataFrame containing the standard deviations for each risk bucket.
+    num_buckets (int): The number of risk buckets.
+    num_years (int): The number of years to calculate. Default is 10.
+
+    Returns:
+    df_project (pandas.DataFrame): The input DataFrame with the same additional columns as run_simulation.
+    """
+    standard_deviations = _stack_bucket_year_columns(df_project, 'standard_deviation', num_buckets, num_years)
+    active = _active_years(df_project['contract_duration'], num_years)
+
+    std_dev = _analytic_standard_deviation(standard_deviations, active)
+
+    return _add_simulation_results(df_project, std_dev, active, num_years)
+
+def run_simulation_adaptive(df_project: pd.DataFrame, num_buckets: int, num_samples: int = 10000, num_years: int = 10, tolerance: float = ADAPTIVE_TOLERANCE,
+                            batch_size: int = ADAPTIVE_BATCH_SIZE, memory_budget_mb: float = None, seed: int = None) -> pd.DataFrame:
+    """
+    Run the delivery volume simulation with an adaptive number of samples per project year.
+
+    The samples are drawn in batches of batch_size. After each batch, the standard error of the project standard deviation
+    estimate (about std / sqrt(2n) after n samples) is checked, and a project year stops drawing once twice its standard error,
+    relative to the offered volume, is below the tolerance. That is the standard error of its expected value percentage, since
+    the delivery volume is the offered volume less two standard deviations. Project years with a low standard deviation
+    compared to their offered volume converge after a few batches, the others stop at num_samples.
+
+    Parameters:
+    df_project (pandas.DataFrame): A DataFrame containing the expected values and standard deviations for each risk bucket.
+    num_buckets (int): The number of risk buckets.
+    num_samples (int): The maximum number of random samples per project year. Default is 10000.
+    num_years (int): The number of years for which the simulation is run. Default is 10.
+    tolerance (float): The target standard error of the expected value percentage. Default is ADAPTIVE_TOLERANCE.
+    batch_size (int): The number of samples drawn per batch. Default is ADAPTIVE_BATCH_SIZE.
+    memory_budget_mb (float, optional): The memory budget for one block of samples in megabytes. Defaults to None.
+    seed (int, optional): The random seed. Defaults to None, which uses the global RNG.
+
+    Returns:
+    df_project (pandas.DataFrame): The input DataFrame with the same additional columns as run_simulation, and
+                                   'project_simulation_samples_year_i' columns with the number of samples used in each year.
+
+    Raises:
+    ValueError: If the tolerance is not positive.
+    """
+    expected_values = _stack_bucket_year_columns(df_project, 'expected_value', num_buckets, num_years)
+    standard_deviations = _stack_bucket_year_columns(df_project, 'standard_deviation', num_buckets, num_years)
+    offered_volume = _stack_year_columns(df_project, 'offered_volume', num_years)
+    active = _active_years(df_project['contract_duration'], num_years)
+
+    std_dev, simulation_samples = _simulate_adaptive(expected_values, standard_deviations, active, offered_volume, num_samples, tolerance,
+                                                     batch_size, memory_budget_mb, seed)
+
+    df_project = _add_simulation_results(df_project, std_dev, active, num_years)
+    for year in range(1, num_years + 1):
+        df_project[f'project_simulation_samples_year_{year}'] = simulation_samples[:, year-1]
+    return df_project
+
+def run_simulation_common(df_project: pd.DataFrame, num_buckets: int, num_samples: int = 10000, num_years: int = 10, seed: int = None,
+                          sampler: str = 'random') -> pd.DataFrame:
+    """
+    Run the delivery volume simulation with common random numbers.
+
+    Every project year is simulated from the same num_samples standard normal draws per risk bucket, generated once from
+    the seed. Because the draws only depend on the seed and the number of risk buckets and samples, runs of different
+    scenarios with the same seed use exactly the same random numbers, and the differences between their results are not
+    buried in Monte Carlo noise. The standard deviation of the summed draws is calculated from the sample covariance of
+    the base draws, which gives the same value as summing the scaled samples without generating them for every project year.
+
+    Parameters:
+    df_project (pandas.DataFrame): A DataFrame containing the standard deviations for each risk bucket.
+    num_buckets (int): The number of risk buckets.
+    num_samples (int): The number of random samples to generate. Default is 10000.
+    num_years (int): The number of years for which the simulation is run. Default is 10.
+    seed (int, optional): The seed for the base draws. Defaults to None, which draws fresh entropy.
+    sampler (str, optional): The sampler for the base draws, one of SAMPLERS. Defaults to 'random'.
+
+    Returns:
+    df_project (pandas.DataFrame): The input DataFrame with the same additional columns as run_simulation.
+
+    Notes:
+    The sampling errors of all project years are correlated, since they share the same draws.
+    """
+    standard_deviations = _stack_bucket_year_columns(df_project, 'standard_deviation', num_buckets, num_years)
+    active = _active_years(df_project['contract_duration'], num_years)
+
+    std_dev = _common_standard_deviation(standard_deviations, active, num_samples, seed, sampler)
+
+    return _add_simulation_results(df_project, std_dev, active, num_years)
+
+def run_simulation_memoized(df_project: pd.DataFrame, num_buckets: int, num_samples: int = 10000, num_years: int = 10, seed: int = None,
+                            sampler: str = 'random', precision: str = 'float64', memory_budget_mb: float = None, cache: dict = None) -> pd.DataFrame:
+    """
+    Run the delivery volume simulation once for each distinct combination of risk bucket ratings and year.
+
+    The shortfall of a risk bucket only depends on its rating and the year, and its standard deviation is
+    0.5 * offered volume * shortfall. The project standard deviation divided by the offered volume therefore only
+    depends on the tuple of risk bucket ratings and the year, so with 3 ratings and 5 risk buckets there are at most
+    243 * 10 distinct cases, however many projects there are. Each case is simulated once for one unit of offered
+    volume, stored in the cache, and scaled by the offered volume of every project year with the same ratings and year.
+    The number of cases simulated, the cache hit rate (the share of the distinct cases found in the cache) and the
+    number of project years per distinct case are logged.
+
+    Parameters:
+    df_project (pandas.DataFrame): A DataFrame containing the risk bucket ratings and standard deviations.
+    num_buckets (int): The number of risk buckets.
+    num_samples (int): The number of random samples to generate. Default is 10000.
+    num_years (int): The number of years for which the simulation is run. Default is 10.
+    seed (int, optional): The random seed. Defaults to None, which draws fresh entropy.
+    sampler (str, optional): The sampler for the standard normal draws, one of SAMPLERS. Defaults to 'random'.
+    precision (str, optional): The precision of the draws, one of SIMULATION_PRECISIONS. Defaults to 'float64'.
+    memory_budget_mb (float, optional): The memory budget per block of samples. Defaults to None.
+    cache (dict, optional): The cache of unit standard deviations keyed by (rating codes, year), which is filled in by the
+                            simulation. Pass the same dict to reuse the cases of an earlier call, which must have used the
+                            same default rates, recovery potential and number of samples. Defaults to None, which uses a new cache.
+
+    Returns:
+    df_project (pandas.DataFrame): The input DataFrame with the same additional columns as run_simulation.
+
+    Notes:
+    The sampling errors of project years with the same ratings and year are fully correlated, since they share the same simulation.
+    """
+    ratings = np.column_stack([rating_codes(df_project[f'risk_bucket_{bucket}_rating']) for bucket in range(1, num_buckets + 1)])
+    standard_deviations = _stack_bucket_year_columns(df_project, 'standard_deviation', num_buckets, num_years)
+    offered_volume = _stack_year_columns(df_project, 'offered_volume', num_years)
+    active = _active_years(df_project['contract_duration'], num_years)
+
+    std_dev = _memoized_standard_deviation(ratings, standard_deviations, offered_volume, active, num_samples, seed, sampler, precision,
+                                           memory_budget_mb, cache)
+
+    return _add_simulation_results(df_project, std_dev, active, num_years)
+
+def common_random_numbers(num_buckets: int, num_samples: int = 10000, seed: int = None, sampler: str = 'random') -> np.ndarray:
+    """
+    Generate the standard normal base draws shared by all project years in the common random numbers engine.
+
+    Parameters:
+    num_buckets (int): The number of risk buckets.
+    num_samples (int, optional): The number of random samples per risk bucket. Defaults to 10000.
+    seed (int, optional): The random seed. Defaults to None, which draws fresh entropy.
+    sampler (str, optional): The sampler for the base draws, one of SAMPLERS. Defaults to 'random'.
+
+    Returns:
+    numpy.ndarray: The base draws, shape (buckets, samples).
+    """
+    return standard_normal_draws(np.random.default_rng(seed), (1, num_buckets, num_samples), sampler)[0]
+
+def standard_normal_draws(rng: np.random.Generator, size: tuple, sampler: str = 'random') -> np.ndarray:
+    """
+    Draw standard normal samples for a block of project years with the selected sampler.
+
+    The samplers are:
+    - random: independent pseudo-random draws.
+    - antithetic: pairs of draws z and -z. The pairs have the same squared deviations, so the standard deviation is
+      estimated from half as many independent samples, and is less accurate than with the random sampler.
+    - lhs: Latin hypercube samples, with exactly one sample in each of num_samples equal probability strata for every
+      project year and risk bucket, transformed with the inverse normal distribution.
+    - sobol: a scrambled Sobol sequence over the risk buckets, randomly shifted (modulo 1) for each project year and
+      transformed with the inverse normal distribution.
+
+    Parameters:
+    rng (numpy.random.Generator): The random number generator, or the numpy.random module for the global RNG.
+    size (tuple): The shape of the draws, (project years, buckets, samples).
+    sampler (str, optional): The sampler, one of SAMPLERS. Defaults to 'random'.
+
+    Returns:
+    numpy.ndarray: The standard normal draws.
+
+    Raises:
+    ValueError: If the sampler is not one of SAMPLERS.
+
+    Notes:
+    The lhs and sobol samplers need about three times the memory of the random sampler for each block.
+    """
+    num_cells, num_buckets, num_samples = size
+    if sampler == 'random':
+        return rng.standard_normal(size=size)
+    if sampler == 'antithetic':
+        draws = rng.standard_normal(size=(num_cells, num_buckets, (num_samples + 1) // 2))
+        return np.concatenate([draws, -draws], axis=2)[:, :, :num_samples]
+    if sampler == 'lhs':
+        # Visit the strata in a random order, with a uniform draw within each stratum
+        strata = np.argsort(rng.random(size=size), axis=2)
+        uniform = (strata + rng.random(size=size)) / num_samples
+    elif sampler == 'sobol':
+        # Sobol sequences are balanced for powers of two, so draw the next power of two and keep the first num_samples points
+        points = qmc.Sobol(d=num_buckets, scramble=True, seed=_as_generator(rng)).random_base2(int(np.ceil(np.log2(max(num_samples, 1)))))[:num_samples]
+        uniform = (points.T[None, :, :] + rng.random(size=(num_cells, num_buckets, 1))) % 1
+    else:
+        raise ValueError(f"sampler must be one of the following: {', '.join(SAMPLERS)}")
+
+    # Keep the uniforms away from 0 and 1, where the inverse normal distribution is infinite
+    return ndtri(np.clip(uniform, 2 ** -53, 1 - 2 ** -53))
+
+def compare_samplers(portfolio: Portfolio, sample_counts: list = None, samplers: list = None, seed: int = None) -> pd.DataFrame:
+    """
+    Compare the error of the simulated project standard deviation with each sampler against the analytic value.
+
+    Parameters:
+    portfolio (Portfolio): The portfolio with the expected values and standard deviations.
+    sample_counts (list, optional): The numbers of samples to compare. Defaults to SAMPLER_COMPARISON_SAMPLES.
+    samplers (list, optional): The samplers to compare. Defaults to SAMPLERS.
+    seed (int, optional): The random seed. Defaults to None.
+
+    Returns:
+    pd.DataFrame: The root mean square and maximum relative error and the run time in seconds of each sampler and number of samples.
+    """
+    sample_counts = SAMPLER_COMPARISON_SAMPLES if sample_counts is None else sample_counts
+    samplers = SAMPLERS if samplers is None else samplers
+    analytic = _analytic_standard_deviation(portfolio.standard_deviation, portfolio.active)
+    compared = portfolio.active & (analytic > 0)
+
+    rows = []
+    for num_samples in sample_counts:
+        for sampler in samplers:
+            start = time.perf_counter()
+            std_dev = _simulate_parallel(portfolio.expected_value, portfolio.standard_deviation, portfolio.active, num_samples, seed=seed, sampler=sampler)
+            seconds = time.perf_counter() - start
+            relative_error = std_dev[compared] / analytic[compared] - 1
+            rows.append({'sampler': sampler, 'samples': num_samples, 'rms_relative_error': np.sqrt(np.mean(relative_error ** 2)),
+                         'max_relative_error': np.max(np.abs(relative_error)), 'seconds': seconds})
+    return pd.DataFrame(rows)
+
+def compare_simulation_engines(df_project: pd.DataFrame, num_buckets: int, num_samples: int = 10000, num_years: int = 10, seed: int = None) -> dict:
+    """
+    Compare the analytic project standard deviation with the Monte Carlo simulation.
+
+    Parameters:
+    df_project (pandas.DataFrame): A DataFrame containing the expected values and standard deviations for each risk bucket.
+    num_buckets (int): The number of risk buckets.
+    num_samples (int, optional): The number of random samples for the Monte Carlo simulation. Defaults to 10000.
+    num_years (int, optional): The number of years to compare. Defaults to 10.
+    seed (int, optional): The random seed for the Monte Carlo simulation. Defaults to None.
+
+    Returns:
+    dict: The largest absolute and relative discrepancies, and the row position and year where each occurs.
+    """
+    std_dev_columns = [f'project_standard_deviation_year_{year}' for year in range(1, num_years + 1)]
+    analytic = run_simulation_analytic(df_project.copy(), num_buckets, num_years)[std_dev_columns].to_numpy()
+    monte_carlo = simulate_projects(df_project.copy(), num_buckets, num_samples=num_samples, num_years=num_years, seed=seed)[std_dev_columns].to_numpy()
+
+    absolute = np.abs(monte_carlo - analytic)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = np.where(analytic > 0, absolute / analytic, 0)
+    absolute = np.nan_to_num(absolute, nan=-1)
+    relative = np.nan_to_num(relative, nan=-1)
+
+    absolute_position = np.unravel_index(np.argmax(absolute), absolute.shape)
+    relative_position = np.unravel_index(np.argmax(relative), relative.shape)
+    return {
+        'max_absolute_difference': max(float(absolute[absolute_position]), 0.0),
+        'max_absolute_difference_row': int(absolute_position[0]),
+        'max_absolute_difference_year': int(absolute_position[1]) + 1,
+        'max_relative_difference': max(float(relative[relative_position]), 0.0),
+        'max_relative_difference_row': int(relative_position[0]),
+        'max_relative_difference_year': int(relative_position[1]) + 1,
+    }
+
+def simulate_projects(df_project: pd.DataFrame, num_buckets: int, engine: str = 'vectorized', num_samples: int = 10000, num_years: int = 10,
+                      memory_budget_mb: float = None, workers: int = 1, seed: int = None, tolerance: float = ADAPTIVE_TOLERANCE,
+                      sampler: str = 'random', precision: str = 'float64') -> pd.DataFrame:
+    """
+    Run the project simulation with the selected engine.
+
+    The vectorized engine runs in parallel mode (see run_simulation_parallel) when more than one worker or a seed is given.
+    The crn engine uses common random numbers (see run_simulation_common), the adaptive engine stops drawing samples
+    for each project year once its estimate has converged (see run_simulation_adaptive), and the memoized engine
+    simulates each distinct combination of risk bucket ratings and year once (see run_simulation_memoized).
+
+    Parameters:
+    df_project (pandas.DataFrame): A DataFrame containing the expected values and standard deviations for each risk bucket.
+    num_buckets (int): The number of risk buckets.
+    engine (str, optional): The simulation engine, one of SIMULATION_ENGINES. Defaults to 'vectorized'.
+    num_samples (int, optional): The number of random samples to generate. Defaults to 10000.
+    num_years (int, optional): The number of years for which the simulation is run. Defaults to 10.
+    memory_budget_mb (float, optional): The memory budget per block of samples for the vectorized engine. Defaults to None.
+    workers (int, optional): The number of worker processes for the vectorized engine. Defaults to 1.
+    seed (int, optional): The random seed for the loop, vectorized, crn, adaptive and memoized engines. Defaults to None.
+    tolerance (float, optional): The target standard error of the expected value percentage for the adaptive engine. Defaults to ADAPTIVE_TOLERANCE.
+    sampler (str, optional): The sampler for the vectorized, crn and memoized engines, one of SAMPLERS. Defaults to 'random'.
+    precision (str, optional): The precision of the draws for the vectorized and memoized engines, one of SIMULATION_PRECISIONS. Defaults to 'float64'.
+
+    Returns:
+    df_project (pandas.DataFrame): The input DataFrame with the simulation result columns.
+
+    Raises:
+    ValueError: If the engine is not one of SIMULATION_ENGINES, or the sampler or precision is not supported by the engine.
+    """
+    if engine not in SIMULATION_ENGINES:
+        raise ValueError(f"engine must be one of the following: {', '.join(SIMULATION_ENGINES)}")
+    _check_simulation_options(engine, sampler, precision)
+    if engine == 'loop':
+        return run_simulation(df_project, num_buckets, num_samples, num_years, _loop_generator(seed))
+    if engine == 'adaptive':
+        return run_simulation_adaptive(df_project, num_buckets, num_samples, num_years, tolerance, memory_budget_mb=memory_budget_mb, seed=seed)
+    if engine == 'memoized':
+        return run_simulation_memoized(df_project, num_buckets, num_samples, num_years, seed, sampler, precision, memory_budget_mb)
+
+    expected_values = _stack_bucket_year_columns(df_project, 'expected_value', num_buckets, num_years)
+    standard_deviations = _stack_bucket_year_columns(df_project, 'standard_deviation', num_buckets, num_years)
+    active = _active_years(df_project['contract_duration'], num_years)
+    std_dev = _simulate_standard_deviation(expected_values, standard_deviations, active, engine, num_samples, memory_budget_mb, workers, seed, sampler,
+                                           precision)
+
+    return _add_simulation_results(df_project, std_dev, active, num_years)
+
+def simulation_block_size(memory_budget_mb: float, num_buckets: int, num_samples: int = 10000, precision: str = 'float64') -> int:
+    """
+    Calculate how many project years can be simulated per block within a memory budget.
+
+    Each project year needs num_buckets arrays of samples, plus the summed delivery volume samples and two temporary
+    arrays of the same size used by np.std. With float32 precision, it needs one buffer for the draws of a risk bucket
+    and one for the summed delivery volume samples.
+
+    Parameters:
+    memory_budget_mb (float): The memory budget for one block in megabytes.
+    num_buckets (int): The number of risk buckets.
+    num_samples (int, optional): The number of random samples per project year. Defaults to 10000.
+    precision (str, optional): The precision of the draws, one of SIMULATION_PRECISIONS. Defaults to 'float64'.
+
+    Returns:
+    int: The number of project years per block.
+
+    Raises:
+    ValueError: If the budget cannot hold a single project year.
+    """
+    if precision == 'float32':
+        bytes_per_cell = 2 * num_samples * np.dtype(np.float32).itemsize
+    else:
+        bytes_per_cell = (num_buckets + 3) * num_samples * np.dtype(float).itemsize
+    block_size = int(memory_budget_mb * 1024 ** 2 // bytes_per_cell)
+    if block_size < 1:
+        raise ValueError(f"Memory budget of {memory_budget_mb} MB is too small, at least {bytes_per_cell / 1024 ** 2:.2f} MB is needed per project year")
+    return block_size
+
+def _stack_bucket_year_columns(df_project: pd.DataFrame, name: str, num_buckets: int, num_years: int, dtype: type = float) -> np.ndarray:
+    """
+    Stack the 'risk_bucket_X_{name}_year_Y' columns into an array of shape (projects, buckets, years).
+    """
+    columns = [f'risk_bucket_{bucket}_{name}_year_{year}' for bucket in range(1, num_buckets + 1) for year in range(1, num_years + 1)]
+    return df_project[columns].to_numpy(dtype=dtype).reshape(len(df_project), num_buckets, num_years)
+
+def _stack_year_columns(df_project: pd.DataFrame, name: str, num_years: int, dtype: type = float) -> np.ndarray:
+    """
+    Stack the '{name}_year_Y' columns into an array of shape (projects, years).
+    """
+    return df_project[[f'{name}_year_{year}' for year in range(1, num_years + 1)]].to_numpy(dtype=dtype)
+
+def _active_years(contract_duration: pd.Series, num_years: int) -> np.ndarray:
+    """
+    Return a boolean array of shape (projects, years) that is True for years within the contract duration.
+    """
+    return np.arange(1, num_years + 1) <= contract_duration.to_numpy(dtype=float)[:, None]
+
+def _active_cells(values: np.ndarray, active: np.ndarray) -> np.ndarray:
+    """
+    Select the active project years of a (projects, buckets, years) array as an array of shape (cells, buckets).
+
+    The cells are ordered by project and then by year, which is the order run_simulation draws its samples in.
+    """
+    return values.transpose(0, 2, 1)[active]
+
+def _simulate_vectorized(expected_values: np.ndarray, standard_deviations: np.ndarray, active: np.ndarray, num_samples: int,
+                         block_size: int = 64, memory_budget_mb: float = None, sampler: str = 'random', precision: str = 'float64') -> np.ndarray:
+    """
+    Simulate the project standard deviation of every active project year with the global RNG, shape (projects, years).
+    """
+    if memory_budget_mb is not None:
+        block_size = simulation_block_size(memory_budget_mb, expected_values.shape[1], num_samples, precision)
+
+    # Simulate only the project years within the contract duration
+    std_dev = np.full(active.shape, np.nan)
+    std_dev[active] = _simulate_cells(_active_cells(expected_values, active), _active_cells(standard_deviations, active), num_samples,
+                                      block_size, report_memory=memory_budget_mb is not None, sampler=sampler, precision=precision)
+    return std_dev
+
+def _simulate_parallel(expected_values: np.ndarray, standard_deviations: np.ndarray, active: np.ndarray, num_samples: int, workers: int = 1,
+                       seed: int = None, shard_size: int = 256, memory_budget_mb: float = None, sampler: str = 'random',
+                       precision: str = 'float64') -> np.ndarray:
+    """
+    Simulate the project standard deviation of every active project year in seeded shards, shape (projects, years).
+    """
+    block_size = 64 if memory_budget_mb is None else simulation_block_size(memory_budget_mb, expected_values.shape[1], num_samples, precision)
+
+    # Split the projects into fixed shards, each with its own random stream
+    shards = [slice(start, start + shard_size) for start in range(0, len(active), shard_size)]
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(shards))
+    shard_args = [(_active_cells(expected_values[shard], active[shard]), _active_cells(standard_deviations[shard], active[shard]), num_samples,
+                   block_size, memory_budget_mb is not None, seed_sequence, sampler, precision) for shard, seed_sequence in zip(shards, seed_sequences)]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            shard_results = list(executor.map(_simulate_shard, *zip(*shard_args)))
+    else:
+        shard_results = [_simulate_shard(*args) for args in shard_args]
+
+    std_dev = np.full(active.shape, np.nan)
+    for shard, shard_std_dev in zip(shards, shard_results):
+        shard_values = std_dev[shard]
+        shard_values[active[shard]] = shard_std_dev
+    return std_dev
+
+def _analytic_standard_deviation(standard_deviations: np.ndarray, active: np.ndarray) -> np.ndarray:
+    """
+    Calculate the project standard deviation as the square root of the summed risk bucket variances, shape (projects, years).
+    """
+    return np.where(active, np.sqrt(np.sum(standard_deviations ** 2, axis=1)), np.nan)
+
+def _simulate_standard_deviation(expected_values: np.ndarray, standard_deviations: np.ndarray, active: np.ndarray, engine: str = 'vectorized',
+                                 num_samples: int = 10000, memory_budget_mb: float = None, workers: int = 1, seed: int = None,
+                                 sampler: str = 'random', precision: str = 'float64') -> np.ndarray:
+    """
+    Calculate the project standard deviation with one of the array based engines, shape (projects, years).
+    """
+    if engine == 'analytic':
+        return _analytic_standard_deviation(standard_deviations, active)
+    if engine == 'vectorized' and (workers > 1 or seed is not None):
+        return _simulate_parallel(expected_values, standard_deviations, active, num_samples, workers, seed, memory_budget_mb=memory_budget_mb, sampler=sampler,
+                                  precision=precision)
+    if engine == 'vectorized':
+        return _simulate_vectorized(expected_values, standard_deviations, active, num_samples, memory_budget_mb=memory_budget_mb, sampler=sampler,
+                                    precision=precision)
+    if engine == 'crn':
+        return _common_standard_deviation(standard_deviations, active, num_samples, seed, sampler)
+    raise ValueError(f"engine must be one of the following: {', '.join(SIMULATION_ENGINES)}")
+
+def _common_standard_deviation(standard_deviations: np.ndarray, active: np.ndarray, num_samples: int = 10000, seed: int = None,
+                               sampler: str = 'random') -> np.ndarray:
+    """
+    Calculate the project standard deviation of every active project year from common random numbers, shape (projects, years).
+    """
+    # The variance of the summed draws is s' C s, with C the sample covariance of the base draws and s the bucket standard deviations
+    covariance = np.cov(common_random_numbers(standard_deviations.shape[1], num_samples, seed, sampler), bias=True)
+    variance = np.einsum('pby,bc,pcy->py', standard_deviations, covariance, standard_deviations)
+    return np.where(active, np.sqrt(np.fmax(variance, 0)), np.nan)
+
+def _memoized_standard_deviation(ratings: np.ndarray, standard_deviations: np.ndarray, offered_volume: np.ndarray, active: np.ndarray,
+                                 num_samples: int = 10000, seed: int = None, sampler: str = 'random', precision: str = 'float64',
+                                 memory_budget_mb: float = None, cache: dict = None) -> np.ndarray:
+    """
+    Simulate the project standard deviation once per distinct (rating codes, year) case and scale it by the offered volume, shape (projects, years).
+    """
+    cache = {} if cache is None else cache
+    num_years = active.shape[1]
+    projects, years = np.nonzero(active)
+
+    # Number the distinct rating tuples, then the distinct (rating tuple, year) cases of the active project years
+    rating_tuples, tuple_index = np.unique(ratings, axis=0, return_inverse=True)
+    cases, case_index = np.unique(tuple_index.reshape(-1)[projects] * num_years + years, return_inverse=True)
+    keys = [(tuple(rating_tuples[case // num_years].tolist()), int(case % num_years) + 1) for case in cases]
+
+    # The bucket standard deviations per unit of offered volume are the same for every project year of a case,
+    # take them from the project years with a positive offered volume
+    offered = offered_volume[projects, years]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unit_standard_deviations = np.where((offered > 0)[:, None], standard_deviations[projects, :, years] / offered[:, None], np.nan)
+    case_standard_deviations = np.full((len(cases), ratings.shape[1]), np.nan)
+    np.fmax.at(case_standard_deviations, case_index, unit_standard_deviations)
+    case_standard_deviations = np.nan_to_num(case_standard_deviations)
+
+    missing = [case for case, key in enumerate(keys) if key not in cache]
+    if missing:
+        block_size = simulation_block_size(memory_budget_mb, ratings.shape[1], num_samples, precision) if memory_budget_mb is not None else 64
+        simulated = _simulate_cells(np.zeros((len(missing), ratings.shape[1])), case_standard_deviations[missing], num_samples, block_size,
+                                    rng=np.random.default_rng(seed), sampler=sampler, precision=precision)
+        cache.update(zip([keys[case] for case in missing], simulated))
+    logging.info(f"Memoized simulation: {len(missing)} of {len(keys)} distinct (rating, year) cases simulated, "
+                 f"cache hit rate {(len(keys) - len(missing)) / max(len(keys), 1):.1%}, "
+                 f"{len(projects)} project years ({len(projects) / max(len(keys), 1):.1f} per case)")
+
+    std_dev = np.full(active.shape, np.nan)
+    std_dev[projects, years] = np.array([cache[key] for key in keys])[case_index] * offered
+    return std_dev
+
+def _simulate_adaptive(expected_values: np.ndarray, standard_deviations: np.ndarray, active: np.ndarray, offered_volume: np.ndarray,
+                       num_samples: int = 10000, tolerance: float = ADAPTIVE_TOLERANCE, batch_size: int = ADAPTIVE_BATCH_SIZE,
+                       memory_budget_mb: float = None, seed: int = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Simulate the project standard deviation of every active project year in batches until it converges, shape (projects, years).
+
+    Returns the standard deviations and the number of samples used for each project year, which is 0 outside the contract duration.
+    """
+    if tolerance <= 0:
+        raise ValueError("tolerance must be greater than 0")
+    random = np.random if seed is None else np.random.default_rng(seed)
+    block_size = 64 if memory_budget_mb is None else simulation_block_size(memory_budget_mb, expected_values.shape[1], batch_size)
+
+    cell_expected_values = _active_cells(expected_values, active)
+    cell_standard_deviations = _active_cells(standard_deviations, active)
+    cell_offered_volume = offered_volume[active]
+
+    # Running count, mean and sum of squared deviations of the summed draws of each cell
+    count = np.zeros(len(cell_expected_values), dtype=np.int64)
+    mean = np.zeros(len(cell_expected_values))
+    squares = np.zeros(len(cell_expected_values))
+    remaining = np.arange(len(cell_expected_values))
+
+    while len(remaining) > 0:
+        batch = min(batch_size, num_samples - int(count[remaining[0]]))
+        for start in range(0, len(remaining), block_size):
+            cells = remaining[start:start + block_size]
+            samples = random.standard_normal(size=(len(cells), expected_values.shape[1], batch))
+            samples *= cell_standard_deviations[cells, :, None]
+            samples += cell_expected_values[cells, :, None]
+            totals = np.sum(samples, axis=1)
+            del samples
+
+            # Merge the batch into the running statistics
+            batch_mean = np.mean(totals, axis=1)
+            batch_squares = np.sum((totals - batch_mean[:, None]) ** 2, axis=1)
+            delta = batch_mean - mean[cells]
+            merged_count = count[cells] + batch
+            mean[cells] += delta * batch / merged_count
+            squares[cells] += batch_squares + delta ** 2 * count[cells] * batch / merged_count
+            count[cells] = merged_count
+
+        # Stop the cells whose expected value percentage has converged, or that reached the maximum number of samples
+        std_dev = np.sqrt(squares[remaining] / count[remaining])
+        standard_error = 2 * std_dev / np.sqrt(2 * (count[remaining] - 1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            converged = standard_error / cell_offered_volume[remaining] <= tolerance
+        remaining = remaining[~converged & (count[remaining] < num_samples)]
+
+    std_dev = np.full(active.shape, np.nan)
+    std_dev[active] = np.sqrt(squares / count)
+    simulation_samples = np.zeros(active.shape, dtype=np.int64)
+    simulation_samples[active] = count
+    logging.info(f"Adaptive simulation: {count.sum()} samples for {len(count)} project years, "
+                 f"{count.sum() / max(len(count) * num_samples, 1):.1%} of {num_samples} samples each")
+    return std_dev, simulation_samples
+
+def _check_simulation_options(engine: str, sampler: str, precision: str = 'float64') -> None:
+    """
+    Raise a ValueError if the sampler or precision is unknown or not supported by the engine.
+    """
+    if sampler not in SAMPLERS:
+        raise ValueError(f"sampler must be one of the following: {', '.join(SAMPLERS)}")
+    if sampler != 'random' and engine not in SAMPLER_ENGINES + ['analytic']:
+        raise ValueError(f"The {sampler} sampler is only supported by the following engines: {', '.join(SAMPLER_ENGINES)}")
+    if precision not in SIMULATION_PRECISIONS:
+        raise ValueError(f"precision must be one of the following: {', '.join(SIMULATION_PRECISIONS)}")
+    if precision == 'float32' and (engine not in ['vectorized', 'memoized', 'analytic'] or sampler != 'random'):
+        raise ValueError("float32 precision is only supported by the vectorized and memoized engines with the random sampler")
+
+def _loop_generator(seed: int = None) -> np.random.Generator:
+    """
+    Return the generator for the loop engine, or None to use the global RNG when no seed is given.
+    """
+    return np.random.default_rng(seed) if seed is not None else None
+
+def _simulate_cells(expected_values: np.ndarray, standard_deviations: np.ndarray, num_samples: int, block_size: int, report_memory: bool = False,
+                    rng: np.random.Generator = None, sampler: str = 'random', precision: str = 'float64') -> np.ndarray:
+    """
+    Simulate the standard deviation of the summed risk bucket draws for each project year.
+
+    Parameters:
+    expected_values (numpy.ndarray): The bucket expected values, shape (cells, buckets).
+    standard_deviations (numpy.ndarray): The bucket standard deviations, shape (cells, buckets).
+    num_samples (int): The number of random samples per cell.
+    block_size (int): The number of cells drawn per batch.
+    report_memory (bool, optional): Whether to log the peak memory of each block. Defaults to False.
+    rng (numpy.random.Generator, optional): The random number generator. Defaults to None, which uses the global RNG.
+    sampler (str, optional): The sampler for the standard normal draws, one of SAMPLERS. Defaults to 'random'.
+    precision (str, optional): The precision of the draws, one of SIMULATION_PRECISIONS. Defaults to 'float64'.
+
+    Returns:
+    numpy.ndarray: The standard deviation of the projected delivery volume for each cell.
+    """
+    random = np.random if rng is None else rng
+    started_tracing = report_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    buffer_bytes = 0
+    if precision == 'float32':
+        # Only Generators can draw float32 samples into an existing buffer
+        random = _as_generator(random)
+        draws = np.empty((min(block_size, len(expected_values)), num_samples), dtype=np.float32)
+        totals = np.empty_like(draws)
+        buffer_bytes = draws.nbytes + totals.nbytes
+
+    std_dev = np.empty(len(expected_values))
+    for block, start in enumerate(range(0, len(expected_values), block_size), start=1):
+        stop = start + block_size
+        if report_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+
+        if precision == 'float32':
+            std_dev[start:stop] = _float32_standard_deviation(standard_deviations[start:stop], random, draws, totals)
+        else:
+            # Scale standard normal draws in place, which is equivalent to normal() but avoids per-element broadcasting
+            samples = standard_normal_draws(random, (len(expected_values[start:stop]), expected_values.shape[1], num_samples), sampler)
+            samples *= standard_deviations[start:stop, :, None]
+            samples += expected_values[start:stop, :, None]
+            std_dev[start:stop] = np.std(np.sum(samples, axis=1), axis=1)
+
+            # Release the block before the next one is drawn
+            del samples
+        if report_memory:
+            # The float32 buffers are allocated once and used by every block, so they are part of the peak of each block
+            peak = tracemalloc.get_traced_memory()[1] - baseline + buffer_bytes
+            logging.info(f"Simulation block {block}: {min(stop, len(expected_values)) - start} project years, peak memory {peak / 1024 ** 2:.1f} MB")
+
+    if started_tracing:
+        tracemalloc.stop()
+    return std_dev
+
+def _float32_standard_deviation(standard_deviations: np.ndarray, rng: np.random.Generator, draws: np.ndarray, totals: np.ndarray) -> np.ndarray:
+    """
+    Simulate the standard deviation of the summed risk bucket draws for a block of cells with float32 draws.
+
+    The draws of each risk bucket are generated into the draws buffer and added in place to the totals buffer. The
+    expected values only shift the totals, so they are left out. This keeps the totals centred on zero, and the variance
+    can then be reduced in a single pass as the mean of the squares less the squared mean, with float64 accumulators.
+    """
+    draws, totals = draws[:len(standard_deviations)], totals[:len(standard_deviations)]
+    scales = standard_deviations.astype(np.float32)
+
+    totals.fill(0)
+    for bucket in range(standard_deviations.shape[1]):
+        rng.standard_normal(dtype=np.float32, out=draws)
+        draws *= scales[:, bucket, None]
+        totals += draws
+
+    mean = np.add.reduce(totals, axis=1, dtype=np.float64) / totals.shape[1]
+    mean_square = np.add.reduce(np.square(totals, out=draws), axis=1, dtype=np.float64) / totals.shape[1]
+    return np.sqrt(np.fmax(mean_square - mean ** 2, 0))
+
+def _as_generator(rng: np.random.Generator) -> np.random.Generator:
+    """
+    Return the generator itself, or a generator seeded from the global RNG when given the numpy.random module.
+    """
+    return rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng.randint(2 ** 31 - 1))
+
+def _simulate_shard(expected_values: np.ndarray, standard_deviations: np.ndarray, num_samples: int, block_size: int, report_memory: bool,
+                    seed_sequence: np.random.SeedSequence, sampler: str = 'random', precision: str = 'float64') -> np.ndarray:
+    """
+    Simulate the project years of one shard with a generator created from its seed sequence.
+    """
+    rng = np.random.default_rng(seed_sequence)
+    return _simulate_cells(expected_values, standard_deviations, num_samples, block_size, report_memory, rng, sampler, precision)
+
+def _delivery_results(offered_volume: np.ndarray, std_dev: np.ndarray, active: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate the project delivery volume and expected value percentage from the project standard deviation.
+    """
+    # Delivery volume is the offered volume less two standard deviations, floored at zero
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overall_project_delivery = np.where(active, np.fmax(0, offered_volume - (2 * std_dev)), np.nan)
+        expected_value_percentage = overall_project_delivery / offered_volume
+    return overall_project_delivery, expected_value_percentage
+
+def _add_simulation_results(df_project: pd.DataFrame, std_dev: np.ndarray, active: np.ndarray, num_years: int) -> pd.DataFrame:
+    """
+    Add the project standard deviation, delivery volume and expected value percentage columns to the DataFrame.
+    """
+    offered_volume = _stack_year_columns(df_project, 'offered_volume', num_years)
+    overall_project_delivery, expected_value_percentage = _delivery_results(offered_volume, std_dev, active)
+
+    for year in range(1, num_years + 1):
+        df_project[f'project_standard_deviation_year_{year}'] = std_dev[:, year-1]
+        df_project[f'project_delivery_volume_year_{year}'] = overall_project_delivery[:, year-1]
+        df_project[f'project_expected_value_percentage_year_{year}'] = expected_value_percentage[:, year-1]
+
+    return df_project
+
 def calculate_risk_bucket_scores(df_project: pd.DataFrame, num_buckets: int = 5, num_factors: int = 5) -> pd.DataFrame:
     """
     Calculate risk bucket scores for a given DataFrame.
@@ -65,16 +832,12 @@ def calculate_risk_bucket_scores(df_project: pd.DataFrame, num_buckets: int = 5,
     This function assumes that the input DataFrame has columns named 'risk_bucket_X_factor_Y' and 'risk_bucket_X_weight_Y',
     where X is the risk bucket number and Y is the factor number.
     """
+    factors = _stack_bucket_factor_columns(df_project, 'factor', num_buckets, num_factors)
+    weights = _stack_bucket_factor_columns(df_project, 'weight', num_buckets, num_factors)
+    scores = _bucket_scores(factors, weights)
+
     for bucket in range(1, num_buckets + 1):
-        # Create lists of factor and weight columns for the current risk bucket
-        factors = [f'risk_bucket_{bucket}_factor_{i}' for i in range(1, num_factors + 1)]
-        weights = [f'risk_bucket_{bucket}_weight_{i}' for i in range(1, num_factors + 1)]
-        
-        # Calculate the risk bucket score by summing the products of factors and weights
-        df_project[f'risk_bucket_{bucket}_score'] = sum(df_project[factor] * df_project[weight] for factor, weight in zip(factors, weights))
-        
-        # Ensure scores are between 0 and 10
-        df_project[f'risk_bucket_{bucket}_score'] = df_project[f'risk_bucket_{bucket}_score'].apply(lambda x: max(0, min(x, 10)))
+        df_project[f'risk_bucket_{bucket}_score'] = scores[:, bucket-1]
     
     return df_project
 
@@ -103,6 +866,31 @@ def score_to_rating_vectorized(scores: pd.Series) -> pd.Series:
     ratings = pd.cut(scores, bins=[-1, 3.5, 7.5, 10], labels=['C', 'Speculative', 'Investment'], include_lowest=True)
     return ratings
     
+def score_to_rating_codes(scores: np.ndarray, validate: bool = True) -> np.ndarray:
+    """
+    Convert scores into int8 rating codes into RATING_LABELS, using the same bins as score_to_rating_vectorized.
+
+    Parameters:
+    scores (np.ndarray): The scores, of any shape.
+    validate (bool, optional): Whether to check the scores for NaN values and the range 0 to 10. Defaults to True.
+
+    Returns:
+    np.ndarray: The int8 rating codes, with the shape of scores.
+
+    Raises:
+    ValueError: If validate is True and the scores contain NaN values or are not between 0 and 10.
+
+    Notes:
+    Pass validate=False only for scores that are already clipped between 0 and 10 without NaN values, such as those of
+    score_portfolio and score_models, to skip two full passes over the scores.
+    """
+    if validate:
+        if np.isnan(scores).any():
+            raise ValueError("Scores cannot contain NaN values")
+        if not ((scores >= 0) & (scores <= 10)).all():
+            raise ValueError("All scores must be between 0 and 10")
+    return np.digitize(scores, [3.5, 7.5], right=True).astype(np.int8)
+
 def calculate_yearly_shortfall(df_project: pd.DataFrame, df_default_rates: pd.DataFrame, df_recovery_potential: pd.DataFrame, risk_bucket_count: int, num_years: int = 10) -> pd.DataFrame:
     """
     Calculate the shortfall for each year and risk bucket.
@@ -117,25 +905,45 @@ def calculate_yearly_shortfall(df_project: pd.DataFrame, df_default_rates: pd.Da
     Returns:
     DataFrame: The input DataFrame with the calculated shortfalls.
     """
-    # Initialize a DataFrame to store the shortfalls
-    shortfalls = pd.DataFrame(index=df_project.index)
-    
-    # Iterate over each risk bucket and year
+    # Look up the precomputed shortfall of each rating by integer rating code for all projects at once
+    shortfall_table = calculate_shortfall_table(df_default_rates, df_recovery_potential, num_years)
+    active = _active_years(df_project['contract_duration'], num_years)
+    has_active_years = active.any(axis=1)
+
+    bucket_codes = np.empty((len(df_project), risk_bucket_count), dtype=np.intp)
     for j in range(1, risk_bucket_count + 1):
-        for i in range(1, num_years + 1):
-            # Calculate the shortfall for this year and risk bucket
-            shortfalls[f'risk_bucket_{j}_shortfall_year_{i}'] = df_project.apply(
-                lambda row: np.clip(
-                    (df_default_rates.loc[row[f'risk_bucket_{j}_rating'], min(i, row['contract_duration'])] 
-                     * (1 - df_recovery_potential.loc[row[f'risk_bucket_{j}_rating'], min(i, row['contract_duration'])])) 
-                    / 100, 0, 1) if i <= row['contract_duration'] else np.nan, 
-                axis=1)
-    
+        bucket_codes[:, j-1] = shortfall_table.index.get_indexer(df_project[f'risk_bucket_{j}_rating'])
+        unknown_ratings = (bucket_codes[:, j-1] < 0) & has_active_years
+        if unknown_ratings.any():
+            raise KeyError(f"Unknown ratings in risk_bucket_{j}_rating: {list(df_project.loc[unknown_ratings, f'risk_bucket_{j}_rating'].unique())}")
+
+    bucket_shortfalls = _gather_shortfalls(bucket_codes, shortfall_table.to_numpy(), active)
+    shortfalls = _bucket_year_columns(bucket_shortfalls, 'shortfall')
+
     # Concatenate the shortfalls with the input DataFrame
-    df_project = pd.concat([df_project, shortfalls], axis=1)
+    df_project = pd.concat([df_project, pd.DataFrame(shortfalls, index=df_project.index)], axis=1)
     
     return df_project
 
+def calculate_shortfall_table(df_default_rates: pd.DataFrame, df_recovery_potential: pd.DataFrame, num_years: int = 10) -> pd.DataFrame:
+    """
+    Calculate the shortfall for each rating and year.
+
+    Parameters:
+    df_default_rates (DataFrame): The DataFrame containing the default rates.
+    df_recovery_potential (DataFrame): The DataFrame containing the recovery potentials.
+    num_years (int, optional): The number of years. Defaults to 10.
+
+    Returns:
+    DataFrame: The shortfalls, (default rate * (1 - recovery potential)) / 100 clipped between 0 and 1, with the
+    ratings of df_default_rates as the index and the years as the columns.
+    """
+    years = list(range(1, num_years + 1))
+    default_rates = df_default_rates.loc[:, years].to_numpy(dtype=float)
+    recovery_potential = df_recovery_potential.loc[df_default_rates.index, years].to_numpy(dtype=float)
+
+    return pd.DataFrame(np.clip((default_rates * (1 - recovery_potential)) / 100, 0, 1), index=df_default_rates.index, columns=years)
+
 def calculate_yearly_expected_value(df_project: pd.DataFrame, num_risk_buckets: int = 5, num_years: int = 10) -> pd.DataFrame:
     """
     Calculate the yearly expected value for each risk bucket and year.
@@ -148,10 +956,12 @@ def calculate_yearly_expected_value(df_project: pd.DataFrame, num_risk_buckets:
     Returns:
     DataFrame: The updated DataFrame with the calculated yearly expected values.
     """
-    # Calculate the yearly expected value for each year and risk bucket
-    for j in range(1, num_risk_buckets + 1):
-        for i in range(1, num_years + 1):
-            df_project[f'risk_bucket_{j}_expected_value_year_{i}'] = df_project[f'offered_volume_year_{i}'] * (1 - df_project[f'risk_bucket_{j}_shortfall_year_{i}'])
+    offered_volume = _stack_year_columns(df_project, 'offered_volume', num_years, dtype=None)
+    shortfall = _stack_bucket_year_columns(df_project, 'shortfall', num_risk_buckets, num_years, dtype=None)
+    expected_value = _bucket_year_columns(_expected_values(offered_volume, shortfall), 'expected_value')
+
+    # Concatenate the expected values with the input DataFrame
+    df_project = pd.concat([df_project, pd.DataFrame(expected_value, index=df_project.index)], axis=1)
     
     return df_project
 
@@ -167,15 +977,312 @@ def calculate_yearly_standard_deviation(df_project: pd.DataFrame, num_risk_bucke
     Returns:
     DataFrame: The updated DataFrame with the calculated yearly standard deviations.
     """
-    # Create a new DataFrame for the standard deviations
-    std_dev = pd.DataFrame(index=df_project.index)
-    
-    # Calculate the yearly standard deviation for each year and risk bucket
-    for j in range(1, num_risk_buckets + 1):
-        for i in range(1, num_years + 1):
-            std_dev[f'risk_bucket_{j}_standard_deviation_year_{i}'] = 0.5 * (df_project[f'offered_volume_year_{i}'] - df_project[f'risk_bucket_{j}_expected_value_year_{i}'])
+    offered_volume = _stack_year_columns(df_project, 'offered_volume', num_years, dtype=None)
+    expected_value = _stack_bucket_year_columns(df_project, 'expected_value', num_risk_buckets, num_years, dtype=None)
+    std_dev = _bucket_year_columns(_standard_deviations(offered_volume, expected_value), 'standard_deviation')
     
     # Concatenate the new DataFrame with the original DataFrame
-    df_project = pd.concat([df_project, std_dev], axis=1)
+    df_project = pd.concat([df_project, pd.DataFrame(std_dev, index=df_project.index)], axis=1)
     
-    return df_project
\ No newline at end of file
+    return df_project
+
+def score_portfolio(portfolio: Portfolio) -> Portfolio:
+    """
+    Calculate the risk bucket scores and ratings of a portfolio.
+
+    Parameters:
+    portfolio (Portfolio): The portfolio with the risk bucket factors and weights.
+
+    Returns:
+    Portfolio: The portfolio with the scores and ratings filled in.
+    """
+    # The scores are clipped between 0 and 10 without NaN values, so they do not need to be validated again
+    portfolio.scores = _bucket_scores(portfolio.factors, portfolio.weights)
+    portfolio.ratings = score_to_rating_codes(portfolio.scores, validate=False)
+    return portfolio
+
+def calculate_portfolio_shortfall(portfolio: Portfolio, df_default_rates: pd.DataFrame, df_recovery_potential: pd.DataFrame) -> Portfolio:
+    """
+    Calculate the shortfall for each project, risk bucket and year of a portfolio.
+
+    Parameters:
+    portfolio (Portfolio): The portfolio with the risk bucket ratings.
+    df_default_rates (DataFrame): The DataFrame containing the default rates.
+    df_recovery_potential (DataFrame): The DataFrame containing the recovery potentials.
+
+    Returns:
+    Portfolio: The portfolio with the shortfalls filled in.
+
+    Raises:
+    KeyError: If the default rates or recovery potentials do not cover every rating.
+    """
+    shortfall_table = calculate_shortfall_table(df_default_rates, df_recovery_potential, portfolio.num_years).loc[RATING_LABELS]
+    portfolio.shortfall = _gather_shortfalls(portfolio.ratings, shortfall_table.to_numpy(), portfolio.active)
+    return portfolio
+
+def calculate_portfolio_expected_value(portfolio: Portfolio) -> Portfolio:
+    """
+    Calculate the expected value for each project, risk bucket and year of a portfolio.
+
+    Parameters:
+    portfolio (Portfolio): The portfolio with the shortfalls.
+
+    Returns:
+    Portfolio: The portfolio with the expected values filled in.
+    """
+    portfolio.expected_value = _expected_values(portfolio.offered_volume, portfolio.shortfall)
+    return portfolio
+
+def calculate_portfolio_standard_deviation(portfolio: Portfolio) -> Portfolio:
+    """
+    Calculate the standard deviation for each project, risk bucket and year of a portfolio.
+
+    Parameters:
+    portfolio (Portfolio): The portfolio with the expected values.
+
+    Returns:
+    Portfolio: The portfolio with the standard deviations filled in.
+    """
+    portfolio.standard_deviation = _standard_deviations(portfolio.offered_volume, portfolio.expected_value)
+    return portfolio
+
+def simulate_portfolio(portfolio: Portfolio, engine: str = 'vectorized', num_samples: int = 10000, memory_budget_mb: float = None,
+                       workers: int = 1, seed: int = None, tolerance: float = ADAPTIVE_TOLERANCE, sampler: str = 'random',
+                       precision: str = 'float64', cache: dict = None) -> Portfolio:
+    """
+    Run the project simulation of a portfolio with the selected engine.
+
+    Parameters:
+    portfolio (Portfolio): The portfolio with the expected values and standard deviations.
+    engine (str, optional): The simulation engine, one of SIMULATION_ENGINES. Defaults to 'vectorized'.
+    num_samples (int, optional): The number of random samples to generate. Defaults to 10000.
+    memory_budget_mb (float, optional): The memory budget per block of samples for the vectorized engine. Defaults to None.
+    workers (int, optional): The number of worker processes for the vectorized engine. Defaults to 1.
+    seed (int, optional): The random seed for the loop, vectorized, crn, adaptive and memoized engines. Defaults to None.
+    tolerance (float, optional): The target standard error of the expected value percentage for the adaptive engine. Defaults to ADAPTIVE_TOLERANCE.
+
+    sampler (str, optional): The sampler for the vectorized, crn and memoized engines, one of SAMPLERS. Defaults to 'random'.
+    precision (str, optional): The precision of the draws for the vectorized and memoized engines, one of SIMULATION_PRECISIONS. Defaults to 'float64'.
+    cache (dict, optional): The cache of the memoized engine, see run_simulation_memoized. Defaults to None, which uses a new cache.
+
+    Returns:
+    Portfolio: The portfolio with the project standard deviations, delivery volumes and expected value percentages filled in,
+               and the number of samples used for each project year with the adaptive engine.
+
+    Raises:
+    ValueError: If the engine is not one of SIMULATION_ENGINES, or the sampler or precision is not supported by the engine.
+    """
+    _check_simulation_options(engine, sampler, precision)
+    if engine == 'loop':
+        # The loop engine works row by row on the wide DataFrame, and uses the index as the row position
+        df_project = run_simulation(portfolio.to_dataframe().reset_index(drop=True), portfolio.num_buckets, num_samples, portfolio.num_years, _loop_generator(seed))
+        std_dev = _stack_year_columns(df_project, 'project_standard_deviation', portfolio.num_years)
+    elif engine == 'adaptive':
+        std_dev, portfolio.simulation_samples = _simulate_adaptive(portfolio.expected_value, portfolio.standard_deviation, portfolio.active,
+                                                                   portfolio.offered_volume, num_samples, tolerance, memory_budget_mb=memory_budget_mb, seed=seed)
+    elif engine == 'memoized':
+        std_dev = _memoized_standard_deviation(portfolio.ratings, portfolio.standard_deviation, portfolio.offered_volume, portfolio.active, num_samples, seed,
+                                               sampler, precision, memory_budget_mb, cache)
+    else:
+        std_dev = _simulate_standard_deviation(portfolio.expected_value, portfolio.standard_deviation, portfolio.active, engine, num_samples,
+                                               memory_budget_mb, workers, seed, sampler, precision)
+
+    portfolio.project_standard_deviation = std_dev
+    portfolio.project_delivery_volume, portfolio.project_expected_value_percentage = _delivery_results(portfolio.offered_volume, std_dev, portfolio.active)
+    return portfolio
+
+def rate_portfolio(portfolio: Portfolio) -> Portfolio:
+    """
+    Calculate the overall project ratings of a portfolio from the average expected value percentage over all years.
+
+    Parameters:
+    portfolio (Portfolio): The portfolio with the project expected value percentages.
+
+    Returns:
+    Portfolio: The portfolio with the overall ratings filled in.
+
+    Raises:
+    ValueError: If a project has no expected value percentages.
+    """
+    portfolio.overall_rating = overall_rating_codes(portfolio.project_expected_value_percentage)
+    return portfolio
+
+def overall_rating_codes(expected_value_percentage: np.ndarray) -> np.ndarray:
+    """
+    Calculate the overall project rating codes from the average expected value percentage over all years.
+
+    Parameters:
+    expected_value_percentage (np.ndarray): The project expected value percentages, with the years as the last axis and NaN for inactive years.
+
+    Returns:
+    np.ndarray: The int8 rating codes into RATING_LABELS, with the shape of expected_value_percentage without the years axis.
+
+    Raises:
+    ValueError: If a project has no expected value percentages.
+    """
+    # Sum the years one at a time, in the same order as DataFrame.mean(axis=1)
+    percentages = np.moveaxis(expected_value_percentage, -1, 0)
+    observed = ~np.isnan(percentages)
+    average = np.sum(np.where(observed, percentages, 0), axis=0) / np.sum(observed, axis=0)
+
+    return score_to_rating_codes(average * 10)
+
+def score_models(factors: np.ndarray, model_weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate the risk bucket scores and ratings of every project under each of several sets of model weights at once.
+
+    Parameters:
+    factors (np.ndarray): The risk bucket factors, shape (projects, buckets, factors).
+    model_weights (np.ndarray): The risk bucket weights of each model, shape (models, buckets, factors).
+
+    Returns:
+    scores (np.ndarray): The risk bucket scores clipped between 0 and 10, shape (models, projects, buckets).
+    ratings (np.ndarray): The risk bucket ratings as int8 codes into RATING_LABELS, shape (models, projects, buckets).
+
+    Notes:
+    The factor products are added one factor at a time for all models and projects, so a model with the same weights
+    as the projects gets exactly the scores of score_portfolio.
+    """
+    scores = np.zeros((model_weights.shape[0],) + factors.shape[:2])
+    for factor in range(factors.shape[2]):
+        scores += factors[None, :, :, factor] * model_weights[:, None, :, factor]
+
+    # NaN scores are treated as 0, as in _bucket_scores
+    scores = np.clip(np.nan_to_num(scores, nan=0.0), 0, 10)
+    return scores, score_to_rating_codes(scores, validate=False)
+
+def rating_counts(ratings: np.ndarray) -> np.ndarray:
+    """
+    Count the risk buckets of each rating, for example per project.
+
+    Parameters:
+    ratings (np.ndarray): The risk bucket rating codes into RATING_LABELS, with the buckets as the last axis.
+
+    Returns:
+    np.ndarray: The number of risk buckets with each rating, with the ratings in the order of RATING_LABELS as the last axis.
+    """
+    return np.stack([np.sum(ratings == code, axis=-1) for code in range(len(RATING_LABELS))], axis=-1).astype(float)
+
+def analytic_delivery(bucket_rating_counts: np.ndarray, shortfall_tables: np.ndarray, offered_volume: np.ndarray,
+                      active: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calculate the analytic project standard deviation, delivery volume and expected value percentage for batches of ratings or shortfall tables.
+
+    A risk bucket's standard deviation is 0.5 * offered volume * shortfall, and its shortfall only depends on its rating
+    and the year. The analytic project standard deviation is therefore 0.5 * offered volume * sqrt(sum of the squared
+    risk bucket shortfalls), and the sums of all projects are one matrix product of the number of risk buckets of each
+    rating with the squared shortfall table. Leading batch axes broadcast, for example (1, projects, ratings) counts with
+    (scenarios, ratings, years) tables, or (models, projects, ratings) counts with a (ratings, years) table.
+
+    Parameters:
+    bucket_rating_counts (np.ndarray): The number of risk buckets of each rating, shape (..., projects, ratings), as from rating_counts.
+    shortfall_tables (np.ndarray): The shortfall of each rating and year, in the order of RATING_LABELS, shape (..., ratings, years).
+    offered_volume (np.ndarray): The offered volumes, shape (projects, years).
+    active (np.ndarray): True for the years within the contract duration, shape (projects, years).
+
+    Returns:
+    std_dev (np.ndarray): The project standard deviations, shape (..., projects, years).
+    delivery_volume (np.ndarray): The project delivery volumes, shape (..., projects, years).
+    expected_value_percentage (np.ndarray): The project expected value percentages, shape (..., projects, years).
+    """
+    squared_shortfall = np.matmul(bucket_rating_counts, shortfall_tables ** 2)
+    std_dev = np.where(active, 0.5 * offered_volume * np.sqrt(squared_shortfall), np.nan)
+    delivery_volume, expected_value_percentage = _delivery_results(offered_volume, std_dev, active)
+    return std_dev, delivery_volume, expected_value_percentage
+
+def prepare_portfolio(df_project: pd.DataFrame, num_buckets: int, num_factors: int, df_default_rates: pd.DataFrame,
+                      df_recovery_potential: pd.DataFrame, num_years: int = 10) -> Portfolio:
+    """
+    Run the pipeline stages up to the simulation: scores and ratings, shortfall, expected value and standard deviation.
+
+    Parameters:
+    df_project (pd.DataFrame): The project data.
+    num_buckets (int): The number of risk buckets.
+    num_factors (int): The number of risk factors in each risk bucket.
+    df_default_rates (DataFrame): The DataFrame containing the default rates.
+    df_recovery_potential (DataFrame): The DataFrame containing the recovery potentials.
+    num_years (int, optional): The number of years. Defaults to 10.
+
+    Returns:
+    Portfolio: The portfolio ready for simulate_portfolio.
+    """
+    portfolio = Portfolio.from_dataframe(df_project, num_buckets, num_factors, num_years)
+    portfolio = score_portfolio(portfolio)
+    portfolio = calculate_portfolio_shortfall(portfolio, df_default_rates, df_recovery_potential)
+    portfolio = calculate_portfolio_expected_value(portfolio)
+    return calculate_portfolio_standard_deviation(portfolio)
+
+def analyze_portfolio(df_project: pd.DataFrame, num_buckets: int, num_factors: int, df_default_rates: pd.DataFrame,
+                      df_recovery_potential: pd.DataFrame, engine: str = 'vectorized', num_samples: int = 10000, num_years: int = 10,
+                      memory_budget_mb: float = None, workers: int = 1, seed: int = None, tolerance: float = ADAPTIVE_TOLERANCE,
+                      sampler: str = 'random', precision: str = 'float64', cache: dict = None) -> Portfolio:
+    """
+    Run all the pipeline stages on the project data, from the risk bucket scores to the overall project ratings.
+
+    Parameters:
+    df_project (pd.DataFrame): The project data.
+    num_buckets (int): The number of risk buckets.
+    num_factors (int): The number of risk factors in each risk bucket.
+    df_default_rates (DataFrame): The DataFrame containing the default rates.
+    df_recovery_potential (DataFrame): The DataFrame containing the recovery potentials.
+    engine (str, optional): The simulation engine, one of SIMULATION_ENGINES. Defaults to 'vectorized'.
+    num_samples (int, optional): The number of random samples to generate. Defaults to 10000.
+    num_years (int, optional): The number of years. Defaults to 10.
+    memory_budget_mb (float, optional): The memory budget per block of samples for the vectorized engine. Defaults to None.
+    workers (int, optional): The number of worker processes for the vectorized engine. Defaults to 1.
+    seed (int, optional): The random seed for the loop, vectorized, crn, adaptive and memoized engines. Defaults to None.
+    tolerance (float, optional): The target standard error of the expected value percentage for the adaptive engine. Defaults to ADAPTIVE_TOLERANCE.
+    sampler (str, optional): The sampler for the vectorized, crn and memoized engines, one of SAMPLERS. Defaults to 'random'.
+    precision (str, optional): The precision of the draws for the vectorized and memoized engines, one of SIMULATION_PRECISIONS. Defaults to 'float64'.
+    cache (dict, optional): The cache of the memoized engine, see run_simulation_memoized. Defaults to None, which uses a new cache.
+
+    Returns:
+    Portfolio: The portfolio with all the results filled in.
+    """
+    portfolio = prepare_portfolio(df_project, num_buckets, num_factors, df_default_rates, df_recovery_potential, num_years)
+    portfolio = simulate_portfolio(portfolio, engine, num_samples, memory_budget_mb, workers, seed, tolerance, sampler, precision, cache)
+    return rate_portfolio(portfolio)
+
+def _stack_bucket_factor_columns(df_project: pd.DataFrame, name: str, num_buckets: int, num_factors: int) -> np.ndarray:
+    """
+    Stack the 'risk_bucket_X_{name}_Y' columns into an array of shape (projects, buckets, factors).
+    """
+    columns = [f'risk_bucket_{bucket}_{name}_{factor}' for bucket in range(1, num_buckets + 1) for factor in range(1, num_factors + 1)]
+    return df_project[columns].to_numpy(dtype=float).reshape(len(df_project), num_buckets, num_factors)
+
+def _bucket_year_columns(values: np.ndarray, name: str) -> dict:
+    """
+    Convert a (projects, buckets, years) array into a dict of 'risk_bucket_X_{name}_year_Y' columns.
+    """
+    return {f'risk_bucket_{bucket}_{name}_year_{year}': values[:, bucket-1, year-1]
+            for bucket in range(1, values.shape[1] + 1) for year in range(1, values.shape[2] + 1)}
+
+def _bucket_scores(factors: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Calculate the risk bucket scores from (projects, buckets, factors) arrays, clipped between 0 and 10.
+    """
+    # Add the factor products one at a time so the scores match a column by column sum exactly
+    scores = np.zeros(factors.shape[:2])
+    for factor in range(factors.shape[2]):
+        scores += factors[:, :, factor] * weights[:, :, factor]
+
+    # NaN scores are treated as 0, as max(0, min(x, 10)) does
+    return np.clip(np.nan_to_num(scores, nan=0.0), 0, 10)
+
+def _gather_shortfalls(rating_codes: np.ndarray, shortfall_table: np.ndarray, active: np.ndarray) -> np.ndarray:
+    """
+    Look up the shortfall of each (projects, buckets) rating code for every year, shape (projects, buckets, years).
+    """
+    return np.where(active[:, None, :], shortfall_table[rating_codes], np.nan)
+
+def _expected_values(offered_volume: np.ndarray, shortfall: np.ndarray) -> np.ndarray:
+    """
+    Calculate the risk bucket expected values, offered volume * (1 - shortfall), shape (projects, buckets, years).
+    """
+    return offered_volume[:, None, :] * (1 - shortfall)
+
+def _standard_deviations(offered_volume: np.ndarray, expected_value: np.ndarray) -> np.ndarray:
+    """
+    Calculate the risk bucket standard deviations, 0.5 * (offered volume - expected value), shape (projects, buckets, years).
+    """
+    return 0.5 * (offered_volume[:, None, :] - expected_value)
@@ -0,0 +1,115 @@
+import logging
+import pandas as pd
+import numpy as np
+
+from utils.io import read_table
+from utils.portfolio import Portfolio, RATING_LABELS
+from utils.risk_calculation import calculate_shortfall_table, rating_counts, analytic_delivery
+from utils.analysis import calendar_year_index, calculate_total_volumes_by_year
+
+SCENARIO_TABLES = ['Default Rates', 'Recovery Potential']
+SCENARIO_COLUMNS = ['scenario', 'table', 'rating']
+
+def load_scenarios(scenario_file: str, df_default_rates: pd.DataFrame, df_recovery_potential: pd.DataFrame) -> dict:
+    """
+    Load the default rates and recovery potential tables of each stress scenario.
+
+    The scenario file (Excel, CSV, TSV or Parquet) has one row per scenario, table and rating, with the columns
+    'scenario', 'table' ('Default Rates' or 'Recovery Potential'), 'rating' and one column per year, in the same
+    layout as the 'Default Rates' and 'Recovery Potential' sheets. A scenario without rows for one of the tables
+    uses the base table, so a scenario that only shocks the default rates only needs the default rate rows.
+
+    Parameters:
+    scenario_file (str): The path to the scenario file.
+    df_default_rates (pd.DataFrame): The base default rates.
+    df_recovery_potential (pd.DataFrame): The base recovery potentials.
+
+    Returns:
+    dict: The (df_default_rates, df_recovery_potential) tables of each scenario by name, in the order of the file.
+
+    Raises:
+    ValueError: If the file extension is not supported, a column is missing or a table name is unknown.
+    """
+    df_scenarios = read_table(scenario_file)
+    missing = [column for column in SCENARIO_COLUMNS if column not in df_scenarios.columns]
+    if missing:
+        raise ValueError(f"The scenario file is missing the columns: {', '.join(missing)}")
+    unknown = set(df_scenarios['table']) - set(SCENARIO_TABLES)
+    if unknown:
+        raise ValueError(f"Unknown scenario tables {', '.join(sorted(map(str, unknown)))}, the tables must be one of: {', '.join(SCENARIO_TABLES)}")
+
+    scenarios = {}
+    for scenario in pd.unique(df_scenarios['scenario']):
+        tables = []
+        for table, df_base in zip(SCENARIO_TABLES, [df_default_rates, df_recovery_potential]):
+            rows = df_scenarios[(df_scenarios['scenario'] == scenario) & (df_scenarios['table'] == table)]
+            if rows.empty:
+                tables.append(df_base)
+                continue
+            df_table = rows.drop(columns=['scenario', 'table']).set_index('rating').rename_axis(None)
+            df_table.columns = df_table.columns.astype(int)
+            # Put the ratings in the order of the base table, so that check_df_format accepts any row order
+            if set(df_table.index) == set(df_base.index):
+                df_table = df_table.reindex(df_base.index)
+            tables.append(df_table)
+        scenarios[str(scenario)] = tuple(tables)
+
+    return scenarios
+
+def run_scenarios(portfolio: Portfolio, scenarios: dict) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Evaluate the project standard deviation, delivery volume and expected value percentage of a scored portfolio under many scenarios at once.
+
+    The risk bucket scores and ratings do not depend on the default rates and recovery potential, so they are
+    calculated once by score_portfolio. The number of risk buckets of each rating per project is then multiplied with
+    the (scenarios, ratings, years) shortfall tables of all scenarios in one pass by analytic_delivery, without
+    materializing a (scenarios, projects, buckets, years) array.
+
+    Parameters:
+    portfolio (Portfolio): The portfolio with the risk bucket ratings.
+    scenarios (dict): The (df_default_rates, df_recovery_potential) tables of each scenario by name, as from load_scenarios.
+
+    Returns:
+    df_results (pd.DataFrame): The 'scenario', 'project_id', 'year', 'project_standard_deviation', 'project_delivery_volume' and
+                               'project_expected_value_percentage' of every project year within the contract duration, in
+                               scenario, project and year order.
+    df_totals (pd.DataFrame): The 'Scenario' column and the calculate_total_volumes_by_year table of each scenario.
+
+    Raises:
+    KeyError: If the default rates or recovery potentials of a scenario do not cover every rating.
+
+    Notes:
+    The standard deviations are those of the analytic engine, so the differences between the scenarios are not
+    buried in Monte Carlo noise.
+    """
+    names = list(scenarios)
+    shortfall_tables = np.stack([calculate_shortfall_table(df_default_rates, df_recovery_potential, portfolio.num_years).loc[RATING_LABELS].to_numpy()
+                                 for df_default_rates, df_recovery_potential in scenarios.values()])
+    # The results of every scenario, shape (scenarios, projects, years)
+    std_dev, delivery_volume, expected_value_percentage = analytic_delivery(rating_counts(portfolio.ratings)[None], shortfall_tables,
+                                                                            portfolio.offered_volume, portfolio.active)
+
+    # Keep only the project years within the contract duration
+    projects, years = np.nonzero(portfolio.active)
+    df_results = pd.DataFrame({
+        'scenario': pd.Categorical(np.repeat(names, len(projects)), categories=names),
+        'project_id': np.tile(portfolio.projects['project_id'].to_numpy()[projects], len(names)),
+        'year': np.tile(years + 1, len(names)).astype(np.int8),
+        'project_standard_deviation': std_dev[:, projects, years].ravel(),
+        'project_delivery_volume': delivery_volume[:, projects, years].ravel(),
+        'project_expected_value_percentage': expected_value_percentage[:, projects, years].ravel()
+    })
+
+    # The calendar years of the project years are the same in every scenario
+    year_index = calendar_year_index(portfolio.projects, portfolio.num_years)
+    offered_columns = {f'offered_volume_year_{year}': portfolio.offered_volume[:, year - 1] for year in range(1, portfolio.num_years + 1)}
+    totals = []
+    for scenario, name in enumerate(names):
+        delivery_columns = {f'project_delivery_volume_year_{year}': delivery_volume[scenario, :, year - 1] for year in range(1, portfolio.num_years + 1)}
+        df_volumes = pd.DataFrame({**offered_columns, **delivery_columns})
+        totals.append(calculate_total_volumes_by_year(df_volumes, year_index).assign(Scenario=name))
+    df_totals = pd.concat(totals, ignore_index=True)
+    df_totals = df_totals[['Scenario'] + [column for column in df_totals.columns if column != 'Scenario']]
+
+    logging.info(f"Scenario analysis: {len(names)} scenarios for {len(portfolio)} projects and {len(projects)} project years")
+    return df_results, df_totals
@@ -0,0 +1,371 @@
+import json
+import time
+import queue
+import logging
+import threading
+from contextlib import redirect_stdout
+from dataclasses import dataclass, asdict, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from io import StringIO
+import pandas as pd
+
+from utils.io import load_model_tables, read_project_records, count_buckets_and_factors, valid_project_data, check_df_format, valid_model
+from utils.risk_calculation import analyze_portfolio, ADAPTIVE_TOLERANCE
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+BATCH_WINDOW_MS = 5
+MAX_BATCH_PROJECTS = 10000
+
+@dataclass
+class ServiceMetrics:
+    """
+    The request and batch counters of a ScoringService.
+
+    Attributes:
+    requests (int): The number of score requests answered.
+    rejected_requests (int): The number of score requests answered with an error.
+    projects (int): The number of projects scored.
+    batches (int): The number of batches run.
+    batch_seconds (float): The total time spent running the batches.
+    max_batch_seconds (float): The longest time spent running a batch.
+    request_seconds (float): The total time of the score requests, from being queued to being answered.
+    """
+    requests: int = 0
+    rejected_requests: int = 0
+    projects: int = 0
+    batches: int = 0
+    batch_seconds: float = 0.0
+    max_batch_seconds: float = 0.0
+    request_seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        """
+        Convert the metrics to a JSON serializable dict, with the average batch size and times.
+
+        Returns:
+        dict: The counters and the 'average_batch_projects', 'average_batch_ms' and 'average_request_ms'.
+        """
+        metrics = asdict(self)
+        metrics['average_batch_projects'] = self.projects / self.batches if self.batches else None
+        metrics['average_batch_ms'] = 1000 * self.batch_seconds / self.batches if self.batches else None
+        metrics['average_request_ms'] = 1000 * self.request_seconds / self.requests if self.requests else None
+        return metrics
+
+@dataclass
+class _ScoreRequest:
+    """
+    A queued score request, answered by the batch worker of a ScoringService.
+    """
+    df_project: pd.DataFrame
+    queued: float = field(default_factory=time.perf_counter)
+    done: threading.Event = field(default_factory=threading.Event)
+    result: str = None
+    error: Exception = None
+
+class ScoringService:
+    """
+    Score and simulate project rows with the model tables loaded once.
+
+    The default rates, recovery potential and model configuration are read from the table file when the service is
+    created, and the interpreter and libraries stay loaded between requests. Score requests are queued and run by a
+    single worker thread in micro-batches: the requests that arrive within batch_window_ms of each other are run through
+    analyze_portfolio together, up to max_batch_projects projects, so that concurrent requests share one pass of the
+    pipeline. With the memoized engine, the simulated standard deviations are also cached between batches.
+
+    Parameters:
+    table_file (str, optional): The Excel file with the 'Default Rates', 'Recovery Potential' and 'Model Config' sheets. Defaults to 'GHG_Data.xlsx'.
+    engine (str, optional): The simulation engine, one of SIMULATION_ENGINES. Defaults to 'vectorized'.
+    num_samples (int, optional): The number of random samples to generate. Defaults to 10000.
+    num_years (int, optional): The number of years. Defaults to 10.
+    memory_budget_mb (float, optional): The memory budget per block of samples for the vectorized engine. Defaults to None.
+    seed (int, optional): The random seed of each batch for the loop, vectorized, crn, adaptive and memoized engines. Defaults to None.
+    tolerance (float, optional): The target standard error of the expected value percentage for the adaptive engine. Defaults to ADAPTIVE_TOLERANCE.
+    sampler (str, optional): The sampler for the vectorized, crn and memoized engines, one of SAMPLERS. Defaults to 'random'.
+    precision (str, optional): The precision of the draws for the vectorized and memoized engines, one of SIMULATION_PRECISIONS. Defaults to 'float64'.
+    batch_window_ms (float, optional): How long to wait for more requests to add to a batch. Defaults to BATCH_WINDOW_MS.
+    max_batch_projects (int, optional): The number of projects at which a batch is run without waiting. Defaults to MAX_BATCH_PROJECTS.
+
+    Raises:
+    ValueError: If the default rates and recovery potential tables are not valid.
+
+    Notes:
+    With a seed, the Monte Carlo results of a project depend on the other projects of its batch. The analytic engine
+    gives the same results however the requests are batched.
+    """
+    def __init__(self, table_file: str = 'GHG_Data.xlsx', engine: str = 'vectorized', num_samples: int = 10000, num_years: int = 10,
+                 memory_budget_mb: float = None, seed: int = None, tolerance: float = ADAPTIVE_TOLERANCE, sampler: str = 'random',
+                 precision: str = 'float64', batch_window_ms: float = BATCH_WINDOW_MS, max_batch_projects: int = MAX_BATCH_PROJECTS):
+        self.df_default_rates, self.df_recovery_potential, self.df_model = load_model_tables(table_file)
+        if not check_df_format(self.df_default_rates, self.df_recovery_potential):
+            raise ValueError(f"The default rates and recovery potential tables of {table_file} are not valid")
+
+        self.table_file = table_file
+        self.engine = engine
+        self.num_samples = num_samples
+        self.num_years = num_years
+        self.memory_budget_mb = memory_budget_mb
+        self.seed = seed
+        self.tolerance = tolerance
+        self.sampler = sampler
+        self.precision = precision
+        self.batch_window_ms = batch_window_ms
+        self.max_batch_projects = max_batch_projects
+        self._metrics = ServiceMetrics()
+        self.cache = {}
+
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._run_batches, name='scoring-batches', daemon=True)
+        self._worker.start()
+        logging.info(f"Scoring service started with the tables of {table_file} and the {engine} engine")
+
+    def score(self, records: list) -> str:
+        """
+        Score and simulate projects, waiting for the batch they are run in.
+
+        Parameters:
+        records (list): The projects, as dicts with the columns of the 'Project Data' sheet.
+
+        Returns:
+        str: A JSON list with, for each project, the 'project_id', the risk bucket scores and ratings, the yearly project
+             standard deviations, delivery volumes and expected value percentages, and the 'overall_project_rating'.
+
+        Raises:
+        ValueError: If the project data is not valid.
+        RuntimeError: If the batch of the projects failed unexpectedly.
+        """
+        request = _ScoreRequest(read_project_records(records))
+        self._requests.put(request)
+        request.done.wait()
+
+        with self._lock:
+            self._metrics.requests += 1
+            self._metrics.rejected_requests += request.error is not None
+            self._metrics.request_seconds += time.perf_counter() - request.queued
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def health(self) -> dict:
+        """
+        Report the status and settings of the service.
+
+        Returns:
+        dict: The 'status', 'table_file', 'engine', 'num_samples', 'uptime_seconds' and 'queued_requests'.
+        """
+        return {
+            'status': 'ok' if self._worker.is_alive() else 'stopped',
+            'table_file': self.table_file,
+            'engine': self.engine,
+            'num_samples': self.num_samples,
+            'uptime_seconds': time.perf_counter() - self._started,
+            'queued_requests': self._requests.qsize()
+        }
+
+    def metrics(self) -> dict:
+        """
+        Report the request and batch metrics of the service.
+
+        Returns:
+        dict: The ServiceMetrics.to_dict counters and the number of 'cached_cases' of the memoized engine.
+        """
+        with self._lock:
+            metrics = self._metrics.to_dict()
+        metrics['cached_cases'] = len(self.cache)
+        return metrics
+
+    def close(self) -> None:
+        """
+        Stop the batch worker after the queued requests have been run.
+        """
+        self._requests.put(None)
+        self._worker.join()
+
+    def _run_batches(self) -> None:
+        """
+        Collect the queued requests into batches and run them, until close is called.
+        """
+        stopping = False
+        while not stopping:
+            request = self._requests.get()
+            if request is None:
+                break
+            batch = [request]
+            num_projects = len(request.df_project)
+            deadline = time.perf_counter() + self.batch_window_ms / 1000
+            while num_projects < self.max_batch_projects:
+                try:
+                    request = self._requests.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+                num_projects += len(request.df_project)
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                # Answer the requests of the batch instead of leaving them waiting, and keep the worker running
+                logging.exception(f"Scoring service batch failed: {str(e)}")
+                for request in batch:
+                    if request.result is None and request.error is None:
+                        request.error = RuntimeError(f"An unexpected error occurred: {str(e)}")
+                    request.done.set()
+
+    def _run_batch(self, batch: list) -> None:
+        """
+        Validate the requests of a batch, and run the valid projects with the same risk buckets and factors through the pipeline together.
+        """
+        start = time.perf_counter()
+        groups = {}
+        for request in batch:
+            # The validation functions print their errors, which are returned to the client instead
+            messages = StringIO()
+            try:
+                with redirect_stdout(messages):
+                    risk_bucket_count, risk_factor_count = count_buckets_and_factors(request.df_project)
+                    valid = (valid_project_data(request.df_project, risk_bucket_count, risk_factor_count) and
+                             valid_model(self.df_model, risk_bucket_count, risk_factor_count))
+            except (ValueError, TypeError, KeyError):
+                valid = False
+            if valid:
+                groups.setdefault((risk_bucket_count, risk_factor_count), []).append(request)
+            else:
+                request.error = ValueError(messages.getvalue().strip() or 'The project data is not valid')
+
+        num_projects = 0
+        for (risk_bucket_count, risk_factor_count), requests in groups.items():
+            df_project = pd.concat([request.df_project for request in requests], ignore_index=True)
+            try:
+                portfolio = analyze_portfolio(df_project, risk_bucket_count, risk_factor_count, self.df_default_rates, self.df_recovery_potential,
+                                              self.engine, self.num_samples, self.num_years, self.memory_budget_mb, seed=self.seed,
+                                              tolerance=self.tolerance, sampler=self.sampler, precision=self.precision,
+                                              cache=self.cache if self.engine == 'memoized' else None)
+            except (ValueError, KeyError) as e:
+                for request in requests:
+                    request.error = ValueError(str(e))
+                continue
+
+            df_results = portfolio.to_dataframe()[_result_columns(risk_bucket_count, self.num_years)]
+            offset = 0
+            for request in requests:
+                request.result = df_results.iloc[offset:offset + len(request.df_project)].to_json(orient='records')
+                offset += len(request.df_project)
+            num_projects += len(df_project)
+
+        for request in batch:
+            request.done.set()
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._metrics.batches += 1
+            self._metrics.projects += num_projects
+            self._metrics.batch_seconds += elapsed
+            self._metrics.max_batch_seconds = max(self._metrics.max_batch_seconds, elapsed)
+        logging.info(f"Scoring service batch: {len(batch)} requests, {num_projects} projects in {elapsed * 1000:.1f} ms")
+
+class _ScoringRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answer the /score, /health and /metrics requests with the ScoringService of the server.
+    """
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, json.dumps(self.server.service.health()))
+        elif self.path == '/metrics':
+            self._send_json(200, json.dumps(self.server.service.metrics()))
+        else:
+            self._send_error(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        if self.path != '/score':
+            self._send_error(404, f"Unknown path {self.path}")
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            records = body['projects']
+            if not isinstance(records, list):
+                raise TypeError
+        except (ValueError, KeyError, TypeError):
+            self._send_error(400, "The request body must be a JSON object with a 'projects' list")
+            return
+
+        try:
+            result = self.server.service.score(records)
+        except (ValueError, TypeError) as e:
+            self._send_error(400, str(e))
+            return
+        except RuntimeError as e:
+            self._send_error(500, str(e))
+            return
+        self._send_json(200, f'{{"projects": {result}}}')
+
+    def _send_error(self, status: int, message: str) -> None:
+        self._send_json(status, json.dumps({'error': message}))
+
+    def _send_json(self, status: int, body: str) -> None:
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.info(f"Scoring service {self.address_string()}: {format % args}")
+
+def create_server(service: ScoringService, host: str = SERVICE_HOST, port: int = SERVICE_PORT) -> ThreadingHTTPServer:
+    """
+    Create an HTTP server for a scoring service, with the endpoints:
+
+    POST /score: Score a JSON object with a 'projects' list of project rows, see ScoringService.score.
+    GET /health: The ScoringService.health status.
+    GET /metrics: The ScoringService.metrics counters.
+
+    Parameters:
+    service (ScoringService): The scoring service.
+    host (str, optional): The host to listen on. Defaults to SERVICE_HOST, which only accepts local connections.
+    port (int, optional): The port to listen on, 0 for any free port. Defaults to SERVICE_PORT.
+
+    Returns:
+    ThreadingHTTPServer: The server, which handles each connection in its own thread. The port is in server_address.
+    """
+    server = ThreadingHTTPServer((host, port), _ScoringRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+def run_scoring_service(table_file: str = 'GHG_Data.xlsx', host: str = SERVICE_HOST, port: int = SERVICE_PORT, **options) -> None:
+    """
+    Run a scoring service on an HTTP server until it is interrupted.
+
+    Parameters:
+    table_file (str, optional): The Excel file with the model tables. Defaults to 'GHG_Data.xlsx'.
+    host (str, optional): The host to listen on. Defaults to SERVICE_HOST.
+    port (int, optional): The port to listen on. Defaults to SERVICE_PORT.
+    **options: The other ScoringService options, such as engine and seed.
+    """
+    service = ScoringService(table_file, **options)
+    server = create_server(service, host, port)
+    print(f"Scoring service listening on http://{server.server_address[0]}:{server.server_address[1]} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        logging.info(f"Scoring service stopped: {service.metrics()}")
+
+def _result_columns(num_buckets: int, num_years: int) -> list:
+    """
+    Return the columns of the project data that are returned by the score requests.
+    """
+    columns = ['project_id']
+    columns += [f'risk_bucket_{bucket}_score' for bucket in range(1, num_buckets + 1)]
+    columns += [f'risk_bucket_{bucket}_rating' for bucket in range(1, num_buckets + 1)]
+    for name in ['project_standard_deviation', 'project_delivery_volume', 'project_expected_value_percentage']:
+        columns += [f'{name}_year_{year}' for year in range(1, num_years + 1)]
+    return columns + ['overall_project_rating']
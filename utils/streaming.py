@@ -0,0 +1,106 @@
+import logging
+import pandas as pd
+import numpy as np
+
+from utils.io import read_project_chunks, load_model_tables, count_buckets_and_factors, valid_project_data, check_df_format, valid_model, append_parquet_chunk
+from utils.risk_calculation import analyze_portfolio, ADAPTIVE_TOLERANCE
+from utils.analysis import (calculate_top_bottom_candidates, calculate_top_bottom_projects, summarize_group_ratings, combine_group_summaries,
+                            create_group_table_from_summary, count_overall_ratings, create_counts_table, calculate_total_volumes_by_year, combine_total_volumes_by_year)
+
+TOP_BOTTOM_COLUMNS = ['project_id', 'project_name', 'country', 'technology', 'counterparty', 'start_year']
+GROUP_COLUMNS = ['country', 'technology', 'counterparty']
+
+def run_streaming_analysis(project_file: str, table_file: str = 'GHG_Data.xlsx', chunk_size: int = 100000, engine: str = 'vectorized',
+                           memory_budget_mb: float = None, workers: int = 1, seed: int = None, project_output_file: str = None,
+                           num_years: int = 10, num_projects: int = 10, tolerance: float = ADAPTIVE_TOLERANCE,
+                           sampler: str = 'random', precision: str = 'float64') -> tuple:
+    """
+    Run the project risk analysis on a CSV, TSV or Parquet project data file, one chunk of projects at a time.
+
+    Each chunk is validated with valid_project_data and run through all the pipeline stages as it is read. Only small
+    summaries of each chunk are kept (rating counts, group summaries, volumes by year and top and bottom candidates), so
+    the memory used does not grow with the size of the project data file.
+
+    Parameters:
+    project_file (str): The path to the project data file, with one of the STREAMING_EXTENSIONS.
+    table_file (str, optional): The Excel file with the 'Default Rates', 'Recovery Potential' and 'Model Config' sheets. Defaults to 'GHG_Data.xlsx'.
+    chunk_size (int, optional): The maximum number of projects in each chunk. Defaults to 100000.
+    engine (str, optional): The simulation engine, one of SIMULATION_ENGINES. Defaults to 'vectorized'.
+    memory_budget_mb (float, optional): The memory budget per block of samples for the vectorized engine. Defaults to None.
+    workers (int, optional): The number of worker processes for the vectorized engine. Defaults to 1.
+    seed (int, optional): The random seed for the loop, vectorized, crn, adaptive and memoized engines. Each chunk gets its own seed derived from it. Defaults to None.
+    project_output_file (str, optional): A Parquet file to write the simulated project data to, chunk by chunk. Defaults to None.
+    num_years (int, optional): The number of years. Defaults to 10.
+    num_projects (int, optional): The number of top and bottom projects. Defaults to 10.
+    tolerance (float, optional): The target standard error of the expected value percentage for the adaptive engine. Defaults to ADAPTIVE_TOLERANCE.
+    sampler (str, optional): The sampler for the vectorized, crn and memoized engines, one of SAMPLERS. Defaults to 'random'.
+    precision (str, optional): The precision of the draws for the vectorized and memoized engines, one of SIMULATION_PRECISIONS. Defaults to 'float64'.
+
+    Returns:
+    tuple: The df_counts, top_projects, bottom_projects, country_table, technology_table, counterparty_table and total_volumes_per_year
+           output tables, with the same format as in GHG_Pro.main, or None if the data is not valid.
+
+    Notes:
+    Duplicate project IDs are only detected within a chunk, since the project IDs of earlier chunks are not kept.
+    """
+    df_default_rates, df_recovery_potential, df_model = load_model_tables(table_file)
+    if not check_df_format(df_default_rates, df_recovery_potential):
+        return None
+
+    # Derive a separate seed for each chunk, so that the chunks do not reuse the same random streams
+    seed_sequence = np.random.SeedSequence(seed) if seed is not None else None
+
+    rating_counts = None
+    candidates = None
+    group_summaries = {group_by: None for group_by in GROUP_COLUMNS}
+    total_volumes_per_year = None
+    writer = None
+    num_projects_read = 0
+
+    try:
+        for chunk_number, df_project in enumerate(read_project_chunks(project_file, chunk_size), start=1):
+            risk_bucket_count, risk_factor_count = count_buckets_and_factors(df_project)
+            if chunk_number == 1 and not valid_model(df_model, risk_bucket_count, risk_factor_count):
+                return None
+            if not valid_project_data(df_project, risk_bucket_count, risk_factor_count):
+                print(f"Error: Project data chunk {chunk_number} is not valid.")
+                return None
+
+            chunk_seed = int(seed_sequence.spawn(1)[0].generate_state(1)[0]) if seed_sequence is not None else None
+            portfolio = analyze_portfolio(df_project, risk_bucket_count, risk_factor_count, df_default_rates, df_recovery_potential, engine,
+                                          num_years=num_years, memory_budget_mb=memory_budget_mb, workers=workers, seed=chunk_seed, tolerance=tolerance,
+                                          sampler=sampler, precision=precision)
+            df_project = portfolio.to_dataframe()
+
+            # Keep only the summaries of the chunk
+            chunk_counts = count_overall_ratings(portfolio.overall_rating)
+            rating_counts = chunk_counts if rating_counts is None else rating_counts + chunk_counts
+            chunk_candidates = calculate_top_bottom_candidates(df_project, num_projects, TOP_BOTTOM_COLUMNS)
+            candidates = chunk_candidates if candidates is None else calculate_top_bottom_candidates(
+                pd.concat([candidates, chunk_candidates], ignore_index=True), num_projects, TOP_BOTTOM_COLUMNS)
+            for group_by in GROUP_COLUMNS:
+                summaries = [summarize_group_ratings(df_project, group_by)]
+                if group_summaries[group_by] is not None:
+                    summaries.insert(0, group_summaries[group_by])
+                group_summaries[group_by] = combine_group_summaries(summaries)
+            chunk_volumes = calculate_total_volumes_by_year(df_project)
+            total_volumes_per_year = chunk_volumes if total_volumes_per_year is None else combine_total_volumes_by_year([total_volumes_per_year, chunk_volumes])
+
+            if project_output_file is not None:
+                writer = append_parquet_chunk(writer, project_output_file, df_project)
+
+            num_projects_read += len(df_project)
+            logging.info(f"Processed chunk {chunk_number} of {project_file}: {num_projects_read} projects")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if rating_counts is None:
+        print(f"Error: No projects found in {project_file}.")
+        return None
+
+    df_counts = create_counts_table(rating_counts)
+    top_projects, bottom_projects = calculate_top_bottom_projects(candidates, num_projects, TOP_BOTTOM_COLUMNS)
+    country_table, technology_table, counterparty_table = (create_group_table_from_summary(group_summaries[group_by], group_by) for group_by in GROUP_COLUMNS)
+
+    return df_counts, top_projects, bottom_projects, country_table, technology_table, counterparty_table, total_volumes_per_year